@@ -8,11 +8,107 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     DB_PORT: str
     DATABASE_URL: str
+    # Réplica de lectura opcional (vacío = todo va a DATABASE_URL). Quien
+    # escribió hace menos de READ_YOUR_WRITES_SECONDS sigue leyendo de la primaria
+    READ_REPLICA_URL: str = ""
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+    # Con SQLite: journal WAL (los lectores no bloquean al escritor) y synchronous=NORMAL
+    SQLITE_WAL: bool = True
     
     RABBITMQ_USER: str
     RABBITMQ_PASS: str
     RABBITMQ_PORT: str
     BROKER_URL: str
+
+    # Cola de persistencia: "amqp" (RabbitMQ + worker.py) o "embedded" (cola en el
+    # mismo proceso y escritor por lotes propio: un solo nodo, sin broker ni worker)
+    QUEUE_BACKEND: str = "amqp"
+
+    # Publicador persistente hacia RabbitMQ
+    BROKER_PUBLISH_BUFFER: int = 10000   # mensajes en memoria esperando envío/confirmación
+    BROKER_MAX_IN_FLIGHT: int = 500      # publicados sin confirmar por el broker
+    BROKER_RECONNECT_DELAY: float = 1.0  # segundos; se duplica hasta BROKER_MAX_RECONNECT_DELAY
+    BROKER_MAX_RECONNECT_DELAY: float = 30.0
+
+    # Spool en disco para cuando el broker no está (vacío = desactivado).
+    # Un directorio por proceso; BROKER_SPOOL_FSYNC: "always" | "interval" | "never"
+    BROKER_SPOOL_DIR: str = ""
+    BROKER_SPOOL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    BROKER_SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024
+    BROKER_SPOOL_FSYNC: str = "interval"
+    BROKER_SPOOL_FSYNC_INTERVAL: float = 1.0
+
+    # Fan-out entre nodos de la API: "memory" (un solo proceso) o "amqp" (exchange fanout)
+    BACKPLANE: str = "memory"
+    BACKPLANE_EXCHANGE: str = "chat_events"
+
+    # Cola de salida por socket: "drop_oldest" descarta lo más viejo,
+    # "disconnect" cierra al consumidor lento con WS_OVERFLOW_CLOSE_CODE
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_OVERFLOW_POLICY: str = "drop_oldest"
+    WS_OVERFLOW_CLOSE_CODE: int = 1013   # "Try Again Later"
+    # Límite de mensajes entrantes: token bucket por usuario y por sala (mensajes/s
+    # y ráfaga). Al excederse: "drop" responde un frame de error, "delay" frena
+    # la lectura del socket hasta WS_RATE_LIMIT_MAX_DELAY y "disconnect" lo cierra
+    WS_MAX_MESSAGE_BYTES: int = 4096
+    WS_USER_RATE: float = 5.0
+    WS_USER_BURST: float = 10
+    WS_ROOM_RATE: float = 100.0
+    WS_ROOM_BURST: float = 200
+    WS_RATE_LIMIT_POLICY: str = "drop"
+    WS_RATE_LIMIT_MAX_DELAY: float = 2.0
+    WS_RATE_LIMIT_MAX_KEYS: int = 100000
+    # Ventana en la que se juntan entradas y salidas de una sala antes de anunciarlas:
+    # un corte y reconexión dentro de ella no genera eventos de presencia
+    PRESENCE_DEBOUNCE_SECONDS: float = 3.0
+    # Cada nodo repite su presencia por el backplane con este período; la de
+    # un nodo que no late en 3 períodos se descarta
+    PRESENCE_HEARTBEAT_SECONDS: float = 30.0
+    # Máximo de mensajes que repone /ws?since=; si faltan más, el cliente recarga por REST
+    WS_REPLAY_LIMIT: int = 500
+
+    # Historial reciente en memoria por sala (ring buffer + LRU de salas)
+    HISTORY_CACHE_PER_ROOM: int = 200
+    HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Primera página de GET /rooms/ serializada; los otros nodos la ven vencer por TTL
+    ROOM_LIST_CACHE_TTL: float = 5.0
+
+    # Configuración de PostgreSQL para to_tsvector/websearch_to_tsquery ("simple"
+    # no aplica stemming: sirve para cualquier idioma). Cambiarla obliga a reindexar
+    SEARCH_TS_CONFIG: str = "simple"
+
+    # Particiones mensuales de messages (PostgreSQL) y archivo del historial frío:
+    # los meses más viejos que la retención pasan a NDJSON-gzip en MESSAGE_ARCHIVE_DIR
+    # (vacío = get_history no lee archivo). Ver archive.py
+    MESSAGE_PARTITIONS_AHEAD: int = 2
+    MESSAGE_RETENTION_MONTHS: int = 12
+    MESSAGE_ARCHIVE_DIR: str = ""
+    ARCHIVE_SEGMENT_CACHE: int = 64
+
+    # Cache de tokens verificados, usuarios y membresías
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL: float = 300.0
+    AUTH_CACHE_NEGATIVE_TTL: float = 5.0
+
+    # bcrypt: costo y pool de procesos dedicado (HASH_POOL_WORKERS=0 usa el threadpool)
+    BCRYPT_ROUNDS: int = 12
+    HASH_POOL_WORKERS: int = 2
+    HASH_POOL_MAX_PENDING: int = 64      # más operaciones en curso -> 503
+
+    # Métricas Prometheus: /metrics en la API y un puerto propio en el worker (0 = apagado)
+    METRICS_ENABLED: bool = True
+    WORKER_METRICS_PORT: int = 9100
+
+    # Worker de persistencia (WORKER_BATCH_SIZE=1 vuelve al modo mensaje a mensaje)
+    WORKER_BATCH_SIZE: int = 200
+    WORKER_FLUSH_INTERVAL_MS: int = 200
+    WORKER_PREFETCH: int = 0             # 0 = 2 * WORKER_BATCH_SIZE (* WORKER_PROCESSES)
+    WORKER_PROCESSES: int = 1            # >1: procesos hijos particionados por room_id
+    # Reintentos con backoff exponencial; después de WORKER_MAX_RETRIES va a la DLQ
+    WORKER_MAX_RETRIES: int = 5
+    WORKER_RETRY_BASE_MS: int = 1000
+    WORKER_RETRY_MAX_MS: int = 60000
     
     SECRET_KEY: str = "super_secret_key_change_me"
     ALGORITHM: str = "HS256"
@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine
+import time
+from typing import Optional
+from fastapi import Request, WebSocket
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.services import metrics
 
+# Motor síncrono: create_all y el worker de persistencia
 engine = create_engine(
     settings.DATABASE_URL,
     pool_size=40,       
@@ -11,9 +17,118 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def configure_sqlite(engine):
+    """WAL: el escritor (worker o cola embebida) no bloquea a los lectores de
+    la API. Con WAL, synchronous=NORMAL no corrompe ante un corte de luz;
+    solo puede perder las últimas transacciones confirmadas."""
+    if engine.dialect.name != "sqlite" or not settings.SQLITE_WAL:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+configure_sqlite(engine)
+
+def to_async_url(url: str) -> str:
+    """postgresql:// -> postgresql+asyncpg://, sqlite:// -> sqlite+aiosqlite://"""
+    scheme, rest = url.split("://", 1)
+    driver = scheme.split("+", 1)[0]
+    if driver in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    if driver == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+def create_async_engine_for(url: str, **kwargs):
+    if url.startswith("sqlite"):
+        async_engine = create_async_engine(to_async_url(url), **kwargs)
+        configure_sqlite(async_engine.sync_engine)
+        return async_engine
+    return create_async_engine(to_async_url(url), pool_size=40, max_overflow=10, **kwargs)
+
+# Motor asíncrono: endpoints REST y WebSocket sin bloquear el event loop
+async_engine = create_async_engine_for(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Réplica de lectura opcional para historial, listados y validación del WebSocket
+replica_async_engine = create_async_engine_for(settings.READ_REPLICA_URL) if settings.READ_REPLICA_URL else None
+ReplicaSessionLocal = (
+    async_sessionmaker(replica_async_engine, class_=AsyncSession, expire_on_commit=False)
+    if replica_async_engine is not None else None
+)
+
+class ReadRouter:
+    """Elige a qué base van las lecturas. Sin réplica, todo a la primaria.
+
+    Con réplica, quien escribió hace menos de `window` segundos lee de la
+    primaria para ver su propia escritura (sala recién creada, join recién
+    hecho). Las marcas son por nodo: con varios nodos hace falta afinidad de
+    sesión o aceptar ese retraso en el resto.
+    """
+
+    def __init__(self, primary: async_sessionmaker, replica: Optional[async_sessionmaker], window: float, maxsize: int = 100000):
+        self.primary = primary
+        self.replica = replica
+        self.window = window
+        self.maxsize = maxsize
+        self._recent: dict[str, float] = {}  # username -> hasta cuándo va a la primaria
+
+    def mark_write(self, username: Optional[str]):
+        if self.replica is None or not username or self.window <= 0:
+            return
+        now = time.monotonic()
+        self._recent.pop(username, None)
+        self._recent[username] = now + self.window
+        if len(self._recent) > self.maxsize:
+            self._recent = {u: t for u, t in self._recent.items() if t > now}
+            while len(self._recent) > self.maxsize:
+                del self._recent[next(iter(self._recent))]
+
+    def sessionmaker_for(self, username: Optional[str] = None) -> async_sessionmaker:
+        if self.replica is None or (username and self._recent.get(username, 0) > time.monotonic()):
+            metrics.db_read_sessions.inc(1, ("primary",))
+            return self.primary
+        metrics.db_read_sessions.inc(1, ("replica",))
+        return self.replica
+
+    def clear(self):
+        self._recent.clear()
+
+read_router = ReadRouter(AsyncSessionLocal, ReplicaSessionLocal, settings.READ_YOUR_WRITES_SECONDS)
+
+def request_username(connection) -> Optional[str]:
+    """Usuario del token (Authorization o ?token= del WebSocket), sin ir a la DB."""
+    from app.core.security import decode_token
+
+    auth = connection.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else connection.query_params.get("token")
+    return decode_token(token) if token else None
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_async_sessionmaker():
+    """Para handlers de larga vida (WebSocket): piden una sesión solo mientras
+    dura cada consulta en lugar de retener una conexión del pool."""
+    return AsyncSessionLocal
+
+async def get_read_db(request: Request):
+    """Sesión para endpoints de solo lectura (ver ReadRouter)."""
+    async with read_router.sessionmaker_for(request_username(request))() as db:
+        yield db
+
+def get_read_sessionmaker(websocket: WebSocket):
+    """Como get_async_sessionmaker, pero ruteado como las lecturas."""
+    return read_router.sessionmaker_for(request_username(websocket))
@@ -0,0 +1,27 @@
+# backend/app/core/pagination.py
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+
+def encode_cursor(created_at: datetime, message_id: int) -> str:
+    """Cursor opaco con la posición (created_at, id) de un mensaje."""
+    raw = f"{created_at.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_name_cursor(name: str) -> str:
+    """Cursor opaco para listados ordenados por nombre (único)."""
+    return base64.urlsafe_b64encode(name.encode()).decode().rstrip("=")
+
+def decode_name_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -1,15 +1,24 @@
 # backend/app/main.py
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.database import engine, Base
-from app.routers import chat, auth, rooms
+from app.core.database import engine, Base, read_router
+from app.routers import chat, auth, rooms, metrics, search
+from app.routers.chat import ConnectionManager
+from app.services.backplane import Backplane, create_backplane
+from app.services import auth_cache
+from app.services.room_directory import room_directory
+from app.services import broker
+from app.services.hashing import hasher
+from app.services.history_cache import HistoryCache
+from app.services.rate_limit import InboundLimiter
+from app.services.metrics import MetricsMiddleware
+from app.core.config import settings
 
 # Crear tablas
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Realtime Chat App")
-
 origins = [
     "http://localhost:3000",      # Frontend en Docker (puerto mapeado)
     "http://localhost:5173",      # Frontend en desarrollo local (Vite default)
@@ -17,18 +26,52 @@ origins = [
     "http://127.0.0.1:5173",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(auth.router)
-app.include_router(rooms.router)
-app.include_router(chat.router)
-
-@app.get("/")
-def read_root():
-    return {"status": "System Operational", "service": "Chat Backend"}
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Una sola conexión a RabbitMQ (o la cola embebida) durante toda la vida del proceso
+    broker.publisher.start()
+    hasher.start()
+    app.state.history_cache.clear()
+    app.state.inbound_limiter.clear()
+    auth_cache.clear_all()
+    read_router.clear()
+    room_directory.invalidate()
+    await app.state.manager.start()
+    yield
+    await app.state.manager.stop()
+    hasher.stop()
+    await broker.publisher.close()
+
+def create_app(backplane: Backplane = None) -> FastAPI:
+    """Crea una instancia de la app. Cada instancia es un nodo con sus propios
+    sockets; el backplane los conecta con los demás nodos."""
+    app = FastAPI(title="Realtime Chat App", lifespan=lifespan)
+    app.state.history_cache = HistoryCache(settings.HISTORY_CACHE_PER_ROOM, settings.HISTORY_CACHE_MAX_BYTES)
+    app.state.inbound_limiter = InboundLimiter.from_settings()
+    app.state.manager = ConnectionManager(backplane or create_backplane(), history=app.state.history_cache)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    if settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
+    app.include_router(auth.router)
+    app.include_router(rooms.router)
+    app.include_router(chat.router)
+    app.include_router(search.router)
+    if settings.METRICS_ENABLED:
+        app.include_router(metrics.router)
+
+    @app.get("/")
+    def read_root():
+        return {"status": "System Operational", "service": "Chat Backend"}
+
+    return app
+
+app = create_app()
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import BigInteger, Column, DDL, Integer, String, Boolean, ForeignKey, DateTime, Text, Index, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -25,6 +27,51 @@ class Message(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     content = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Asignado al recibir el mensaje; los reenvíos del broker chocan contra el UNIQUE
+    # (en PostgreSQL incluye created_at, que viaja en el payload: la tabla está
+    # particionada por mes y todo UNIQUE tiene que contener la clave de partición)
+    message_id = Column(String(36), nullable=True)
+    # Secuencia por sala asignada al difundir (ver ConnectionManager.next_seq)
+    seq = Column(BigInteger, nullable=True)
+    # Lo calcula el worker en el mismo INSERT; en SQLite queda vacío (se usa messages_fts)
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+
+    # Índice del historial paginable (ver database/init.sql). El id desempata
+    # mensajes con el mismo created_at en la paginación por cursor.
+    __table_args__ = (
+        Index("idx_messages_room_created", room_id, created_at.desc(), id.desc()),
+        Index("idx_messages_room_seq", room_id, seq),
+        Index("uq_messages_message_id", message_id, unique=True).ddl_if(dialect="sqlite"),
+        Index("uq_messages_message_id_created", message_id, created_at, unique=True).ddl_if(dialect="postgresql"),
+    )
+
+# Búsqueda de texto (ver app/services/search.py): en PostgreSQL, índice GIN
+# sobre search_vector; en SQLite, tabla FTS5 de contenido externo
+event.listen(Message.__table__, "after_create", DDL(
+    "CREATE INDEX idx_messages_search ON messages USING GIN (search_vector)"
+).execute_if(dialect="postgresql"))
+event.listen(Message.__table__, "after_create", DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id')"
+).execute_if(dialect="sqlite"))
+event.listen(Message.__table__, "before_drop", DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"))
+
+class MessageArchive(Base):
+    """Segmento NDJSON-gzip con los mensajes archivados de una sala en un mes
+    (ver app/services/archive.py). `path` es relativo a MESSAGE_ARCHIVE_DIR."""
+    __tablename__ = "message_archives"
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, nullable=False)
+    month = Column(String(7), nullable=False)  # "2025-01"
+    path = Column(String, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    oldest_at = Column(DateTime(timezone=True), nullable=False)
+    newest_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("uq_message_archives_room_month", room_id, month, unique=True),
+        Index("idx_message_archives_room_newest", room_id, newest_at.desc()),
+    )
 
 class RoomMember(Base):
     __tablename__ = "room_members"
@@ -32,4 +79,14 @@ class RoomMember(Base):
     room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     role = Column(String, default="member") # 'admin' o 'member'
-    joined_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    joined_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Valor de RoomCounter.message_count la última vez que el usuario marcó la
+    # sala como leída: no leídos = message_count - last_read, sin COUNT(*)
+    last_read = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+class RoomCounter(Base):
+    """Mensajes persistidos por sala. Lo incrementa insert_messages en la misma
+    transacción que el INSERT, solo por las filas que efectivamente entraron."""
+    __tablename__ = "room_counters"
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    message_count = Column(BigInteger, nullable=False, default=0, server_default="0")
\ No newline at end of file
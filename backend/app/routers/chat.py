@@ -1,132 +1,636 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.core.database import get_db
-from app.models.models import Message, User, RoomMember 
+import json
+import time
+import uuid
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, HTTPException, Request, Response
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import Optional
+from app.core.database import get_async_sessionmaker, get_read_db, get_read_sessionmaker, read_router
+from app.core.pagination import encode_cursor, decode_cursor
+from app.models.models import Message, User, RoomCounter, RoomMember 
+from app.services.archive import read_archived
 from app.services.broker import publish_message
-from app.core.security import settings
-from jose import jwt, JWTError
+from app.services.backplane import Backplane
+from app.services.history_cache import HistoryCache
+from app.services.presence import PresenceIndex
+from app.services.rate_limit import InboundLimiter
+from app.core.security import settings, decode_token, get_current_user
+from app.services.auth_cache import is_member, lookup_user
+from app.services import metrics
+
+try:
+    import orjson
+except ImportError:  # opcional: si no está instalado usamos json de la stdlib
+    orjson = None
 
 router = APIRouter(tags=["Chat"])
 
-async def get_user_from_token(token: str, db: Session):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        user = db.query(User).filter(User.username == username).first()
-        return user
-    except JWTError:
+async def get_user_from_token(token: str, db: AsyncSession):
+    username = decode_token(token)
+    if username is None:
         return None
+    return await lookup_user(db, username)
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# Espacio de nombres para derivar ids a partir del id que manda el cliente
+MESSAGE_ID_NAMESPACE = uuid.UUID("5b0c3f52-1f1e-4a55-9d1f-3c8a2a0d7e41")
+
+def new_message_id(user_id: int, client_message_id: Optional[str] = None) -> str:
+    """Id único del mensaje, asignado al recibirlo. Si el cliente manda el suyo
+    (para reenviar sin duplicar), se combina con el usuario: un cliente no
+    puede pisar mensajes de otro."""
+    if client_message_id:
+        return str(uuid.uuid5(MESSAGE_ID_NAMESPACE, f"{user_id}:{client_message_id}"))
+    return str(uuid.uuid4())
+
+def parse_client_frame(data: str, json_frames: bool) -> tuple[str, Optional[str], Optional[str]]:
+    """(tipo, contenido, id del cliente).
+
+    Con `json_frames` (/ws?frames=json) cada texto es un frame:
+    {"type": "message", "content": "...", "message_id": "..."} o {"type": "read"},
+    y cualquier otra cosa es ("invalid", None, None). Sin él (clientes viejos)
+    el texto es siempre el contenido del mensaje, tal cual: lo que escribe el
+    usuario nunca se interpreta como frame."""
+    if not json_frames:
+        return "message", data, None
+    try:
+        frame = json.loads(data)
+    except ValueError:
+        frame = None
+    if isinstance(frame, dict) and frame.get("type") == "read":
+        return "read", None, None
+    if isinstance(frame, dict) and frame.get("type") == "message" and isinstance(frame.get("content"), str):
+        client_id = frame.get("message_id")
+        if not isinstance(client_id, str) or len(client_id) > 64:
+            client_id = None
+        return "message", frame["content"], client_id
+    return "invalid", None, None
+
+# Eventos de la sala que no son mensajes: sin seq, sin historial y sin persistir
+EVENT_TYPES = ("system", "presence")
+# Estado de presencia entre nodos por el backplane; nunca llega a los sockets
+PRESENCE_SYNC_TYPES = ("presence_state", "presence_query", "presence_gone")
+
+def history_entry(message: dict) -> dict:
+    """Un mensaje difundido con la forma de una fila de GET /rooms/{id}/messages.
+    'id' es None hasta que el worker lo persiste."""
+    return {
+        "id": message.get("id"),
+        "message_id": message.get("message_id"),
+        "content": message["content"],
+        "user_id": message["user_id"],
+        "username": message["username"],
+        "created_at": message["created_at"],
+        "seq": message.get("seq"),
+    }
+
+def message_row(msg: Message, username: str) -> dict:
+    return {
+        "id": msg.id,
+        "message_id": msg.message_id,
+        "content": msg.content,
+        "user_id": msg.user_id,
+        "username": username,
+        "created_at": msg.created_at.isoformat() if msg.created_at else now_iso(),
+        "seq": msg.seq,
+    }
+
+def encode_frame(message: dict) -> str:
+    """Serializa un evento una sola vez para enviarlo tal cual a todos los sockets."""
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"))
+
+class ClientConnection:
+    """Socket con su propia cola de salida acotada y una tarea escritora.
+
+    Quien hace broadcast solo encola; un cliente lento llena su cola sin frenar
+    a los demás. Al desbordarse se aplica la política configurada:
+    'drop_oldest' descarta el mensaje más viejo y 'disconnect' cierra el socket.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, overflow_policy: str, close_code: int, paused: bool = False):
+        self.websocket = websocket
+        self.overflow_policy = overflow_policy
+        self.close_code = close_code
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.closed = False
+        # Pausado mientras se repone lo perdido: lo que llega en vivo se encola
+        self._live = asyncio.Event()
+        if not paused:
+            self._live.set()
+        self._replayed: Optional[set] = None
+        self.user: Optional[tuple[int, str]] = None  # (user_id, username) para la presencia
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: str, message_id: Optional[str] = None) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((message_id, frame))
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.overflow_policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait((message_id, frame))
+            self.dropped += 1
+            metrics.ws_frames_dropped.inc()
+            return True
+        self.evict()
+        return False
+
+    def evict(self):
+        """Cierra un consumidor lento; el bucle de recepción verá la desconexión."""
+        self.close()
+        asyncio.create_task(self._close_socket())
+
+    def close(self):
+        self.closed = True
+        self.writer.cancel()
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=self.close_code, reason="Slow consumer")
+        except Exception:
+            pass
+
+    async def replay(self, frames: list[tuple[Optional[str], str]]):
+        """Envía lo perdido y recién después libera la entrega en vivo. Lo que
+        se encoló mientras tanto y ya vino en la reposición se descarta."""
+        try:
+            for _, frame in frames:
+                await self.websocket.send_text(frame)
+        except Exception:
+            self.closed = True  # igual que en _write_loop: la limpieza es del endpoint
+            return
+        self._replayed = {message_id for message_id, _ in frames if message_id}
+        self._live.set()
+
+    async def _write_loop(self):
+        try:
+            await self._live.wait()
+            while True:
+                message_id, frame = await self.queue.get()
+                if self._replayed:
+                    if message_id in self._replayed:
+                        continue
+                    if self.queue.empty():
+                        self._replayed = None  # ya pasó todo lo encolado durante la reposición
+                await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # El socket se cerró: dejamos de escribir, el endpoint hace la limpieza
+            self.closed = True
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[int, List[WebSocket]] = {}
+    """Sockets locales del nodo. Los eventos de sala también se publican en el
+    backplane para que los demás nodos los entreguen a sus propios sockets."""
+
+    def __init__(
+        self,
+        backplane: Backplane = None,
+        history: HistoryCache = None,
+        send_queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        overflow_policy: str = settings.WS_OVERFLOW_POLICY,
+        overflow_close_code: int = settings.WS_OVERFLOW_CLOSE_CODE,
+        presence_debounce: float = settings.PRESENCE_DEBOUNCE_SECONDS,
+        presence_heartbeat: float = settings.PRESENCE_HEARTBEAT_SECONDS,
+    ):
+        if overflow_policy not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Política de desborde desconocida: {overflow_policy}")
+        self.active_connections: dict[int, dict[WebSocket, ClientConnection]] = {}
+        self.backplane = backplane
+        self.history = history
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
+        self.overflow_close_code = overflow_close_code
+        self.evicted = 0
+        self._last_seq: dict[int, int] = {}
+        self.presence = PresenceIndex()
+        self.presence_debounce = presence_debounce
+        self._presence_timers: dict[int, asyncio.TimerHandle] = {}
+        self._presence_tasks: set[asyncio.Task] = set()
+        self.presence_heartbeat = presence_heartbeat
+        self._presence_published: dict[int, dict[int, str]] = {}
+        self._presence_heartbeat_task: Optional[asyncio.Task] = None
+
+    def next_seq(self, room_id: int) -> int:
+        """Secuencia del próximo mensaje de la sala: reloj lógico híbrido en
+        microsegundos. Crece siempre dentro de la sala, sobrevive reinicios
+        del nodo sin estado compartido y, como cada nodo incorpora lo que
+        recibe por el backplane, queda ordenada entre nodos salvo desfasajes
+        de reloj. No es densa: los clientes comparan, no cuentan."""
+        seq = max(self._last_seq.get(room_id, 0) + 1, time.time_ns() // 1000)
+        self._last_seq[room_id] = seq
+        return seq
+
+    async def start(self):
+        if self.backplane:
+            await self.backplane.start(self.deliver)
+            self._presence_heartbeat_task = asyncio.create_task(self._presence_heartbeat_loop())
+            # Los demás nodos contestan con su presencia sin esperar al próximo latido
+            await self.backplane.publish(0, {"type": "presence_query"})
+
+    async def stop(self):
+        for timer in self._presence_timers.values():
+            timer.cancel()
+        self._presence_timers.clear()
+        if self._presence_heartbeat_task:
+            self._presence_heartbeat_task.cancel()
+            self._presence_heartbeat_task = None
+        self.presence.clear()
+        self._presence_published.clear()
+        if self.backplane:
+            await self.backplane.publish(0, {"type": "presence_gone", "node": self.backplane.node_id})
+            await self.backplane.stop()
 
-    async def connect(self, websocket: WebSocket, room_id: int):
+    async def connect(
+        self, websocket: WebSocket, room_id: int, paused: bool = False, user_id: int = None, username: str = None,
+    ) -> ClientConnection:
         await websocket.accept()
         if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
+            self.active_connections[room_id] = {}
+        connection = ClientConnection(
+            websocket, self.send_queue_size, self.overflow_policy, self.overflow_close_code, paused
+        )
+        self.active_connections[room_id][websocket] = connection
+        if user_id is not None:
+            connection.user = (user_id, username)
+            self.presence.join(room_id, user_id, username)
+            self._presence_changed(room_id)
+        return connection
 
     def disconnect(self, websocket: WebSocket, room_id: int):
-        if room_id in self.active_connections:
-            if websocket in self.active_connections[room_id]:
-                self.active_connections[room_id].remove(websocket)
+        # Idempotente: el endpoint y el fan-out (consumidor lento) pueden llegar los dos
+        connection = self.active_connections.get(room_id, {}).pop(websocket, None)
+        if connection:
+            connection.close()
+            if connection.user:
+                self.presence.leave(room_id, connection.user[0])
+                self._presence_changed(room_id)
+        if room_id in self.active_connections and not self.active_connections[room_id]:
+            del self.active_connections[room_id]
+
+    def _presence_changed(self, room_id: int, delay: Optional[float] = None):
+        # Un solo anuncio pendiente por sala: lo que cambie mientras tanto entra en el mismo
+        if room_id not in self._presence_timers:
+            self._presence_timers[room_id] = asyncio.get_running_loop().call_later(
+                self.presence_debounce if delay is None else delay, self._presence_due, room_id)
+
+    def _presence_due(self, room_id: int):
+        self._presence_timers.pop(room_id, None)
+        if self.backplane:
+            self._spawn_presence(self._publish_presence(room_id))
+        joined, left = self.presence.diff(room_id)
+        if not joined and not left:
+            metrics.presence_events.inc(1, ("suppressed",))
+            return
+        metrics.presence_events.inc(1, ("sent",))
+        # Solo a los sockets locales: cada nodo anuncia a los suyos desde la
+        # presencia combinada, así que no se reenvía por el backplane
+        self._spawn_presence(self.deliver(room_id, {
+            "type": "presence",
+            "room_id": room_id,
+            "joined": joined,
+            "left": left,
+            "online": len(self.presence.online(room_id)),
+            "created_at": now_iso(),
+        }))
+
+    def _spawn_presence(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._presence_tasks.add(task)
+        task.add_done_callback(self._presence_tasks.discard)
+
+    async def _publish_presence(self, room_id: int, force: bool = False):
+        """Publica la foto local de la sala si cambió desde la última (o siempre, con `force`)."""
+        members = self.presence.local(room_id)
+        if not force and self._presence_published.get(room_id, {}) == members:
+            return
+        if members:
+            self._presence_published[room_id] = members
+        else:
+            self._presence_published.pop(room_id, None)
+        await self.backplane.publish(room_id, {
+            "type": "presence_state",
+            "node": self.backplane.node_id,
+            "members": [[user_id, username] for user_id, username in members.items()],
+        })
+
+    async def _presence_heartbeat_loop(self):
+        # Renueva la foto de cada sala en los demás nodos y olvida las de los
+        # nodos que dejaron de latir (caídos sin mandar "presence_gone")
+        while True:
+            await asyncio.sleep(self.presence_heartbeat)
+            for room_id in self.presence.local_rooms():
+                await self._publish_presence(room_id, force=True)
+            for room_id in self.presence.expire(time.monotonic() - 3 * self.presence_heartbeat):
+                self._presence_changed(room_id, delay=0)
+
+    async def _on_presence_sync(self, room_id: int, message: dict):
+        kind = message["type"]
+        if kind == "presence_query":
+            for local_room in self.presence.local_rooms():
+                await self._publish_presence(local_room, force=True)
+        elif kind == "presence_gone":
+            for affected in self.presence.drop_node(message["node"]):
+                self._presence_changed(affected, delay=0)
+        else:
+            members = {user_id: username for user_id, username in message["members"]}
+            self.presence.apply_remote(room_id, message["node"], members, time.monotonic())
+            # El nodo de origen ya juntó sus cambios: se anuncia sin otra ventana
+            self._presence_changed(room_id, delay=0)
 
     async def broadcast(self, message: dict, room_id: int):
-        if room_id in self.active_connections:
-            for connection in self.active_connections[room_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    pass
+        if message.get("type") not in EVENT_TYPES:
+            message["seq"] = self.next_seq(room_id)
+        await self.deliver(room_id, message)
+        if self.backplane:
+            await self.backplane.publish(room_id, message)
 
-manager = ConnectionManager()
+    async def deliver(self, room_id: int, message: dict):
+        """Encola para los sockets conectados a este nodo, sin esperar a ninguno."""
+        if message.get("type") in PRESENCE_SYNC_TYPES:
+            await self._on_presence_sync(room_id, message)
+            return
+        seq = message.get("seq")
+        if seq and seq > self._last_seq.get(room_id, 0):
+            self._last_seq[room_id] = seq
+        if self.history and message.get("type") not in EVENT_TYPES:
+            self.history.append(room_id, history_entry(message))
+        room = self.active_connections.get(room_id)
+        if not room:
+            return
+        start = time.perf_counter()
+        frame = encode_frame(message)
+        recipients = 0
+        for websocket, connection in list(room.items()):
+            if connection.closed:
+                self.disconnect(websocket, room_id)
+            elif not connection.enqueue(frame, message.get("message_id")):
+                self.evicted += 1
+                self.disconnect(websocket, room_id)
+            else:
+                recipients += 1
+        metrics.broadcast_fanout_seconds.observe(time.perf_counter() - start)
+        metrics.broadcast_recipients.observe(recipients)
 
 # --- Endpoints REST ---
 
 @router.get("/rooms/{room_id}/messages")
-def get_history(room_id: int, limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
+async def get_history(
+    room_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = 0,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Historial de la sala, del más nuevo al más viejo.
+
+    Con `before`/`after` (cursor de X-Next-Cursor) se pagina por keyset sobre
+    idx_messages_room_created: el costo no crece con la profundidad y las
+    páginas no se corren cuando llegan mensajes nuevos. `offset` se mantiene
+    por compatibilidad. La página más reciente sale del cache en memoria
+    cuando la sala está caliente.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
+    cache: HistoryCache = request.app.state.history_cache
+    latest_page = not before and not after and offset == 0
+    if latest_page:
+        cached = cache.get(room_id, limit)
+        if cached is not None:
+            if len(cached) == limit:
+                oldest = cached[-1]
+                # Sin id todavía: el 0 hace que el cursor pida lo estrictamente anterior
+                response.headers["X-Next-Cursor"] = encode_cursor(datetime.fromisoformat(oldest["created_at"]), oldest["id"] or 0)
+            return cached
+        cache.begin_warm(room_id)
+
     # Join con User para obtener el nombre del usuario
-    results = db.query(Message, User.username)\
-                .join(User, Message.user_id == User.id)\
-                .filter(Message.room_id == room_id)\
-                .order_by(Message.created_at.desc())\
-                .offset(offset).limit(limit).all()
-    
+    query = select(Message, User.username)\
+        .join(User, Message.user_id == User.id)\
+        .filter(Message.room_id == room_id)
+    position = tuple_(Message.created_at, Message.id)
+
+    if after:
+        # Hacia adelante: los más cercanos al cursor primero, luego se invierte
+        query = query.filter(position > tuple_(*decode_cursor(after)))\
+            .order_by(Message.created_at.asc(), Message.id.asc()).limit(limit)
+        with metrics.db_query_seconds.time(("history",)):
+            results = list(await db.execute(query))[::-1]
+    else:
+        if before:
+            query = query.filter(position < tuple_(*decode_cursor(before)))
+        else:
+            query = query.offset(offset)
+        query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+        with metrics.db_query_seconds.time(("history",)):
+            results = list(await db.execute(query))
+
     # Formatear respuesta
-    history = []
-    for msg, uname in results:
-        history.append({
-            "id": msg.id,
-            "content": msg.content,
-            "user_id": msg.user_id,
-            "username": uname,
-            "created_at": msg.created_at.isoformat() if msg.created_at else str(datetime.now())
-        })
+    history = [message_row(msg, uname) for msg, uname in results]
+
+    if not after and not offset and len(history) < limit:
+        # Se terminó lo que está en la DB: la página sigue en los segmentos archivados
+        if results:
+            edge, _ = results[-1]
+            position = (edge.created_at, edge.id)
+        else:
+            position = decode_cursor(before) if before else None
+        with metrics.db_query_seconds.time(("history_archive",)):
+            history += await read_archived(db, room_id, limit - len(history), position)
+
+    # Cursor para seguir en la misma dirección, solo si la página vino llena
+    if len(history) == limit:
+        edge = history[0] if after else history[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(datetime.fromisoformat(edge["created_at"]), edge["id"])
+    if latest_page:
+        cache.seed(room_id, history, complete=len(history) < limit)
     return history
 
+@router.get("/rooms/{room_id}/online")
+async def get_online_members(
+    room_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    username: str = Depends(get_current_user),
+):
+    """Miembros conectados a la sala en cualquier nodo, del índice de presencia
+    en memoria. Los cambios posteriores llegan por el WebSocket como eventos
+    "presence"."""
+    user = await lookup_user(db, username)
+    if user is None or not await is_member(db, room_id, user.id):
+        raise HTTPException(status_code=403, detail="Not a member")
+    online = request.app.state.manager.presence.online(room_id)
+    return {"room_id": room_id, "count": len(online), "members": online}
+
+async def missed_messages(db: AsyncSession, cache: Optional[HistoryCache], room_id: int, since: int, limit: int) -> list[dict]:
+    """Mensajes de la sala con seq > `since`, del más viejo al más nuevo.
+
+    Si el ring buffer cubre el hueco no se toca la DB. Si no, se lee por
+    idx_messages_room_seq y se suma lo que el buffer tiene y el worker todavía
+    no persistió. Devuelve hasta `limit + 1` para que el llamador sepa si cortó.
+    """
+    cached, covered = cache.since(room_id, since) if cache else ([], False)
+    if covered:
+        return cached[:limit + 1]
+    query = select(Message, User.username)\
+        .join(User, Message.user_id == User.id)\
+        .filter(Message.room_id == room_id, Message.seq > since)\
+        .order_by(Message.seq.asc()).limit(limit + 1)
+    with metrics.db_query_seconds.time(("replay",)):
+        rows = [message_row(msg, uname) for msg, uname in await db.execute(query)]
+    known = {row["message_id"] for row in rows}
+    rows.extend(e for e in cached if e.get("message_id") not in known)
+    rows.sort(key=lambda e: e["seq"])
+    return rows[:limit + 1]
+
 # --- WebSocket ---
 
+async def reject_inbound(websocket: WebSocket, connection: ClientConnection, limiter: InboundLimiter, reason: str, error: dict):
+    """Mensaje entrante fuera de límite. Con 'disconnect' se cierra el socket
+    (1009 por tamaño, 1008 por tasa); si no, se descarta y se avisa solo a
+    quien lo mandó, por su propia cola para no competir con el escritor."""
+    if limiter.policy == "disconnect":
+        metrics.ws_messages_limited.inc(1, (reason, "disconnect"))
+        code = 1009 if reason == "size" else 1008
+        await websocket.close(code=code, reason="Message too big" if reason == "size" else "Rate limit exceeded")
+        raise WebSocketDisconnect(code)
+    metrics.ws_messages_limited.inc(1, (reason, "drop"))
+    connection.enqueue(encode_frame({"type": "error", **error}))
+
+async def mark_read(session_factory: async_sessionmaker, room_id: int, user_id: int) -> int:
+    """Lleva la marca del miembro al contador actual de la sala y la devuelve.
+    Lo que todavía no persistió el worker no entra: aparece como no leído
+    hasta el próximo "read"."""
+    current_count = select(RoomCounter.message_count).filter(RoomCounter.room_id == room_id).scalar_subquery()
+    statement = update(RoomMember)\
+        .filter(RoomMember.room_id == room_id, RoomMember.user_id == user_id)\
+        .values(last_read=func.coalesce(current_count, RoomMember.last_read))\
+        .returning(RoomMember.last_read)\
+        .execution_options(synchronize_session=False)
+    async with session_factory() as db:
+        with metrics.db_query_seconds.time(("mark_read",)):
+            last_read = (await db.execute(statement)).scalar()
+        await db.commit()
+    return last_read or 0
+
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     room_id: int, 
     token: str = Query(...), 
-    db: Session = Depends(get_db)
+    since: Optional[int] = Query(None, ge=0),
+    frames: str = Query("text", pattern="^(text|json)$"),
+    session_factory: async_sessionmaker = Depends(get_read_sessionmaker),
+    write_session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
 ):
-    # 1. Validar Usuario
-    user = await get_user_from_token(token, db)
+    # La conexión a la DB se toma solo para validar y se devuelve al pool
+    # antes de entrar al bucle del socket
+    async with session_factory() as db:
+        # 1. Validar Usuario
+        user = await get_user_from_token(token, db)
+        # 2. Validar Membresía (Seguridad)
+        member = await is_member(db, room_id, user.id) if user else False
+
     if not user:
         await websocket.close(code=1008, reason="Invalid Token") 
         return
 
-    # 2. Validar Membresía (Seguridad)
-    member = db.query(RoomMember).filter_by(room_id=room_id, user_id=user.id).first()
     if not member:
         await websocket.close(code=1008, reason="Not a member")
         return
 
-    await manager.connect(websocket, room_id)
-    
-    # Notificar entrada
-    join_msg = {
-        "type": "system", 
-        "content": f"{user.username} joined", 
-        "username": "System",
-        "created_at": str(datetime.now()) 
-    }
-    await manager.broadcast(join_msg, room_id)
-
+    manager = websocket.app.state.manager
+    limiter = websocket.app.state.inbound_limiter
+    # Se registra antes de leer lo perdido: lo que llegue mientras tanto queda
+    # en la cola y no se pierde en el hueco entre reposición y vivo
+    connection = await manager.connect(websocket, room_id, paused=since is not None, user_id=user.id, username=user.username)
+    # La entrada (y la salida) se anuncian como evento de presencia, agrupado y con
+    # debounce. Pase lo que pase de acá en adelante, el socket sale del manager:
+    # si no, el usuario queda "en línea" para siempre en todos los nodos
     try:
+        if since is not None:
+            limit = settings.WS_REPLAY_LIMIT
+            async with session_factory() as db:
+                missed = await missed_messages(db, manager.history, room_id, since, limit)
+            frames = [(m.get("message_id"), encode_frame({**m, "room_id": room_id})) for m in missed[:limit]]
+            # Con 'truncated' el cliente sabe que le faltan mensajes y recarga por REST
+            frames.append((None, encode_frame({
+                "type": "sync", "since": since, "replayed": len(frames), "truncated": len(missed) > limit,
+            })))
+            await connection.replay(frames)
+
         while True:
-            data = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame.get("text")
+            if data is None:
+                await websocket.close(code=1003, reason="Text frames only")
+                break
+            if limiter.too_large(data):
+                await reject_inbound(websocket, connection, limiter, "size", {
+                    "code": "message_too_large", "max_bytes": limiter.max_message_bytes,
+                })
+                continue
+            wait, scope = limiter.check(user.id, room_id)
+            if wait and limiter.policy == "delay":
+                # No se lee el socket mientras tanto: el cliente siente la contrapresión
+                delayed_by = scope
+                while wait and wait <= limiter.max_delay:
+                    await asyncio.sleep(wait)
+                    wait, scope = limiter.check(user.id, room_id)
+                if not wait:
+                    metrics.ws_messages_limited.inc(1, (delayed_by, "delay"))
+            if wait:
+                await reject_inbound(websocket, connection, limiter, scope, {
+                    "code": "rate_limited", "retry_after": round(wait, 3),
+                })
+                continue
+            kind, content, client_message_id = parse_client_frame(data, frames == "json")
+            if kind == "invalid":
+                connection.enqueue(encode_frame({"type": "error", "code": "invalid_frame"}))
+                continue
+            if kind == "read":
+                # Solo a quien lo mandó: confirma la marca con la que contará /rooms/unread
+                last_read = await mark_read(write_session_factory, room_id, user.id)
+                read_router.mark_write(user.username)
+                connection.enqueue(encode_frame({"type": "read", "room_id": room_id, "last_read": last_read}))
+                continue
             
             message_payload = {
+                "message_id": new_message_id(user.id, client_message_id),
                 "room_id": room_id,
                 "user_id": user.id,
                 "username": user.username,
-                "content": data,
-                "created_at": str(datetime.now())
+                "content": content,
+                "created_at": now_iso()
             }
+            if client_message_id:
+                # Con el eco, el cliente sabe que ya no tiene que reenviarlo
+                message_payload["client_message_id"] = client_message_id
             
             # 1. Enviar a clientes conectados
             await manager.broadcast(message_payload, room_id)
             
-            # 2. Enviar a RabbitMQ (Durabilidad) en un hilo aparte para no bloquear
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, publish_message, message_payload)
+            # 2. Enviar a RabbitMQ (Durabilidad): solo se encola, el publicador
+            #    persistente lo envía desde su propio hilo
+            publish_message(message_payload)
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket, room_id)
-        leave_msg = {
-            "type": "system", 
-            "content": f"{user.username} left", 
-            "username": "System",
-            "created_at": str(datetime.now())
-        }
-        await manager.broadcast(leave_msg, room_id)
\ No newline at end of file
+        pass
+    finally:
+        manager.disconnect(websocket, room_id)
\ No newline at end of file
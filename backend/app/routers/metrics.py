@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from app.services import auth_cache, broker
+from app.services.hashing import hasher
+from app.services.room_directory import room_directory
+from app.services.metrics import CONTENT_TYPE, Counter, Gauge, registry
+
+router = APIRouter(tags=["Metrics"])
+
+
+def _node_metrics(app):
+    """Métricas leídas del estado del nodo en el momento del scrape."""
+    manager = app.state.manager
+    sockets = Gauge("chat_ws_connections", "Sockets abiertos por sala en este nodo", ("room_id",))
+    queued = Gauge("chat_ws_send_queue_frames", "Frames esperando en las colas de salida")
+    evicted = Counter("chat_ws_slow_consumers_evicted_total", "Consumidores lentos desconectados")
+    total_queued = 0
+    for room_id, room in list(manager.active_connections.items()):
+        sockets.set(len(room), (str(room_id),))
+        total_queued += sum(c.queue.qsize() for c in list(room.values()))
+    queued.set(total_queued)
+    evicted.inc(manager.evicted)
+    metrics = [sockets, queued, evicted]
+
+    stats = getattr(broker.publisher, "stats", None)
+    if stats is not None:
+        published = Counter("chat_broker_messages_total", "Mensajes del publicador por resultado", ("result",))
+        for result, value in stats.items():
+            published.inc(value, (result,))
+        pending = Gauge("chat_broker_pending_messages", "Mensajes en el buffer o sin confirmar")
+        pending.set(broker.publisher.pending())
+        spool = Gauge("chat_broker_spool_bytes", "Tamaño del spool en disco del publicador")
+        spool.set(broker.publisher.spool_bytes)
+        metrics += [published, pending, spool]
+
+    history = app.state.history_cache.stats()
+    cache_requests = Counter("chat_cache_requests_total", "Consultas a caches en memoria", ("cache", "result"))
+    cache_requests.inc(history["hits"], ("history", "hit"))
+    cache_requests.inc(history["misses"], ("history", "miss"))
+    for name, cache_stats in {**auth_cache.stats(), "rooms": room_directory.stats()}.items():
+        cache_requests.inc(cache_stats["hits"], (name, "hit"))
+        cache_requests.inc(cache_stats["misses"], (name, "miss"))
+    history_bytes = Gauge("chat_history_cache_bytes", "Memoria estimada del cache de historial")
+    history_bytes.set(history["bytes"])
+
+    rejected = Counter("chat_hash_rejected_total", "Operaciones de bcrypt rechazadas con 503")
+    rejected.inc(hasher.rejected)
+
+    limiter = app.state.inbound_limiter
+    buckets = Gauge("chat_rate_limit_buckets", "Token buckets en memoria por alcance", ("scope",))
+    buckets.set(len(limiter.users), ("user",))
+    buckets.set(len(limiter.rooms), ("room",))
+    return metrics + [cache_requests, history_bytes, rejected, buckets]
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    body = registry.render(collectors=[lambda: _node_metrics(request.app)])
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
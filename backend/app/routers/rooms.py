@@ -1,25 +1,33 @@
 # backend/app/routers/rooms.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.core.database import get_db
-from app.models.models import Room, RoomMember, User
-from app.schemas.schemas import RoomCreate, RoomResponse, RoomJoin
-from app.core.security import get_current_user, get_password_hash, verify_password
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.core.database import get_async_db, get_read_db, read_router
+from app.core.pagination import decode_name_cursor, encode_name_cursor
+from app.models.models import Room, RoomCounter, RoomMember
+from app.schemas.schemas import RoomCreate, RoomResponse, RoomJoin, UnreadCount
+from app.core.security import get_current_user
+from app.services.hashing import hasher
+from app.services.auth_cache import is_member, lookup_user, remember_membership
+from app.services.room_directory import etag_for, etag_matches, room_directory
+from app.services import metrics
 
 router = APIRouter(prefix="/rooms", tags=["Rooms"])
 
 @router.post("/", response_model=RoomResponse)
-def create_room(
+async def create_room(
     room: RoomCreate, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     username: str = Depends(get_current_user)
 ):
     # Obtener ID del usuario creador
-    user = db.query(User).filter(User.username == username).first()
+    user = await lookup_user(db, username)
     
     # Validar unicidad nombre sala
-    if db.query(Room).filter(Room.name == room.name).first():
+    result = await db.execute(select(Room).filter(Room.name == room.name))
+    if result.scalars().first():
         raise HTTPException(status_code=400, detail="Room name already exists")
 
     # Hash del password si la sala es privada
@@ -27,48 +35,126 @@ def create_room(
     if room.is_private:
         if not room.password:
             raise HTTPException(status_code=400, detail="Private rooms require a password")
-        room_pwd_hash = get_password_hash(room.password)
+        room_pwd_hash = await hasher.hash(room.password)
 
     new_room = Room(name=room.name, is_private=room.is_private, password_hash=room_pwd_hash, created_by=user.id)
     db.add(new_room)
-    db.commit()
-    db.refresh(new_room)
+    await db.flush()
 
     # Agregar al creador como miembro admin automáticamente
     member = RoomMember(room_id=new_room.id, user_id=user.id, role="admin")
     db.add(member)
-    db.commit()
+    await db.commit()
+    remember_membership(new_room.id, user.id)
+    room_directory.invalidate()
+    read_router.mark_write(username)
 
     return new_room
 
+def room_summary(room: Room) -> dict:
+    return {"id": room.id, "name": room.name, "is_private": room.is_private, "created_by": room.created_by}
+
+def page_response(body: bytes, etag: str, next_cursor: Optional[str], if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=List[RoomResponse])
-def list_rooms(db: Session = Depends(get_db)):
-    return db.query(Room).all()
+async def list_rooms(
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    prefix: Optional[str] = Query(None, min_length=1, max_length=100),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Salas ordenadas por nombre, de a `limit`.
+
+    Se pagina por keyset sobre el índice único de `name` (cursor en
+    X-Next-Cursor) y `prefix` filtra por comienzo del nombre. La primera página
+    sin filtro sale ya serializada de un cache en memoria; con If-None-Match
+    y el mismo ETag se contesta 304 sin consultar la DB.
+    """
+    first_page = after is None and prefix is None
+    if first_page:
+        cached = room_directory.get(limit)
+        if cached is not None:
+            return page_response(cached.body, cached.etag, cached.next_cursor, if_none_match)
+        generation = room_directory.generation
+
+    query = select(Room).order_by(Room.name.asc()).limit(limit)
+    if prefix:
+        query = query.filter(Room.name.startswith(prefix, autoescape=True))
+    if after:
+        query = query.filter(Room.name > decode_name_cursor(after))
+    with metrics.db_query_seconds.time(("list_rooms",)):
+        rooms = (await db.execute(query)).scalars().all()
+
+    next_cursor = encode_name_cursor(rooms[-1].name) if len(rooms) == limit else None
+    body = json.dumps([room_summary(r) for r in rooms], separators=(",", ":")).encode()
+    if first_page:
+        page = room_directory.set(limit, body, next_cursor, generation)
+        return page_response(page.body, page.etag, next_cursor, if_none_match)
+    return page_response(body, etag_for(body), next_cursor, if_none_match)
+
+@router.get("/unread", response_model=List[UnreadCount])
+async def get_unread_counts(
+    db: AsyncSession = Depends(get_read_db),
+    username: str = Depends(get_current_user),
+):
+    """No leídos de todas las salas del usuario en una consulta: contador de la
+    sala menos la marca del miembro, sin contar filas de 'messages'."""
+    user = await lookup_user(db, username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    unread = func.coalesce(RoomCounter.message_count, 0) - RoomMember.last_read
+    query = select(RoomMember.room_id, unread)\
+        .outerjoin(RoomCounter, RoomCounter.room_id == RoomMember.room_id)\
+        .filter(RoomMember.user_id == user.id)\
+        .order_by(RoomMember.room_id)
+    with metrics.db_query_seconds.time(("unread",)):
+        rows = (await db.execute(query)).all()
+    return [{"room_id": room_id, "unread": max(count, 0)} for room_id, count in rows]
+
+@router.get("/by-name/{name}", response_model=RoomResponse)
+async def get_room_by_name(name: str, db: AsyncSession = Depends(get_read_db)):
+    """Búsqueda exacta por nombre (índice único), sin recorrer el listado."""
+    result = await db.execute(select(Room).filter(Room.name == name))
+    room = result.scalars().first()
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room
 
 @router.post("/{room_id}/join")
-def join_room(
+async def join_room(
     room_id: int, 
     join_data: RoomJoin, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     username: str = Depends(get_current_user)
 ):
-    user = db.query(User).filter(User.username == username).first()
-    room = db.query(Room).filter(Room.id == room_id).first()
+    user = await lookup_user(db, username)
+    room = await db.get(Room, room_id)
     
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
     # Verificar si ya es miembro
-    if db.query(RoomMember).filter_by(room_id=room_id, user_id=user.id).first():
+    if await is_member(db, room_id, user.id):
         return {"message": "Already joined"}
 
     # Verificar password si es privada
     if room.is_private:
-        if not join_data.password or not verify_password(join_data.password, room.password_hash):
+        if not join_data.password or not await hasher.verify(join_data.password, room.password_hash):
             raise HTTPException(status_code=403, detail="Invalid room password")
 
-    new_member = RoomMember(room_id=room_id, user_id=user.id)
+    # Lo anterior a unirse no cuenta como no leído
+    current_count = select(RoomCounter.message_count).filter(RoomCounter.room_id == room_id).scalar_subquery()
+    new_member = RoomMember(room_id=room_id, user_id=user.id, last_read=func.coalesce(current_count, 0))
     db.add(new_member)
-    db.commit()
+    await db.commit()
+    remember_membership(room_id, user.id)
+    read_router.mark_write(username)
     
-    return {"message": f"Joined room {room.name}"}
\ No newline at end of file
+    return {"message": f"Joined room {room.name}"}
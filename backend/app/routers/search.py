@@ -0,0 +1,34 @@
+# backend/app/routers/search.py
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.core.database import get_read_db
+from app.core.security import get_current_user
+from app.services.auth_cache import lookup_user
+from app.services.search import search_messages
+from app.services import metrics
+
+router = APIRouter(tags=["Search"])
+
+@router.get("/search")
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    room_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    username: str = Depends(get_current_user),
+):
+    """Busca en el historial de las salas donde el usuario es miembro (o en
+    `room_id`), de la coincidencia más relevante a la menos. Cada resultado
+    trae `highlight` con las coincidencias entre <mark>; la página siguiente
+    se pide con el cursor de X-Next-Cursor."""
+    user = await lookup_user(db, username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    with metrics.db_query_seconds.time(("search",)):
+        results, next_cursor = await search_messages(db, user.id, q, room_id, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return results
@@ -37,12 +37,18 @@ class RoomResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class UnreadCount(BaseModel):
+    room_id: int
+    unread: int
+
 # --- Messages ---
 class MessageResponse(BaseModel):
     id: int
+    message_id: Optional[str] = None
     content: str
     user_id: Optional[int]
     username: str
     created_at: datetime
+    seq: Optional[int] = None
     class Config:
         orm_mode = True
\ No newline at end of file
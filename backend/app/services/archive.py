@@ -0,0 +1,275 @@
+# backend/app/services/archive.py
+"""
+Particiones mensuales de `messages` y archivo del historial frío.
+
+En PostgreSQL `messages` está particionada por rango de created_at (ver
+database/init.sql); `ensure_partitions` crea por adelantado las de los
+próximos meses y la corre el worker al arrancar y cada hora.
+
+`archive_expired` saca de la DB los meses más viejos que la retención: por
+cada sala escribe un segmento `<mes>/room-<id>.ndjson.gz` (ordenado por
+created_at, id), lo registra en `message_archives` y recién entonces borra
+las filas. En PostgreSQL la partición del mes se desprende (DETACH) antes de
+exportar: lo que llegue tarde al mes cae en la DEFAULT y queda para la
+próxima corrida, y lo exportado es exactamente lo que después se borra con
+DROP, sin VACUUM. Si se corta a mitad, volver a correrlo retoma la tabla ya
+desprendida y une lo ya escrito con lo que quedó en la DB, deduplicando por id.
+
+`read_archived` es el camino de lectura de get_history: los segmentos son
+inmutables salvo que el job los vuelva a escribir, así que se cachean ya
+decodificados (LRU por ruta y mtime).
+"""
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import groupby
+from typing import Optional
+
+from sqlalchemy import column, delete, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Message, MessageArchive, User
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def month_start(value: datetime) -> datetime:
+    return _utc(value).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"messages_{month:%Y_%m}"
+
+
+# --- Particiones (solo PostgreSQL) ---
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages')"
+    )).first() is not None
+
+
+def detached_months(db: Session) -> list[datetime]:
+    """Meses cuya partición quedó desprendida sin borrar (archivo interrumpido)."""
+    if not is_partitioned(db):
+        return []
+    names = db.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname ~ '^messages_[0-9]{4}_[0-9]{2}$' "
+        "AND oid NOT IN (SELECT inhrelid FROM pg_inherits)"
+    )).scalars().all()
+    return sorted(datetime.strptime(name, "messages_%Y_%m").replace(tzinfo=timezone.utc) for name in names)
+
+
+def _detach_month(db: Session, month: datetime) -> Optional[str]:
+    """Desprende la partición del mes y confirma enseguida (el DETACH bloquea
+    `messages` hasta el commit). Devuelve el nombre de la tabla desprendida, o
+    None si el mes no tiene partición propia."""
+    if not is_partitioned(db):
+        return None
+    name = partition_name(month)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+        return None
+    attached = db.execute(text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name)"), {"name": name}).first()
+    if attached:
+        db.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        db.commit()
+    return name
+
+
+def ensure_partitions(db: Session, months_ahead: int = settings.MESSAGE_PARTITIONS_AHEAD, now: datetime = None) -> list[str]:
+    """Crea las particiones del mes actual y de los `months_ahead` siguientes.
+    Devuelve las que creó. Sin particionado (SQLite, tabla vieja) no hace nada."""
+    if not is_partitioned(db):
+        return []
+    created = []
+    first = month_start(now or datetime.now(timezone.utc))
+    for i in range(months_ahead + 1):
+        month = add_months(first, i)
+        name = partition_name(month)
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            continue
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        db.commit()
+        created.append(name)
+    return created
+
+
+# --- Archivo ---
+
+def segment_path(month: datetime, room_id: int) -> str:
+    return os.path.join(f"{month:%Y-%m}", f"room-{room_id}.ndjson.gz")
+
+
+def _write_segment(directory: str, relative: str, entries: list[dict]):
+    path = os.path.join(directory, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            for entry in entries:
+                out.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+
+def _read_segment_file(path: str) -> list[dict]:
+    with gzip.open(path, "rb") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _month_rows(db: Session, source, start: datetime, end: datetime) -> list:
+    return db.execute(
+        select(source.c.id, source.c.room_id, source.c.message_id, source.c.user_id, User.username,
+               source.c.content, source.c.created_at, source.c.seq)
+        .outerjoin(User, source.c.user_id == User.id)
+        .filter(source.c.created_at >= start, source.c.created_at < end)
+    ).all()
+
+
+def archive_month(db: Session, month: datetime, directory: str) -> int:
+    """Archiva todos los mensajes de `month`. Devuelve cuántos movió."""
+    start, end = month, add_months(month, 1)
+    detached = _detach_month(db, month)
+    # Lo que queda en `messages` (DEFAULT o tabla sin particionar) más la partición desprendida
+    rows = _month_rows(db, Message.__table__, start, end)
+    if detached:
+        columns = [column(c.name, c.type) for c in Message.__table__.c if c.name != "search_vector"]
+        rows += _month_rows(db, table(detached, *columns), start, end)
+    rows.sort(key=lambda r: (r.room_id, _utc(r.created_at), r.id))
+    if not rows:
+        if detached:
+            db.execute(text(f"DROP TABLE {detached}"))
+            db.commit()
+        return 0
+
+    for room_id, room_rows in groupby(rows, key=lambda r: r.room_id):
+        entries = [{
+            "id": r.id,
+            "message_id": r.message_id,
+            "content": r.content,
+            "user_id": r.user_id,
+            "username": r.username,
+            "created_at": r.created_at.isoformat(),
+            "seq": r.seq,
+        } for r in room_rows]
+        relative = segment_path(month, room_id)
+        if os.path.exists(os.path.join(directory, relative)):
+            # Corrida anterior interrumpida o mensajes que llegaron tarde a ese mes
+            known = {e["id"] for e in entries}
+            previous = [e for e in _read_segment_file(os.path.join(directory, relative)) if e["id"] not in known]
+            entries = sorted(previous + entries, key=_position)
+        _write_segment(directory, relative, entries)
+        db.execute(delete(MessageArchive).filter_by(room_id=room_id, month=f"{month:%Y-%m}"))
+        db.add(MessageArchive(
+            room_id=room_id,
+            month=f"{month:%Y-%m}",
+            path=relative,
+            message_count=len(entries),
+            oldest_at=datetime.fromisoformat(entries[0]["created_at"]),
+            newest_at=datetime.fromisoformat(entries[-1]["created_at"]),
+        ))
+
+    _drop_month(db, month, max(r.id for r in rows), detached)
+    db.commit()
+    return len(rows)
+
+
+def _drop_month(db: Session, month: datetime, max_id: int, detached: Optional[str] = None):
+    # Solo hasta el último id exportado: algo que entre tarde al mes queda para la próxima corrida
+    start, end = month, add_months(month, 1)
+    if detached:
+        # Ya fuera de `messages`: no recibe filas nuevas, todo lo que tiene se exportó
+        db.execute(text(f"DROP TABLE {detached}"))
+    if db.get_bind().dialect.name == "sqlite":
+        # Tabla FTS5 de contenido externo: hay que pasarle el texto viejo para borrarlo
+        db.execute(
+            text("INSERT INTO messages_fts(messages_fts, rowid, content) "
+                 "SELECT 'delete', id, content FROM messages WHERE created_at >= :start AND created_at < :end AND id <= :max_id"),
+            {"start": _sqlite_timestamp(start), "end": _sqlite_timestamp(end), "max_id": max_id},
+        )
+    db.execute(delete(Message).filter(Message.created_at >= start, Message.created_at < end, Message.id <= max_id))
+
+
+def _sqlite_timestamp(value: datetime) -> str:
+    # Mismo formato con el que SQLAlchemy guarda DateTime en SQLite
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def archive_expired(db: Session, directory: str, retention_months: int = settings.MESSAGE_RETENTION_MONTHS, now: datetime = None) -> dict[str, int]:
+    """Archiva cada mes completo anterior a la retención. {mes: mensajes}."""
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    oldest = db.execute(select(Message.created_at).order_by(Message.created_at.asc()).limit(1)).scalar()
+    starts = [month_start(oldest)] if oldest else []
+    # Una corrida interrumpida puede haber dejado un mes entero fuera de `messages`
+    starts += detached_months(db)
+    archived = {}
+    month = min(starts) if starts else cutoff
+    while month < cutoff:
+        count = archive_month(db, month, directory)
+        if count:
+            archived[f"{month:%Y-%m}"] = count
+        month = add_months(month, 1)
+    return archived
+
+
+# --- Lectura ---
+
+@lru_cache(maxsize=settings.ARCHIVE_SEGMENT_CACHE)
+def _load_segment(path: str, mtime_ns: int) -> tuple[dict, ...]:
+    return tuple(_read_segment_file(path))
+
+
+def load_segment(path: str) -> tuple[dict, ...]:
+    # La clave incluye el mtime: si el job reescribe un segmento, no se sirve el viejo
+    return _load_segment(path, os.stat(path).st_mtime_ns)
+
+
+def _position(entry: dict) -> tuple[datetime, int]:
+    return _utc(datetime.fromisoformat(entry["created_at"])), entry["id"]
+
+
+async def read_archived(
+    db: AsyncSession,
+    room_id: int,
+    limit: int,
+    before: Optional[tuple[datetime, int]] = None,
+    directory: str = None,
+) -> list[dict]:
+    """Hasta `limit` mensajes archivados de la sala anteriores a `before`
+    (created_at, id), del más nuevo al más viejo, con la forma de get_history."""
+    directory = directory or settings.MESSAGE_ARCHIVE_DIR
+    if not directory:
+        return []
+    query = select(MessageArchive.path).filter(MessageArchive.room_id == room_id)
+    if before:
+        query = query.filter(MessageArchive.oldest_at <= before[0])
+    paths = (await db.execute(query.order_by(MessageArchive.newest_at.desc()))).scalars().all()
+
+    before = (_utc(before[0]), before[1]) if before else None
+    result = []
+    for relative in paths:
+        entries = await asyncio.to_thread(load_segment, os.path.join(directory, relative))
+        for entry in reversed(entries):
+            if before is None or _position(entry) < before:
+                result.append(dict(entry))
+                if len(result) == limit:
+                    return result
+    return result
@@ -0,0 +1,109 @@
+# backend/app/services/auth_cache.py
+"""
+Caches en memoria para el camino de autenticación: tokens ya verificados,
+usuarios por username y membresías (room_id, user_id). Evitan que una
+tormenta de reconexiones se convierta en una tormenta de consultas a la DB.
+"""
+import time
+from collections import OrderedDict, namedtuple
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.models import RoomMember, User
+from app.services import metrics
+
+# Foto inmutable del usuario: no se cachean objetos ORM atados a una sesión
+CachedUser = namedtuple("CachedUser", ["id", "username"])
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU acotado en tamaño donde cada entrada vence en un instante absoluto."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is not _MISSING:
+            expires_at, value = item
+            if expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None, expires_at: float = None):
+        deadline = time.time() + (self.ttl if ttl is None else ttl)
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._data[key] = (deadline, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+token_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+user_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+membership_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+def clear_all():
+    for cache in (token_cache, user_cache, membership_cache):
+        cache.clear()
+
+
+def stats() -> dict:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats(), "memberships": membership_cache.stats()}
+
+
+async def lookup_user(db: AsyncSession, username: str) -> Optional[CachedUser]:
+    user = user_cache.get(username)
+    if user is None:
+        with metrics.db_query_seconds.time(("lookup_user",)):
+            result = await db.execute(select(User.id, User.username).filter(User.username == username))
+        row = result.first()
+        if row is None:
+            return None  # los usuarios inexistentes no se cachean: pueden registrarse
+        user = CachedUser(row.id, row.username)
+        user_cache.set(username, user)
+    return user
+
+
+async def is_member(db: AsyncSession, room_id: int, user_id: int) -> bool:
+    member = membership_cache.get((room_id, user_id))
+    if member is None:
+        with metrics.db_query_seconds.time(("is_member",)):
+            member = await db.get(RoomMember, (room_id, user_id)) is not None
+        # Los "no es miembro" viven poco: otro nodo puede haber procesado el join
+        membership_cache.set((room_id, user_id), member, ttl=None if member else settings.AUTH_CACHE_NEGATIVE_TTL)
+    return member
+
+
+def remember_membership(room_id: int, user_id: int):
+    """Llamar después de commitear un RoomMember nuevo (join_room / create_room)."""
+    membership_cache.set((room_id, user_id), True)
@@ -0,0 +1,163 @@
+# backend/app/services/backplane.py
+"""
+Backplane de fan-out entre nodos.
+
+Cada nodo (proceso uvicorn / contenedor) publica los eventos de sala en el
+backplane y entrega a sus propios sockets lo que llega de los demás. Los
+eventos viajan con el id del nodo de origen para no entregarlos dos veces.
+"""
+import asyncio
+import json
+import threading
+import uuid
+
+import pika
+from app.core.config import settings
+from app.services.broker import BrokerPublisher
+
+
+class Backplane:
+    """Interfaz pub/sub. Las subclases implementan publish/_connect/_disconnect."""
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self._loop = None
+        self._inbox = None
+        self._dispatcher = None
+
+    async def start(self, on_event):
+        """`on_event(room_id, message)` se llama en orden por cada evento remoto."""
+        self._loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue()
+        self._dispatcher = asyncio.create_task(self._dispatch(on_event))
+        await self._connect()
+
+    async def stop(self):
+        await self._disconnect()
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def publish(self, room_id: int, message: dict):
+        raise NotImplementedError
+
+    async def _connect(self):
+        pass
+
+    async def _disconnect(self):
+        pass
+
+    def _receive(self, origin: str, room_id: int, message: dict):
+        # Puede llamarse desde cualquier hilo; se serializa en el loop del nodo
+        if origin == self.node_id or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._inbox.put_nowait, (room_id, message))
+
+    async def _dispatch(self, on_event):
+        while True:
+            room_id, message = await self._inbox.get()
+            try:
+                await on_event(room_id, message)
+            except Exception as e:
+                print(f"Error delivering backplane event: {e}")
+
+
+class InMemoryHub:
+    """Punto de encuentro de los backplanes en memoria de un mismo proceso."""
+
+    def __init__(self):
+        self.nodes = set()
+
+
+default_hub = InMemoryHub()
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane dentro del proceso: sirve para un solo nodo y para tests con
+    varias instancias de la app en el mismo proceso."""
+
+    def __init__(self, hub: InMemoryHub = None):
+        super().__init__()
+        self.hub = hub or default_hub
+
+    async def _connect(self):
+        self.hub.nodes.add(self)
+
+    async def _disconnect(self):
+        self.hub.nodes.discard(self)
+
+    async def publish(self, room_id: int, message: dict):
+        for node in list(self.hub.nodes):
+            node._receive(self.node_id, room_id, message)
+
+
+class AMQPBackplane(Backplane):
+    """Backplane sobre un exchange fanout de RabbitMQ.
+
+    Cada nodo publica en el exchange y consume de una cola exclusiva propia
+    (se borra sola al desconectarse), así todos los nodos ven todos los eventos.
+    """
+
+    def __init__(self, url: str, exchange: str = "chat_events", reconnect_delay: float = 1.0):
+        super().__init__()
+        self.url = url
+        self.exchange = exchange
+        self.reconnect_delay = reconnect_delay
+        self._publisher = BrokerPublisher(url, queue=None, exchange=exchange, persistent=False)
+        self._consumer = None
+        self._connection = None
+        self._channel = None
+        self._stopping = threading.Event()
+
+    async def _connect(self):
+        self._stopping.clear()
+        self._publisher.start()
+        self._consumer = threading.Thread(target=self._consume, name="backplane-consumer", daemon=True)
+        self._consumer.start()
+
+    async def _disconnect(self):
+        self._stopping.set()
+        connection, channel = self._connection, self._channel
+        if connection is not None and channel is not None:
+            try:
+                connection.add_callback_threadsafe(channel.stop_consuming)
+            except Exception:
+                pass
+        await asyncio.to_thread(self._consumer.join, 5)
+        await asyncio.to_thread(self._publisher.stop, 1)
+
+    async def publish(self, room_id: int, message: dict):
+        self._publisher.publish({"origin": self.node_id, "room_id": room_id, "message": message})
+
+    def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                self._connection = pika.BlockingConnection(pika.URLParameters(self.url))
+                self._channel = channel = self._connection.channel()
+                channel.exchange_declare(exchange=self.exchange, exchange_type='fanout')
+                result = channel.queue_declare(queue='', exclusive=True)
+                channel.queue_bind(exchange=self.exchange, queue=result.method.queue)
+                channel.basic_consume(queue=result.method.queue, on_message_callback=self._on_message, auto_ack=True)
+                if not self._stopping.is_set():
+                    channel.start_consuming()
+            except Exception as e:
+                if not self._stopping.is_set():
+                    print(f"Error in backplane consumer: {e}")
+            finally:
+                if self._connection is not None and self._connection.is_open:
+                    self._connection.close()
+                self._connection = self._channel = None
+            self._stopping.wait(self.reconnect_delay)
+
+    def _on_message(self, ch, method, properties, body):
+        data = json.loads(body)
+        self._receive(data["origin"], data["room_id"], data["message"])
+
+
+def create_backplane(kind: str = None) -> Backplane:
+    kind = kind or settings.BACKPLANE
+    if kind == "amqp":
+        return AMQPBackplane(settings.BROKER_URL, exchange=settings.BACKPLANE_EXCHANGE)
+    if kind == "memory":
+        return InMemoryBackplane()
+    raise ValueError(f"Backplane desconocido: {kind}")
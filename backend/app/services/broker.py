@@ -1,24 +1,446 @@
-import pika
+import asyncio
 import json
+import threading
+import time
+from collections import deque
+
+import pika
+from pika.adapters.select_connection import IOLoop
 from app.core.config import settings
+from app.services import metrics
+from app.services.embedded_queue import EmbeddedQueue
+from app.services.spool import Spool, SpoolFull
+
+QUEUE_NAME = 'chat_messages'
+
+
+class BrokerPublisher:
+    """Publicador persistente hacia RabbitMQ.
+
+    Mantiene una sola conexión asíncrona (SelectConnection) en un hilo propio,
+    declara la cola una vez y trabaja con publisher confirms: el broker confirma
+    los mensajes en lote (Basic.Ack con multiple=True), así que no hay un
+    round-trip por mensaje. Lo que queda sin confirmar al caerse la conexión
+    vuelve al buffer y se reenvía al reconectar (entrega at-least-once).
+
+    Con `spool_dir`, mientras el broker no está listo o el buffer en memoria
+    se llena, los mensajes van a un spool en disco (ver spool.py) en lugar de
+    descartarse. Los escribe un hilo propio (con el fsync que pida
+    BROKER_SPOOL_FSYNC), así que publish() nunca espera al disco. El hilo de
+    I/O lo drena en orden y avanza el checkpoint a medida que llegan los
+    confirms, así que sobreviven a un reinicio.
+
+    `_lock` protege solo el estado en memoria; el Spool, que no es seguro
+    entre hilos, se usa bajo `_spool_lock`. Si hacen falta los dos, se toman
+    en ese orden.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue: str = QUEUE_NAME,
+        exchange: str = '',
+        persistent: bool = True,
+        max_buffer: int = 10000,
+        max_in_flight: int = 500,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        spool_dir: str = None,
+        spool_options: dict = None,
+    ):
+        self.url = url
+        self.queue = queue
+        self.exchange = exchange          # si se indica, se publica a un exchange fanout
+        self.persistent = persistent
+        self.max_buffer = max_buffer
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.spool_dir = spool_dir
+        self.spool_options = spool_options or {}
+
+        self._lock = threading.Lock()
+        # Entradas (cuerpo, posición en el spool o None si solo vive en memoria)
+        self._pending = deque()   # listas para publicar, en orden
+        self._in_flight = {}      # delivery_tag -> entrada publicada sin confirmar
+        self._delivery_tag = 0
+        self._spool = None
+        self._spooling = False    # True mientras quede algo sin leer en el spool
+        self._spooled = deque()   # posiciones leídas del spool, en orden, sin confirmar
+        self._spool_done = set()
+        self._spool_lock = threading.Lock()
+        self._to_spool = deque()  # cuerpos aceptados que el escritor todavía no pasó al spool
+        self._spool_wakeup = threading.Event()
+        self._spool_writer = None
+        self._spool_closing = False
+        self._flush_scheduled = False
+        self._ready = False
+
+        self._ioloop = None
+        self._connection = None
+        self._channel = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+        self.stats = {"published": 0, "confirmed": 0, "nacked": 0, "dropped": 0, "reconnects": 0, "spooled": 0}
+
+    # --- API pública (cualquier hilo / event loop) ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._open_spool()
+        self._ioloop = IOLoop()
+        self._thread = threading.Thread(target=self._run, name="broker-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Espera a que se confirme lo pendiente (hasta `timeout`) y cierra la conexión."""
+        if not self._thread:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._ioloop.add_callback_threadsafe(self._shutdown)
+        self._thread.join(timeout)
+        self._thread = None
+        if self._spool is not None:
+            # El escritor vacía su cola antes de salir; lo que sigue en memoria va detrás
+            self._spool_closing = True
+            self._spool_wakeup.set()
+            self._spool_writer.join()
+            with self._lock:
+                entries = list(self._in_flight.values()) + list(self._pending)
+                self._pending.clear()
+                self._in_flight.clear()
+                self._spooled.clear()
+                self._spool_done.clear()
+                spool, self._spool = self._spool, None
+            with self._spool_lock:
+                self._spool_memory_entries(spool, entries)
+                spool.close()
+
+    async def close(self, timeout: float = 5.0):
+        """stop() sin bloquear el event loop (lifespan)."""
+        await asyncio.to_thread(self.stop, timeout)
+
+    def publish(self, message_data: dict) -> bool:
+        """Encola el mensaje sin bloquear. Devuelve False si no hay lugar
+        (buffer en memoria lleno y, si hay spool, spool lleno)."""
+        body = json.dumps(message_data).encode()
+        with self._lock:
+            full = len(self._pending) + len(self._in_flight) >= self.max_buffer
+            if self._spool is not None and (self._spooling or full or not self._ready):
+                return self._append_to_spool(body)
+            if full:
+                self.stats["dropped"] += 1
+                print("Error publishing to broker: buffer lleno, mensaje descartado")
+                return False
+            self._pending.append((body, None))
+            wake = self._ready and not self._flush_scheduled
+            if wake:
+                self._flush_scheduled = True
+        if wake:
+            self._ioloop.add_callback_threadsafe(self._flush)
+        return True
+
+    def _open_spool(self):
+        # Lo que quedó de una corrida anterior se drena antes que lo nuevo
+        if self.spool_dir and self._spool is None:
+            self._spool = Spool(self.spool_dir, **self.spool_options)
+            self._spooling = self._spool.unread()
+            self._spool_closing = False
+            self._spool_writer = threading.Thread(target=self._write_spool, name="broker-spool-writer", daemon=True)
+            self._spool_writer.start()
+
+    def _append_to_spool(self, body: bytes) -> bool:
+        # Con el lock tomado: solo se encola para el escritor, sin tocar el disco
+        if not self._spooling:
+            # Lo último encolado en memoria pasa al spool antes que el mensaje
+            # nuevo: así no se pierde si el proceso muere y el orden se mantiene
+            tail = []
+            while self._pending and self._pending[-1][1] is None:
+                tail.append(self._pending.pop()[0])
+            self._to_spool.extend(reversed(tail))
+            self._spooling = True
+        if len(self._to_spool) >= self.max_buffer:
+            self.stats["dropped"] += 1
+            print("Error publishing to broker: escritura al spool atrasada, mensaje descartado")
+            return False
+        self._to_spool.append(body)
+        self._spool_wakeup.set()
+        return True
+
+    def _write_spool(self):
+        """Hilo escritor del spool: toma lo encolado por publish() y lo agrega
+        en orden, fuera de `_lock`. Sale al cerrar, con la cola vacía."""
+        while True:
+            self._spool_wakeup.wait()
+            with self._lock:
+                self._spool_wakeup.clear()
+                batch = list(self._to_spool)
+                spool = self._spool
+            if not batch:
+                if self._spool_closing:
+                    return
+                continue
+            written = dropped = 0
+            with self._spool_lock:
+                for body in batch:
+                    try:
+                        spool.append(body)
+                        written += 1
+                    except SpoolFull:
+                        dropped += 1
+            with self._lock:
+                # Se sacan recién ahora: mientras estén en la cola, _spooling no baja
+                for _ in batch:
+                    self._to_spool.popleft()
+                self.stats["spooled"] += written
+                self.stats["dropped"] += dropped
+                wake = self._ready and not self._flush_scheduled
+                if wake:
+                    self._flush_scheduled = True
+            if dropped:
+                print(f"Error publishing to broker: spool lleno, {dropped} mensajes descartados")
+            if wake:
+                self._ioloop.add_callback_threadsafe(self._flush)
+            if self._spool_closing:
+                self._spool_wakeup.set()
+
+    def wait_spooled(self, timeout: float = 5.0) -> bool:
+        """Espera a que el escritor pase al spool todo lo aceptado."""
+        deadline = time.monotonic() + timeout
+        while self._to_spool and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return not self._to_spool
+
+    def _spool_memory_entries(self, spool: Spool, entries):
+        for body, position in entries:
+            if position is None:
+                try:
+                    spool.append(body)
+                    self.stats["spooled"] += 1
+                except SpoolFull:
+                    self.stats["dropped"] += 1
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def pending(self) -> int:
+        """Mensajes en memoria sin confirmar (no cuenta lo que espera en el spool)."""
+        with self._lock:
+            return len(self._pending) + len(self._in_flight)
+
+    def spool_backlog(self) -> bool:
+        with self._lock:
+            spool = self._spool
+            if spool is None:
+                return False
+            if self._to_spool:
+                return True
+        with self._spool_lock:
+            return spool.unread()
+
+    @property
+    def spool_bytes(self) -> int:
+        spool = self._spool
+        return spool.size_bytes if spool is not None else 0
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Bloquea hasta que todo lo encolado esté confirmado o se agote el tiempo."""
+        deadline = time.monotonic() + timeout
+        while (self.pending() or self.spool_backlog()) and self._ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.pending() == 0 and not self.spool_backlog()
+
+    # --- Hilo de I/O ---
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stopping.is_set():
+            self._connection = pika.SelectConnection(
+                pika.URLParameters(self.url),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_error,
+                on_close_callback=self._on_connection_closed,
+                custom_ioloop=self._ioloop,
+            )
+            self._ioloop.start()
+
+            was_ready = self._ready
+            self._reset()
+            if self._stopping.is_set():
+                break
+            if was_ready:
+                delay = self.reconnect_delay
+            self.stats["reconnects"] += 1
+            self._stopping.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _reset(self):
+        # Lo publicado sin confirmar vuelve al inicio del buffer, en orden
+        with self._lock:
+            self._ready = False
+            self._flush_scheduled = False
+            for tag in sorted(self._in_flight, reverse=True):
+                self._pending.appendleft(self._in_flight[tag])
+            self._in_flight.clear()
+        self._channel = None
+
+    def _shutdown(self):
+        connection = self._connection
+        if connection is None or connection.is_closing or connection.is_closed:
+            self._ioloop.stop()
+        else:
+            connection.close()
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        print(f"Error publishing to broker: no se pudo conectar ({error})")
+        self._ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if not self._stopping.is_set():
+            print(f"Error publishing to broker: conexión cerrada ({reason})")
+        self._ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        if self.exchange:
+            channel.exchange_declare(exchange=self.exchange, exchange_type='fanout', callback=self._on_declared)
+        else:
+            channel.queue_declare(queue=self.queue, durable=True, callback=self._on_declared)
+
+    def _on_channel_closed(self, channel, reason):
+        # Sin canal no hay confirms: cerramos la conexión y el bucle de _run reconecta
+        if self._connection.is_open:
+            self._connection.close()
+
+    def _on_declared(self, frame):
+        self._channel.confirm_delivery(self._on_confirm, callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, frame):
+        with self._lock:
+            self._delivery_tag = 0
+            self._ready = True
+        self._flush()
+
+    def _flush(self):
+        with self._lock:
+            self._flush_scheduled = False
+            if not self._ready:
+                return
+            # Se trae del spool solo lo que cabe en la ventana: el resto sigue en disco
+            room = self.max_in_flight - len(self._in_flight) - len(self._pending) if self._spooling else 0
+        records = []
+        if room > 0:
+            # Lectura fuera de `_lock`: publish() no espera al disco
+            with self._spool_lock:
+                records = self._spool.read(room)
+        with self._lock:
+            self._drain_spool(records)
+            batch = []
+            while self._pending and len(self._in_flight) + len(batch) < self.max_in_flight:
+                self._delivery_tag += 1
+                batch.append((self._delivery_tag, self._pending.popleft()))
+            self._in_flight.update(batch)
+
+        for _, (body, _) in batch:
+            self._channel.basic_publish(
+                exchange=self.exchange,
+                routing_key='' if self.exchange else self.queue,
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2 if self.persistent else 1,  # 2 = mensaje persistente
+                ))
+        self.stats["published"] += len(batch)
+
+    def _drain_spool(self, records):
+        if not self._spooling:
+            return
+        for position, body in records:
+            self._pending.append((body, position))
+            self._spooled.append(position)
+        # Con escrituras en cola el spool todavía no terminó; sin ellas el
+        # escritor está quieto y consultar el spool es inmediato
+        if not self._to_spool:
+            with self._spool_lock:
+                self._spooling = self._spool.unread()
+
+    def _spool_checkpoint(self, entries):
+        """Última posición confirmada en orden, para el checkpoint (o None)."""
+        for _, position in entries:
+            if position is not None:
+                self._spool_done.add(position)
+        last = None
+        while self._spooled and self._spooled[0] in self._spool_done:
+            last = self._spooled.popleft()
+            self._spool_done.discard(last)
+        return last
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        checkpoint = None
+        with self._lock:
+            if method.multiple:
+                tags = sorted(t for t in self._in_flight if t <= method.delivery_tag)
+            else:
+                tags = [method.delivery_tag] if method.delivery_tag in self._in_flight else []
+            entries = [self._in_flight.pop(t) for t in tags]
+            if not acked:
+                # Rechazados por el broker: se reintentan antes que lo nuevo
+                self._pending.extendleft(reversed(entries))
+            elif self._spool is not None:
+                checkpoint = self._spool_checkpoint(entries)
+        if checkpoint is not None:
+            with self._spool_lock:
+                self._spool.commit(checkpoint)
+        self.stats["confirmed" if acked else "nacked"] += len(entries)
+        self._flush()
+
+
+def create_publisher(kind: str = None):
+    """"amqp": RabbitMQ + worker.py. "embedded": cola en proceso que escribe
+    directo en la DB (ver embedded_queue.py), para un solo nodo sin broker."""
+    kind = kind or settings.QUEUE_BACKEND
+    if kind == "embedded":
+        return EmbeddedQueue(
+            max_buffer=settings.BROKER_PUBLISH_BUFFER,
+            batch_size=settings.WORKER_BATCH_SIZE,
+            flush_interval=settings.WORKER_FLUSH_INTERVAL_MS / 1000,
+        )
+    if kind != "amqp":
+        raise ValueError(f"QUEUE_BACKEND desconocido: {kind}")
+    return BrokerPublisher(
+        settings.BROKER_URL,
+        max_buffer=settings.BROKER_PUBLISH_BUFFER,
+        max_in_flight=settings.BROKER_MAX_IN_FLIGHT,
+        reconnect_delay=settings.BROKER_RECONNECT_DELAY,
+        max_reconnect_delay=settings.BROKER_MAX_RECONNECT_DELAY,
+        spool_dir=settings.BROKER_SPOOL_DIR or None,
+        spool_options={
+            "segment_bytes": settings.BROKER_SPOOL_SEGMENT_BYTES,
+            "max_bytes": settings.BROKER_SPOOL_MAX_BYTES,
+            "fsync": settings.BROKER_SPOOL_FSYNC,
+            "fsync_interval": settings.BROKER_SPOOL_FSYNC_INTERVAL,
+        },
+    )
+
+
+publisher = create_publisher()
+
 
 def publish_message(message_data: dict):
-    """Publica un mensaje en la cola 'chat_messages'."""
-    try:
-        # Nota: En producción, mantendrías la conexión abierta en lugar de abrir/cerrar por mensaje
-        params = pika.URLParameters(settings.BROKER_URL)
-        connection = pika.BlockingConnection(params)
-        channel = connection.channel()
-        
-        channel.queue_declare(queue='chat_messages', durable=True)
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key='chat_messages',
-            body=json.dumps(message_data),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Hace el mensaje persistente
-            ))
-        connection.close()
-    except Exception as e:
-        print(f"Error publishing to broker: {e}")
\ No newline at end of file
+    """Publica un mensaje en la cola 'chat_messages' a través del publicador
+    persistente (o en la cola embebida, según QUEUE_BACKEND)."""
+    with metrics.broker_publish_seconds.time():
+        accepted = publisher.publish(message_data)
+    if not accepted:
+        metrics.broker_publish_failures.inc()
+    return accepted
@@ -0,0 +1,86 @@
+# backend/app/services/dead_letter.py
+"""
+Reintentos con backoff y cola de mensajes muertos (DLQ) para el worker.
+
+Un mensaje que no se puede persistir se vuelve a publicar en una cola de
+espera `chat_messages.retry.<ms>` con TTL fijo; al vencer, RabbitMQ lo
+devuelve a `chat_messages` (dead-letter al exchange por defecto). Hay una
+cola por demora porque RabbitMQ solo expira mensajes en la cabeza de la
+cola: con TTL por mensaje, uno largo frenaría a los cortos. El número de
+intento viaja en el header `x-retry-count`; superado el máximo, el mensaje
+queda estacionado en `chat_messages.dlq` (ver dlq.py para inspeccionar y
+reinyectar). Los errores de conexión con la DB no consumen intentos: no es
+culpa del mensaje.
+"""
+from datetime import datetime, timezone
+
+import pika
+from sqlalchemy import exc as sa_exc
+
+from app.core.config import settings
+from app.services import metrics
+from app.services.broker import QUEUE_NAME
+
+RETRY_HEADER = "x-retry-count"
+ERROR_HEADER = "x-last-error"
+DEAD_LETTERED_AT_HEADER = "x-dead-lettered-at"
+DLQ_NAME = f"{QUEUE_NAME}.dlq"
+
+_TRANSIENT = (sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.DisconnectionError, sa_exc.TimeoutError)
+
+
+def describe_error(error: Exception) -> tuple[str, bool]:
+    """(texto para el header, ¿es transitorio?). Se usa también en los hijos del
+    worker particionado, que solo pueden devolver datos serializables."""
+    return f"{type(error).__name__}: {error}"[:500], isinstance(error, _TRANSIENT)
+
+
+def retry_queue_name(delay_ms: int) -> str:
+    return f"{QUEUE_NAME}.retry.{delay_ms}"
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 5, base_delay_ms: int = 1000, max_delay_ms: int = 60000):
+        self.max_retries = max_retries
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+
+    def delay_for(self, attempt: int) -> int:
+        return min(self.base_delay_ms * 2 ** (max(attempt, 1) - 1), self.max_delay_ms)
+
+    def declare(self, channel):
+        """Declara DLQ y colas de espera, y activa confirms para que los
+        reenvíos no se pierdan antes del ack del original."""
+        channel.queue_declare(queue=DLQ_NAME, durable=True)
+        for delay in sorted({self.delay_for(a) for a in range(1, self.max_retries + 1)}):
+            channel.queue_declare(queue=retry_queue_name(delay), durable=True, arguments={
+                "x-message-ttl": delay,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": QUEUE_NAME,
+            })
+        channel.confirm_delivery()
+
+    def reject(self, channel, delivery_tag: int, body: bytes, properties, error: str, transient: bool = False):
+        """Manda el mensaje a reintento o a la DLQ y hace ack del original."""
+        headers = dict(getattr(properties, "headers", None) or {})
+        attempts = int(headers.get(RETRY_HEADER, 0)) + (0 if transient else 1)
+        headers[RETRY_HEADER] = attempts
+        headers[ERROR_HEADER] = error
+        if attempts > self.max_retries:
+            headers[DEAD_LETTERED_AT_HEADER] = datetime.now(timezone.utc).isoformat()
+            routing_key = DLQ_NAME
+            metrics.worker_dead_lettered.inc()
+            print(f" [!] Message parked in {DLQ_NAME} after {attempts - 1} retries: {error}")
+        else:
+            routing_key = retry_queue_name(self.delay_for(attempts))
+            metrics.worker_retried.inc()
+        channel.basic_publish(
+            exchange="",
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers),
+        )
+        channel.basic_ack(delivery_tag=delivery_tag)
+
+
+retry_policy = RetryPolicy(settings.WORKER_MAX_RETRIES, settings.WORKER_RETRY_BASE_MS, settings.WORKER_RETRY_MAX_MS)
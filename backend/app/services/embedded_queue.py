@@ -0,0 +1,147 @@
+# backend/app/services/embedded_queue.py
+"""
+Cola de persistencia en el mismo proceso (QUEUE_BACKEND=embedded).
+
+Para despliegues de un solo nodo y CI: en lugar de RabbitMQ + worker.py, los
+mensajes van a una cola en memoria y un hilo escritor los guarda por lotes
+con la misma lógica que el worker (build_message_rows + insert_messages +
+commit en una transacción). Mientras escribe, lo que llega se acumula y entra
+en el lote siguiente: cuanto más carga, más grandes los lotes.
+
+Es un hilo y no una tarea del event loop por lo mismo que BrokerPublisher:
+`publish` se puede llamar desde cualquier loop (varias apps en un proceso,
+como en los tests) y el INSERT es síncrono de todos modos.
+
+No hay durabilidad más allá de la memoria: lo encolado y no escrito se pierde
+si el proceso muere sin pasar por `stop()`. Un lote que falla se reintenta
+mensaje a mensaje y los que vuelven a fallar se descartan (no hay DLQ).
+"""
+import asyncio
+import queue
+import threading
+import time
+
+from app.core.database import SessionLocal
+from app.services import metrics
+from app.services.persistence import build_message_rows, insert_messages
+
+
+class EmbeddedQueue:
+    """Misma interfaz que BrokerPublisher (start/stop/publish/flush/pending/stats)."""
+
+    def __init__(self, session_factory=None, max_buffer: int = 10000, batch_size: int = 200, flush_interval: float = 0.2):
+        self.session_factory = session_factory or SessionLocal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_buffer)
+        self._thread = None
+        self._stopping = threading.Event()
+        self.stats = {"published": 0, "confirmed": 0, "dropped": 0, "failed": 0}
+
+    # --- API pública (cualquier hilo / event loop) ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="embedded-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Espera a que se escriba lo encolado (hasta `timeout`) y para el hilo."""
+        if not self._thread:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        left = self.pending()
+        if left:
+            print(f"Error persisting messages: {left} mensajes sin escribir al cerrar")
+
+    async def close(self, timeout: float = 5.0):
+        await asyncio.to_thread(self.stop, timeout)
+
+    def publish(self, message_data: dict) -> bool:
+        try:
+            self._queue.put_nowait(message_data)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            print("Error persisting messages: cola llena, mensaje descartado")
+            return False
+        self.stats["published"] += 1
+        return True
+
+    @property
+    def ready(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def pending(self) -> int:
+        """Encolados o en el lote que se está escribiendo."""
+        return self._queue.unfinished_tasks
+
+    @property
+    def spool_bytes(self) -> int:
+        return 0
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Bloquea hasta que todo lo encolado esté en la DB o se agote el tiempo."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and self.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.pending() == 0
+
+    # --- Hilo escritor ---
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            # Igual que consume_batches: hasta batch_size o flush_interval desde el primero
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list[dict]):
+        metrics.worker_batch_size.observe(len(batch))
+        db = self.session_factory()
+        try:
+            rows = build_message_rows(batch)
+            with metrics.worker_commit_seconds.time():
+                insert_messages(db, rows)
+                db.commit()
+            self._persisted(len(batch), len(rows))
+        except Exception as e:
+            print(f" [!] Error saving batch to DB, falling back to per-message inserts: {e}")
+            metrics.worker_failures.inc(labels=("batch",))
+            db.rollback()
+            for payload in batch:
+                try:
+                    rows = build_message_rows([payload])
+                    insert_messages(db, rows)
+                    db.commit()
+                    self._persisted(1, len(rows))
+                except Exception as e:
+                    print(f" [!] Error saving to DB, message dropped: {e}")
+                    metrics.worker_failures.inc(labels=("message",))
+                    self.stats["failed"] += 1
+                    db.rollback()
+        finally:
+            db.close()
+
+    def _persisted(self, messages: int, rows: int):
+        self.stats["confirmed"] += messages
+        metrics.worker_persisted.inc(rows)
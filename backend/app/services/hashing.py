@@ -0,0 +1,86 @@
+# backend/app/services/hashing.py
+"""
+bcrypt fuera del event loop y fuera del threadpool compartido.
+
+El hashing corre en un pool de procesos propio y acotado: una ráfaga de
+logins no le quita hilos al resto de endpoints, y cuando el pool está
+saturado se responde 503 de inmediato en lugar de encolar sin límite.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+from app.core.config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+
+@lru_cache(maxsize=None)
+def _context_for(rounds: int) -> CryptContext:
+    return pwd_context.copy(bcrypt__rounds=rounds)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context_for(rounds).hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    # El costo se lee del propio hash: los hashes viejos siguen validando
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordHasher:
+    """Pool de procesos para bcrypt con límite de operaciones en curso.
+
+    `workers=0` usa el threadpool por defecto (tests / despliegues mínimos);
+    el límite de pendientes y el 503 aplican igual.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self.rejected = 0
+
+    def start(self):
+        if self.workers and self._executor is None:
+            # spawn: los hijos no heredan los hilos del publicador ni del event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(_verify, password, hashed)
+
+    async def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service busy, try again",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            if self._executor is None:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self._slots.release()
+
+
+hasher = PasswordHasher(settings.HASH_POOL_WORKERS, settings.HASH_POOL_MAX_PENDING, settings.BCRYPT_ROUNDS)
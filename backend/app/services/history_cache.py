@@ -0,0 +1,141 @@
+# backend/app/services/history_cache.py
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Optional
+
+
+def _timestamp(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+# Overhead aproximado de cada sala (deque + buffer), para que las salas vacías
+# también cuenten contra el presupuesto
+_ROOM_OVERHEAD = 512
+
+
+def _identity(entry: dict):
+    # message_id si lo tiene; las entradas viejas se reconocen por autor + instante
+    return entry.get("message_id") or (entry["user_id"], _timestamp(entry["created_at"]))
+
+
+def _entry_size(entry: dict) -> int:
+    # Estimación aproximada de memoria: texto + overhead fijo del dict
+    return len(entry.get("content") or "") + len(entry.get("username") or "") + 160
+
+
+class _RoomBuffer:
+    __slots__ = ("entries", "complete", "warm", "size")
+
+    def __init__(self, per_room: int):
+        self.entries = deque(maxlen=per_room)  # del más viejo al más nuevo
+        self.complete = False  # True si contiene todo el historial de la sala
+        self.warm = False      # False mientras se carga desde la DB
+        self.size = _ROOM_OVERHEAD
+
+
+class HistoryCache:
+    """Ring buffer por sala con los últimos mensajes difundidos por este nodo.
+
+    Una sala se "calienta" con la primera consulta de historial que va a la DB
+    y desde ahí se mantiene con cada broadcast, así el `limit=50` que pide cada
+    cliente al abrir la sala no vuelve a la DB. Las salas completas se
+    desalojan por LRU cuando se supera el presupuesto global de memoria.
+    """
+
+    def __init__(self, per_room: int = 200, max_bytes: int = 64 * 1024 * 1024):
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self._rooms: OrderedDict[int, _RoomBuffer] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self._rooms.clear()
+        self._bytes = 0
+
+    def get(self, room_id: int, limit: int) -> Optional[list[dict]]:
+        """Los últimos `limit` mensajes (más nuevo primero) o None si hay que ir a la DB."""
+        room = self._rooms.get(room_id)
+        if room and room.warm and (len(room.entries) >= limit or room.complete):
+            self._rooms.move_to_end(room_id)
+            self.hits += 1
+            return list(islice(reversed(room.entries), limit))
+        self.misses += 1
+        return None
+
+    def since(self, room_id: int, seq: int) -> tuple[list[dict], bool]:
+        """Entradas con secuencia mayor a `seq` (más vieja primero) y si el
+        buffer alcanza para cubrir todo lo posterior a `seq` sin ir a la DB."""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return [], False
+        entries = sorted((e for e in room.entries if (e.get("seq") or 0) > seq), key=lambda e: e["seq"])
+        covered = room.warm and (room.complete or bool(room.entries) and (room.entries[0].get("seq") or 0) <= seq)
+        if covered:
+            self._rooms.move_to_end(room_id)
+        return entries, covered
+
+    def begin_warm(self, room_id: int):
+        """Empieza a juntar broadcasts de una sala fría mientras se consulta la DB."""
+        if room_id not in self._rooms:
+            self._rooms[room_id] = _RoomBuffer(self.per_room)
+            self._bytes += _ROOM_OVERHEAD
+            self._enforce_budget()
+
+    def seed(self, room_id: int, newest_first: list[dict], complete: bool):
+        """Carga la página más reciente leída de la DB y la une con lo recibido mientras tanto."""
+        room = self._rooms.get(room_id)
+        if room is None or room.warm:
+            return
+        seen = {_identity(e) for e in newest_first}
+        pending = [e for e in room.entries if _identity(e) not in seen]
+        merged = sorted(list(reversed(newest_first)) + pending, key=lambda e: _timestamp(e["created_at"]))
+
+        self._bytes -= room.size - _ROOM_OVERHEAD
+        room.entries.clear()
+        room.size = _ROOM_OVERHEAD
+        for entry in merged:
+            self._push(room, entry)
+        room.complete = complete and len(merged) <= self.per_room
+        room.warm = True
+        self._rooms.move_to_end(room_id)
+        self._enforce_budget()
+
+    def append(self, room_id: int, entry: dict):
+        room = self._rooms.get(room_id)
+        if room is None:
+            return  # sala fría: se cargará desde la DB cuando alguien la pida
+        self._push(room, entry)
+        self._rooms.move_to_end(room_id)
+        self._enforce_budget()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "rooms": len(self._rooms),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _push(self, room: _RoomBuffer, entry: dict):
+        if len(room.entries) == room.entries.maxlen:
+            dropped = room.entries[0]
+            room.size -= _entry_size(dropped)
+            self._bytes -= _entry_size(dropped)
+            room.complete = False
+        room.entries.append(entry)
+        room.size += _entry_size(entry)
+        self._bytes += _entry_size(entry)
+
+    def _enforce_budget(self):
+        while self._bytes > self.max_bytes and len(self._rooms) > 1:
+            _, room = self._rooms.popitem(last=False)
+            self._bytes -= room.size
+            self.evictions += 1
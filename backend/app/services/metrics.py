@@ -0,0 +1,266 @@
+# backend/app/services/metrics.py
+"""
+Métricas en formato de texto de Prometheus.
+
+En el camino caliente solo se suman números en dicts; el texto se arma
+recién cuando alguien pide /metrics. Lo que ya vive en otros objetos
+(sockets por sala, stats del publicador, caches) se lee en el momento del
+scrape mediante collectors, así que no cuesta nada entre scrapes.
+"""
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de 0.1 ms a 10 s
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def reset(self):
+        self._values.clear()
+
+    def render(self):
+        lines = self.header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: tuple = ()):
+        self._values[labels] = value
+
+    def dec(self, amount: float = 1, labels: tuple = ()):
+        self.inc(-amount, labels)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [conteos por bucket (no acumulados) + inf, suma, total]
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, labels: tuple = ()) -> _Timer:
+        """`with histogram.time(("etiqueta",)):` mide la duración del bloque."""
+        return _Timer(self, labels)
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def reset(self):
+        self._series.clear()
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self, collectors=()) -> str:
+        """Texto de exposición. `collectors` son callables que devuelven
+        métricas armadas al momento (p. ej. gauges leídos del ConnectionManager)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- API ---
+http_request_seconds = registry.histogram(
+    "chat_http_request_duration_seconds", "Latencia de requests HTTP por ruta", ("method", "route", "status"))
+broadcast_fanout_seconds = registry.histogram(
+    "chat_broadcast_fanout_seconds", "Tiempo de codificar y encolar un evento a todos los sockets de la sala")
+broadcast_recipients = registry.histogram(
+    "chat_broadcast_recipients", "Sockets locales alcanzados por evento",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+broker_publish_seconds = registry.histogram(
+    "chat_broker_publish_seconds", "Latencia de publish_message (encolado en el publicador)")
+broker_publish_failures = registry.counter(
+    "chat_broker_publish_failures_total", "Mensajes que el publicador no aceptó")
+db_query_seconds = registry.histogram(
+    "chat_db_query_seconds", "Duración de consultas a la DB en caminos calientes", ("query",))
+ws_frames_dropped = registry.counter(
+    "chat_ws_frames_dropped_total", "Frames descartados por colas de salida llenas (drop_oldest)")
+db_read_sessions = registry.counter(
+    "chat_db_read_sessions_total", "Sesiones de endpoints de lectura por destino", ("target",))
+ws_messages_limited = registry.counter(
+    "chat_ws_messages_limited_total", "Mensajes entrantes frenados por tamaño o tasa", ("reason", "action"))
+presence_events = registry.counter(
+    "chat_presence_events_total", "Anuncios de presencia por sala, enviados o sin cambios netos", ("result",))
+
+# --- Worker ---
+worker_consumed = registry.counter(
+    "chat_worker_messages_consumed_total", "Mensajes recibidos de la cola")
+worker_persisted = registry.counter(
+    "chat_worker_messages_persisted_total", "Filas insertadas en messages")
+worker_failures = registry.counter(
+    "chat_worker_failures_total", "Errores al persistir", ("stage",))
+worker_batch_size = registry.histogram(
+    "chat_worker_batch_size", "Mensajes por lote", buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
+worker_commit_seconds = registry.histogram(
+    "chat_worker_commit_seconds", "Duración de insert + commit de un lote")
+worker_retried = registry.counter(
+    "chat_worker_retried_total", "Mensajes reenviados a una cola de espera")
+worker_dead_lettered = registry.counter(
+    "chat_worker_dead_lettered_total", "Mensajes estacionados en la DLQ")
+worker_unacked = registry.gauge(
+    "chat_worker_unacked_messages", "Mensajes recibidos todavía sin ack")
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: latencia por ruta (la plantilla, no el path real,
+    para no explotar la cardinalidad). Los WebSockets no pasan por acá."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(time.perf_counter() - start, (scope["method"], route, str(status)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # sin una línea de log por scrape
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Expone /metrics en un hilo aparte (para procesos sin FastAPI, como el worker)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,89 @@
+# backend/app/services/persistence.py
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, cast, func, insert, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import Message, RoomCounter
+
+def build_message_rows(payloads: list[dict]) -> list[dict]:
+    """Convierte los payloads del broker en filas de 'messages'.
+
+    Se ignoran 'username' (la DB solo necesita user_id) y las notificaciones
+    de tipo 'system', que no se guardan. Se conserva el created_at asignado al
+    recibir el mensaje, el mismo que ya vieron los clientes y el cache de historial.
+    """
+    rows = []
+    for data in payloads:
+        if data.get('type') == 'system':
+            continue
+        row = {
+            "room_id": data['room_id'],
+            "user_id": data['user_id'],
+            "content": data['content'],
+            "message_id": data.get('message_id'),
+            "seq": data.get('seq'),
+        }
+        if data.get('created_at'):
+            row["created_at"] = datetime.fromisoformat(data['created_at'])
+        rows.append(row)
+    return rows
+
+def insert_messages(db: Session, rows: list[dict]):
+    """INSERT multi-fila idempotente: un message_id ya guardado (reentrega del
+    broker, reintento, spool) se ignora sin leer antes. También mantiene el
+    índice de búsqueda y los contadores por sala (no leídos) de lo que
+    efectivamente se insertó. El commit queda a cargo del llamador."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        # El tsvector se calcula en el mismo INSERT: sin UPDATE posterior ni filas muertas
+        statement = postgresql.insert(Message)\
+            .values(search_vector=func.to_tsvector(cast(settings.SEARCH_TS_CONFIG, REGCONFIG), bindparam("search_text")))\
+            .on_conflict_do_nothing(index_elements=["message_id", "created_at"])\
+            .returning(Message.room_id)
+        inserted = db.execute(statement, [{**row, "search_text": row["content"]} for row in rows]).all()
+        bump_room_counters(db, Counter(room_id for room_id, in inserted))
+    elif dialect == "sqlite":
+        # RETURNING solo trae las filas nuevas: los duplicados no se indexan dos veces
+        statement = sqlite.insert(Message)\
+            .on_conflict_do_nothing(index_elements=["message_id"])\
+            .returning(Message.id, Message.content, Message.room_id)
+        inserted = db.execute(statement, rows).all()
+        if inserted:
+            db.execute(
+                text("INSERT INTO messages_fts(rowid, content) VALUES (:id, :content)"),
+                [{"id": id_, "content": content} for id_, content, _ in inserted],
+            )
+        bump_room_counters(db, Counter(room_id for _, _, room_id in inserted))
+    else:
+        db.execute(insert(Message), rows)
+        bump_room_counters(db, Counter(row["room_id"] for row in rows))
+
+def bump_room_counters(db: Session, counts: Counter):
+    """Suma a RoomCounter los mensajes nuevos de cada sala: un UPSERT por lote,
+    en orden de sala para que dos escritores no se bloqueen en cruz."""
+    if not counts:
+        return
+    rows = [{"room_id": room_id, "message_count": count} for room_id, count in sorted(counts.items())]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = dialect_insert(RoomCounter)
+        statement = statement.on_conflict_do_update(
+            index_elements=["room_id"],
+            set_={"message_count": RoomCounter.message_count + statement.excluded.message_count},
+        )
+        db.execute(statement, rows)
+        return
+    for row in rows:
+        result = db.execute(
+            update(RoomCounter)
+            .where(RoomCounter.room_id == row["room_id"])
+            .values(message_count=RoomCounter.message_count + row["message_count"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(RoomCounter), [row])
@@ -0,0 +1,114 @@
+# backend/app/services/presence.py
+"""
+Presencia por sala: quién está conectado, en memoria y sin tocar la DB.
+
+Cada socket suma una pestaña al usuario en la sala y el usuario está en línea
+mientras le quede alguna en algún nodo. Los cambios no se anuncian en el
+momento: el ConnectionManager los junta durante PRESENCE_DEBOUNCE_SECONDS por
+sala y llama a `diff`, que compara contra lo último anunciado. Un corte y
+reconexión dentro de la ventana (deploy, red que parpadea) no genera ningún
+frame, y N reconexiones simultáneas salen en un solo evento en lugar de N
+"joined" y N "left" a cada uno de los N sockets.
+
+Con varios nodos, cada uno publica por el backplane la foto de sus usuarios
+locales por sala y guarda la de los demás (`apply_remote`). La presencia es
+la unión: cerrar la última pestaña en un nodo no es "left" si el usuario
+sigue conectado en otro. Las fotos remotas se renuevan con un latido y
+vencen si el nodo deja de mandarlas (`expire`).
+"""
+
+
+class PresenceIndex:
+    def __init__(self):
+        # sala -> user_id -> [username, pestañas abiertas en este nodo]
+        self._tabs: dict[int, dict[int, list]] = {}
+        # sala -> nodo -> (cuándo llegó, {user_id: username})
+        self._remote: dict[int, dict[str, tuple[float, dict[int, str]]]] = {}
+        # sala -> user_id -> username, tal como se anunció por última vez
+        self._announced: dict[int, dict[int, str]] = {}
+
+    def join(self, room_id: int, user_id: int, username: str):
+        entry = self._tabs.setdefault(room_id, {}).setdefault(user_id, [username, 0])
+        entry[1] += 1
+
+    def leave(self, room_id: int, user_id: int):
+        room = self._tabs.get(room_id)
+        entry = room.get(user_id) if room else None
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del room[user_id]
+            if not room:
+                del self._tabs[room_id]
+
+    def local(self, room_id: int) -> dict[int, str]:
+        """Usuarios con alguna pestaña en este nodo: la foto que se publica."""
+        return {user_id: entry[0] for user_id, entry in self._tabs.get(room_id, {}).items()}
+
+    def local_rooms(self) -> list[int]:
+        return list(self._tabs)
+
+    def apply_remote(self, room_id: int, node: str, members: dict[int, str], now: float):
+        """Reemplaza la foto de `node` para la sala; vacía, la borra."""
+        nodes = self._remote.setdefault(room_id, {})
+        if members:
+            nodes[node] = (now, members)
+        else:
+            nodes.pop(node, None)
+        if not nodes:
+            del self._remote[room_id]
+
+    def drop_node(self, node: str) -> list[int]:
+        """Olvida un nodo que se apagó. Devuelve las salas afectadas."""
+        return self._drop(lambda n, received: n == node)
+
+    def expire(self, cutoff: float) -> list[int]:
+        """Olvida las fotos recibidas antes de `cutoff` (nodo caído sin avisar)."""
+        return self._drop(lambda n, received: received < cutoff)
+
+    def _drop(self, predicate) -> list[int]:
+        affected = []
+        for room_id, nodes in list(self._remote.items()):
+            stale = [n for n, (received, _) in nodes.items() if predicate(n, received)]
+            if not stale:
+                continue
+            for n in stale:
+                del nodes[n]
+            if not nodes:
+                del self._remote[room_id]
+            affected.append(room_id)
+        return affected
+
+    def current(self, room_id: int) -> dict[int, str]:
+        """Presencia de la sala en todos los nodos."""
+        members = {}
+        for _, remote in self._remote.get(room_id, {}).values():
+            members.update(remote)
+        members.update(self.local(room_id))
+        return members
+
+    def diff(self, room_id: int) -> tuple[list[dict], list[dict]]:
+        """(entraron, salieron) desde el último anuncio, y lo marca como anunciado."""
+        current = self.current(room_id)
+        announced = self._announced.get(room_id, {})
+        joined = [{"user_id": u, "username": current[u]} for u in current.keys() - announced.keys()]
+        left = [{"user_id": u, "username": announced[u]} for u in announced.keys() - current.keys()]
+        if current:
+            self._announced[room_id] = current
+        else:
+            self._announced.pop(room_id, None)
+        key = lambda member: (member["username"], member["user_id"])
+        return sorted(joined, key=key), sorted(left, key=key)
+
+    def online(self, room_id: int) -> list[dict]:
+        """Miembros en línea según el último anuncio: lo mismo que ve un cliente
+        que aplicó todos los eventos, sin los cortes que todavía no vencieron."""
+        announced = self._announced.get(room_id, {})
+        return sorted(({"user_id": u, "username": name} for u, name in announced.items()),
+                      key=lambda member: (member["username"], member["user_id"]))
+
+    def clear(self):
+        self._tabs.clear()
+        self._remote.clear()
+        self._announced.clear()
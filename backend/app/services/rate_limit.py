@@ -0,0 +1,112 @@
+# backend/app/services/rate_limit.py
+"""
+Límite de mensajes entrantes por WebSocket: token bucket por usuario y por sala.
+
+Cada bucket es una tupla (tokens, instante) en un dict: no hay tareas ni
+timers, se recarga de forma perezosa al consultarlo. Un bucket que quedó
+inactivo lo suficiente para llenarse equivale a no tenerlo, así que al pasar
+de `max_keys` se descartan esos primero. El estado es por nodo: con varios
+nodos detrás de un balanceador el límite efectivo de una sala se multiplica.
+"""
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+POLICIES = ("drop", "delay", "disconnect")
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: dict[int, tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def wait_time(self, key: int, now: float) -> float:
+        """Segundos hasta que haya un token (0 si ya lo hay). No consume."""
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key: int, now: float):
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now)
+
+    def clear(self):
+        self._buckets.clear()
+
+    def _tokens(self, key: int, now: float) -> float:
+        item = self._buckets.get(key)
+        if item is None:
+            return self.burst
+        tokens, stamp = item
+        return min(self.burst, tokens + (now - stamp) * self.rate)
+
+    def _prune(self, now: float):
+        for key in [k for k in self._buckets if self._tokens(k, now) >= self.burst]:
+            del self._buckets[key]
+        # Todos activos: se sacrifican los más viejos (orden de inserción)
+        while len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+
+
+class InboundLimiter:
+    """Decide qué hacer con cada mensaje entrante antes del broadcast."""
+
+    def __init__(
+        self,
+        max_message_bytes: int,
+        user_rate: float,
+        user_burst: float,
+        room_rate: float,
+        room_burst: float,
+        policy: str = "drop",
+        max_delay: float = 2.0,
+        max_keys: int = 100000,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de límite desconocida: {policy}")
+        self.max_message_bytes = max_message_bytes
+        self.users = TokenBuckets(user_rate, user_burst, max_keys)
+        self.rooms = TokenBuckets(room_rate, room_burst, max_keys)
+        self.policy = policy
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_settings(cls) -> "InboundLimiter":
+        return cls(
+            settings.WS_MAX_MESSAGE_BYTES,
+            settings.WS_USER_RATE, settings.WS_USER_BURST,
+            settings.WS_ROOM_RATE, settings.WS_ROOM_BURST,
+            settings.WS_RATE_LIMIT_POLICY, settings.WS_RATE_LIMIT_MAX_DELAY,
+            settings.WS_RATE_LIMIT_MAX_KEYS,
+        )
+
+    def too_large(self, data: str) -> bool:
+        # Cada carácter ocupa entre 1 y 4 bytes en UTF-8: solo hace falta
+        # codificar cuando len() cae entre max / 4 y max
+        if len(data) * 4 <= self.max_message_bytes:
+            return False
+        if len(data) > self.max_message_bytes:
+            return True
+        return len(data.encode()) > self.max_message_bytes
+
+    def check(self, user_id: int, room_id: int, now: Optional[float] = None) -> tuple[float, str]:
+        """(espera, alcance). Con espera 0 el mensaje pasa y ya consumió sus
+        tokens; si no, `alcance` dice qué bucket lo frenó ("user" o "room")."""
+        now = time.monotonic() if now is None else now
+        user_wait = self.users.wait_time(user_id, now)
+        room_wait = self.rooms.wait_time(room_id, now)
+        if user_wait or room_wait:
+            return max(user_wait, room_wait), "user" if user_wait >= room_wait else "room"
+        self.users.take(user_id, now)
+        self.rooms.take(room_id, now)
+        return 0.0, ""
+
+    def clear(self):
+        self.users.clear()
+        self.rooms.clear()
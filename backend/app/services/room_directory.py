@@ -0,0 +1,68 @@
+# backend/app/services/room_directory.py
+"""
+Cache de la primera página del listado de salas, ya serializada.
+
+Es la página que piden todos los clientes al entrar y la que se repite en
+cada sondeo. Se guarda el cuerpo JSON listo para enviar junto con su ETag,
+así un If-None-Match que coincide se contesta 304 sin tocar la DB ni volver
+a serializar. create_room la invalida en este nodo; en los demás nodos vence
+por TTL (ROOM_LIST_CACHE_TTL).
+
+Cada invalidación sube `generation`. Quien arma la página lee la generación
+antes de consultar y la pasa a `set`: si hubo una invalidación mientras
+tanto, la página puede no tener la sala nueva y no se guarda.
+"""
+import hashlib
+import time
+from collections import namedtuple
+from typing import Optional
+
+from app.core.config import settings
+
+CachedPage = namedtuple("CachedPage", ["body", "etag", "next_cursor"])
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class RoomDirectoryCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._pages: dict[int, tuple[float, CachedPage]] = {}  # limit -> (vence, página)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, limit: int) -> Optional[CachedPage]:
+        item = self._pages.get(limit)
+        if item and item[0] > time.monotonic():
+            self.hits += 1
+            return item[1]
+        self.misses += 1
+        return None
+
+    def set(self, limit: int, body: bytes, next_cursor: Optional[str], generation: int) -> CachedPage:
+        """Guarda la página si no hubo invalidación desde `generation`; si la
+        hubo, la devuelve igual (ya está armada) pero sin cachearla."""
+        page = CachedPage(body, etag_for(body), next_cursor)
+        if generation == self.generation:
+            self._pages[limit] = (time.monotonic() + self.ttl, page)
+        return page
+
+    def invalidate(self):
+        self.generation += 1
+        self._pages.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+room_directory = RoomDirectoryCache(settings.ROOM_LIST_CACHE_TTL)
@@ -0,0 +1,136 @@
+# backend/app/services/search.py
+"""
+Búsqueda de texto en el historial, sobre el índice que mantiene el worker.
+
+PostgreSQL usa `search_vector @@ websearch_to_tsquery(...)` sobre el índice
+GIN y rankea con ts_rank_cd; SQLite usa la tabla FTS5 `messages_fts` con
+bm25. En ambos casos el puntaje es "más alto = mejor" y se pagina por keyset
+sobre (puntaje, id): el cursor no depende de la profundidad. El resaltado
+se calcula solo para las filas de la página.
+
+El resaltado marca las coincidencias con <mark>…</mark> sobre el texto tal
+cual lo mandó el usuario: el cliente tiene que escaparlo antes de mostrarlo.
+"""
+import base64
+import re
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+_WORD = re.compile(r"\w+")
+
+
+def encode_search_cursor(score: float, message_id: int) -> str:
+    # repr() de un float vuelve exacto con float(): el keyset no pierde filas
+    raw = f"{score!r}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        score, message_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return float(score), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def fts5_query(q: str) -> Optional[str]:
+    """Palabras del usuario como términos FTS5 entre comillas (AND implícito):
+    los operadores y comillas sueltas no llegan al parser de FTS5."""
+    words = _WORD.findall(q)
+    return " ".join(f'"{w}"' for w in words) if words else None
+
+
+_POSTGRES = """
+WITH hits AS (
+    SELECT m.id, ts_rank_cd(m.search_vector, query) AS score
+    FROM messages m, websearch_to_tsquery(CAST(:config AS regconfig), :q) AS query
+    WHERE m.search_vector @@ query
+      AND m.room_id IN ({rooms})
+      {after}
+    ORDER BY score DESC, m.id DESC
+    LIMIT :limit
+)
+SELECT m.id, m.message_id, m.room_id, m.user_id, u.username, m.content, m.created_at, m.seq, hits.score,
+       ts_headline(CAST(:config AS regconfig), m.content, websearch_to_tsquery(CAST(:config AS regconfig), :q),
+                   'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5') AS highlight
+FROM hits
+JOIN messages m ON m.id = hits.id
+LEFT JOIN users u ON u.id = m.user_id
+ORDER BY hits.score DESC, m.id DESC
+"""
+
+_SQLITE = """
+SELECT m.id, m.message_id, m.room_id, m.user_id, u.username, m.content, m.created_at, m.seq,
+       -bm25(messages_fts) AS score,
+       snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) AS highlight
+FROM messages_fts
+JOIN messages m ON m.id = messages_fts.rowid
+LEFT JOIN users u ON u.id = m.user_id
+WHERE messages_fts MATCH :q
+  AND m.room_id IN ({rooms})
+  {after}
+ORDER BY score DESC, m.id DESC
+LIMIT :limit
+"""
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: int,
+    q: str,
+    room_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """(resultados, cursor siguiente). Solo busca en salas donde el usuario es miembro."""
+    rooms = "SELECT room_id FROM room_members WHERE user_id = :user_id"
+    params = {"user_id": user_id, "limit": limit}
+    if room_id is not None:
+        rooms += " AND room_id = :room_id"
+        params["room_id"] = room_id
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        template, score = _POSTGRES, "ts_rank_cd(m.search_vector, query)"
+        params.update(q=q, config=settings.SEARCH_TS_CONFIG)
+    elif dialect == "sqlite":
+        template, score = _SQLITE, "-bm25(messages_fts)"
+        params["q"] = fts5_query(q)
+        if params["q"] is None:
+            return [], None
+    else:
+        raise HTTPException(status_code=501, detail="Search is not available on this database")
+
+    after = ""
+    if cursor:
+        params["after_score"], params["after_id"] = decode_search_cursor(cursor)
+        after = f"AND ({score} < :after_score OR ({score} = :after_score AND m.id < :after_id))"
+
+    rows = (await db.execute(text(template.format(rooms=rooms, after=after)), params)).mappings().all()
+    results = [{
+        "id": row["id"],
+        "message_id": row["message_id"],
+        "room_id": row["room_id"],
+        "user_id": row["user_id"],
+        "username": row["username"],
+        "content": row["content"],
+        "highlight": row["highlight"],
+        "created_at": _isoformat(row["created_at"]),
+        "seq": row["seq"],
+        "score": row["score"],
+    } for row in rows]
+    next_cursor = encode_search_cursor(rows[-1]["score"], rows[-1]["id"]) if len(rows) == limit else None
+    return results, next_cursor
+
+
+def _isoformat(value) -> Optional[str]:
+    # Con text(), SQLite devuelve el timestamp como string "YYYY-MM-DD HH:MM:SS"
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat() if value else None
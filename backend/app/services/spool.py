@@ -0,0 +1,247 @@
+# backend/app/services/spool.py
+"""
+Spool local de escritura anticipada para el publicador.
+
+Cuando RabbitMQ no está o va lento, los mensajes se agregan a archivos de
+segmento en disco (solo append) y el publicador los drena en orden cuando el
+broker vuelve. Cada registro es `largo (4 bytes) | crc32 (4 bytes) | cuerpo`;
+al abrir se descarta la cola rota del último segmento (un crash a mitad de
+escritura) y se retoma desde el último checkpoint confirmado.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Optional
+
+_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_CHECKPOINT = "checkpoint"
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# Posición en el spool: (número de segmento, offset dentro del segmento)
+Position = tuple
+
+
+class SpoolFull(Exception):
+    pass
+
+
+class Spool:
+    """Cola FIFO persistente en segmentos. No es thread-safe: el publicador la
+    usa siempre bajo su propio lock.
+
+    - `append(body)` agrega un registro (o lanza SpoolFull si se supera `max_bytes`).
+    - `read(n)` devuelve hasta n registros `(fin, cuerpo)` sin marcarlos como hechos.
+    - `commit(fin)` marca como entregado todo lo anterior a `fin`, guarda el
+      checkpoint y borra los segmentos ya consumidos.
+
+    Fsync: "always" en cada append, "interval" como mucho cada
+    `fsync_interval` segundos (en el siguiente append o commit), "never" lo
+    deja al sistema operativo.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {fsync}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.stats = {"appended": 0, "rejected": 0, "read": 0, "committed": 0, "truncated_bytes": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        # Un solo proceso por directorio: dos escritores romperían los segmentos
+        self._lock_file = open(os.path.join(directory, "LOCK"), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f"El spool {directory} está en uso por otro proceso")
+
+        self._writer = None
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._recover()
+
+    # --- Recuperación ---
+
+    def _recover(self):
+        segments = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory) if name.endswith(_SEGMENT_SUFFIX)
+        )
+        committed = self._load_checkpoint() or ((segments[0], 0) if segments else (1, 0))
+        for segment in segments:
+            if segment < committed[0]:
+                os.remove(self._path(segment))
+        self._segments = [s for s in segments if s >= committed[0]] or [committed[0]]
+
+        # Solo el último segmento puede tener un registro a medio escribir
+        last = self._segments[-1]
+        path = self._path(last)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        valid = self._valid_length(path, size)
+        if valid < size:
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+            self.stats["truncated_bytes"] += size - valid
+
+        # Un checkpoint más allá de lo que sobrevivió en disco (fsync="never")
+        # se ajusta al final válido
+        if committed[0] == last and committed[1] > valid:
+            committed = (last, valid)
+        self._committed = committed
+        self._read_pos = committed
+        self._bytes = sum(os.path.getsize(self._path(s)) for s in self._segments if os.path.exists(self._path(s)))
+        self._open_writer(last)
+
+    def _valid_length(self, path: str, size: int) -> int:
+        if size == 0:
+            return 0
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            for offset, _ in self._records(view, 0, size):
+                pass
+            return offset
+
+    @staticmethod
+    def _records(view, offset: int, size: int):
+        """Itera registros válidos desde `offset`: (offset del siguiente, cuerpo)."""
+        while offset + _HEADER.size <= size:
+            length, crc = _HEADER.unpack_from(view, offset)
+            end = offset + _HEADER.size + length
+            if end > size:
+                return
+            body = bytes(view[offset + _HEADER.size:end])
+            if zlib.crc32(body) != crc:
+                return
+            offset = end
+            yield offset, body
+
+    # --- Escritura ---
+
+    def append(self, body: bytes):
+        record = _HEADER.pack(len(body), zlib.crc32(body)) + body
+        if self._bytes + len(record) > self.max_bytes:
+            self.stats["rejected"] += 1
+            raise SpoolFull(f"Spool lleno ({self._bytes} bytes)")
+        if self._write_offset and self._write_offset + len(record) > self.segment_bytes:
+            self._roll()
+        self._writer.write(record)
+        self._write_offset += len(record)
+        self._bytes += len(record)
+        self.stats["appended"] += 1
+        self._dirty = True
+        self._maybe_sync()
+
+    def _open_writer(self, segment: int):
+        # Sin buffer: cada registro es un write() y el lector lo ve de inmediato
+        self._writer = open(self._path(segment), "ab", buffering=0)
+        self._write_segment = segment
+        self._write_offset = self._writer.tell()
+
+    def _roll(self):
+        self.sync()
+        self._writer.close()
+        segment = self._write_segment + 1
+        self._segments.append(segment)
+        self._open_writer(segment)
+
+    def _maybe_sync(self):
+        if self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        if self._dirty and self.fsync != "never":
+            os.fsync(self._writer.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    # --- Lectura / confirmación ---
+
+    def read(self, max_records: int) -> list[tuple[Position, bytes]]:
+        out = []
+        segment, offset = self._read_pos
+        while len(out) < max_records:
+            size = self._write_offset if segment == self._write_segment else os.path.getsize(self._path(segment))
+            if offset < size:
+                with open(self._path(segment), "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+                    for offset, body in self._records(view, offset, size):
+                        out.append(((segment, offset), body))
+                        if len(out) == max_records:
+                            break
+            if len(out) == max_records or segment == self._write_segment:
+                break
+            segment, offset = segment + 1, 0
+        self._read_pos = (segment, offset)
+        self.stats["read"] += len(out)
+        return out
+
+    def commit(self, position: Position):
+        """Todo lo anterior a `position` ya fue entregado al broker."""
+        if position <= self._committed:
+            return
+        self._committed = position
+        self._save_checkpoint(position)
+        for segment in [s for s in self._segments if s < position[0]]:
+            self._bytes -= os.path.getsize(self._path(segment))
+            os.remove(self._path(segment))
+            self._segments.remove(segment)
+        self.stats["committed"] += 1
+
+    def rewind(self):
+        """Vuelve a leer desde el último commit (lo leído sin confirmar se reenvía)."""
+        self._read_pos = self._committed
+
+    def unread(self) -> bool:
+        return self._read_pos != (self._write_segment, self._write_offset)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def close(self):
+        if self._writer is not None:
+            self.sync()
+            self._writer.close()
+            self._writer = None
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+    # --- Archivos ---
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:016d}{_SEGMENT_SUFFIX}")
+
+    def _load_checkpoint(self) -> Optional[Position]:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_checkpoint(self, position: Position):
+        path = os.path.join(self.directory, _CHECKPOINT)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{position[0]} {position[1]}")
+            if self.fsync == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._maybe_sync()
@@ -0,0 +1,230 @@
+# backend/app/services/worker_pool.py
+"""
+Worker de persistencia en varios procesos, particionado por sala.
+
+El proceso padre consume de RabbitMQ y reparte cada mensaje al hijo
+`room_id % N`: una sala siempre cae en el mismo hijo, que la inserta en
+orden, mientras que salas distintas se persisten en paralelo. Los hijos
+devuelven los delivery_tags ya persistidos y el padre confirma con un ack
+múltiple hasta el primer tag que todavía está pendiente en algún hijo.
+"""
+import json
+import multiprocessing
+import queue
+import signal
+import time
+from collections import deque
+
+from app.services import metrics
+from app.services.dead_letter import describe_error, retry_policy
+
+
+def shard_for(room_id, shards: int) -> int:
+    return (room_id or 0) % shards
+
+
+def _persist(session_factory, batch):
+    """Inserta un lote; si falla, mensaje a mensaje.
+    Devuelve (ok, [(tag, error, transitorio), ...], filas)."""
+    from app.services.persistence import build_message_rows, insert_messages
+
+    db = session_factory()
+    try:
+        rows = build_message_rows([json.loads(body) for _, body in batch])
+        insert_messages(db, rows)
+        db.commit()
+        return [tag for tag, _ in batch], [], len(rows)
+    except Exception as e:
+        print(f" [!] Error saving batch to DB, falling back to per-message inserts: {e}")
+        db.rollback()
+        ok, failed, persisted = [], [], 0
+        for tag, body in batch:
+            try:
+                rows = build_message_rows([json.loads(body)])
+                insert_messages(db, rows)
+                db.commit()
+                ok.append(tag)
+                persisted += len(rows)
+            except Exception as e:
+                print(f" [!] Error saving to DB: {e}")
+                db.rollback()
+                failed.append((tag, *describe_error(e)))
+        return ok, failed, persisted
+    finally:
+        db.close()
+
+
+def _shard_main(shard: int, inbox, results, database_url: str, batch_size: int, flush_interval: float):
+    # Ctrl+C llega a todo el grupo de procesos: el hijo solo termina con el
+    # centinela del padre, después de vaciar su lote
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine(database_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    batch, deadline, running = [], None, True
+    while running:
+        timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+        try:
+            item = inbox.get(timeout=timeout)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            running = False
+        elif item:
+            batch.append(item)
+            deadline = deadline or time.monotonic() + flush_interval
+        if batch and (not running or len(batch) >= batch_size or time.monotonic() >= deadline):
+            start = time.perf_counter()
+            ok, failed, rows = _persist(session_factory, batch)
+            results.put((shard, ok, failed, rows, len(batch), time.perf_counter() - start))
+            batch, deadline = [], None
+    engine.dispose()
+
+
+class ShardedDispatcher:
+    """Reparte entregas de un canal entre N procesos hijos y hace los acks."""
+
+    def __init__(self, channel, shards: int, batch_size: int, flush_interval: float, database_url: str = None):
+        from app.core.config import settings
+
+        self.channel = channel
+        self.shards = shards
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.database_url = database_url or settings.DATABASE_URL
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._inboxes = [None] * shards
+        self._processes = [None] * shards
+        self._assigned = [set() for _ in range(shards)]  # tags en manos de cada hijo
+        self._outstanding = deque()  # tags en orden de entrega, sin ack
+        self._done = set()           # persistidos, a confirmar con el próximo ack múltiple
+        self._settled = set()        # ya confirmados o devueltos de a uno: el ack múltiple no los apunta
+        self._messages = {}          # tag -> (cuerpo, properties), para reintentos
+        self.stats = {"dispatched": 0, "acked": 0, "nacked": 0, "retried": 0, "restarts": 0}
+
+    def start(self):
+        for shard in range(self.shards):
+            self._spawn(shard)
+
+    def _spawn(self, shard: int):
+        self._inboxes[shard] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_shard_main,
+            args=(shard, self._inboxes[shard], self._results, self.database_url, self.batch_size, self.flush_interval),
+            name=f"worker-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[shard] = process
+
+    def dispatch(self, delivery_tag: int, body: bytes, properties=None):
+        try:
+            room_id = json.loads(body).get("room_id")
+        except (ValueError, AttributeError):
+            room_id = None  # el hijo lo rechaza al persistir
+        shard = shard_for(room_id if isinstance(room_id, int) else None, self.shards)
+        self._outstanding.append(delivery_tag)
+        self._assigned[shard].add(delivery_tag)
+        self._messages[delivery_tag] = (body, properties)
+        self._inboxes[shard].put((delivery_tag, body))
+        self.stats["dispatched"] += 1
+        metrics.worker_consumed.inc()
+        metrics.worker_unacked.set(len(self._outstanding))
+
+    def in_flight(self) -> int:
+        return sum(len(tags) for tags in self._assigned)
+
+    def collect(self, timeout: float = 0.0):
+        """Procesa los resultados de los hijos y confirma lo que se pueda."""
+        while True:
+            try:
+                shard, ok, failed, rows, size, seconds = self._results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            timeout = 0.0
+            failed_tags = [tag for tag, _, _ in failed]
+            self._assigned[shard].difference_update(ok)
+            self._assigned[shard].difference_update(failed_tags)
+            self._retry(failed)
+            self._done.update(ok)
+            self._settled.update(failed_tags)
+            metrics.worker_batch_size.observe(size)
+            metrics.worker_commit_seconds.observe(seconds)
+            metrics.worker_persisted.inc(rows)
+            if failed:
+                metrics.worker_failures.inc(len(failed), ("message",))
+        self._ack_done()
+
+    def check_children(self):
+        """Si un hijo murió, lo que tenía asignado vuelve a la cola y se lo reemplaza."""
+        dead = [s for s, p in enumerate(self._processes) if p is not None and not p.is_alive()]
+        if dead:
+            self.collect()  # lo que alcanzó a reportar antes de morir ya está persistido
+        for shard in dead:
+            print(f" [!] Worker shard {shard} died (exit code {self._processes[shard].exitcode}), restarting")
+            self._release(shard)
+            self.stats["restarts"] += 1
+            self._spawn(shard)
+        self._ack_done()
+
+    def close(self, timeout: float = 10.0):
+        """Apagado ordenado: cada hijo vacía su lote y termina. Lo que no se
+        llegó a persistir se devuelve a la cola para que lo tome otro worker."""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        deadline = time.monotonic() + timeout
+        while self.in_flight() and time.monotonic() < deadline:
+            self.collect(timeout=0.1)
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.collect()
+        for shard in range(self.shards):
+            self._release(shard)
+        self._ack_done()
+        self._processes = [None] * self.shards
+
+    def _release(self, shard: int):
+        tags = sorted(self._assigned[shard])
+        self._assigned[shard].clear()
+        self._nack(tags)
+        self._settled.update(tags)
+
+    def _ack_done(self):
+        # El ack múltiple apunta al último tag sin confirmar del tramo contiguo:
+        # los ya asentados de a uno quedan cubiertos sin volver a nombrarlos
+        # (el broker cierra el canal ante un tag desconocido)
+        last, count = None, 0
+        while self._outstanding and (self._outstanding[0] in self._done or self._outstanding[0] in self._settled):
+            tag = self._outstanding.popleft()
+            self._messages.pop(tag, None)
+            if tag in self._settled:
+                self._settled.discard(tag)
+                continue
+            self._done.discard(tag)
+            last = tag
+            count += 1
+        if last is not None and self.channel.is_open:
+            self.channel.basic_ack(delivery_tag=last, multiple=True)
+            self.stats["acked"] += count
+        metrics.worker_unacked.set(len(self._outstanding))
+
+    def _retry(self, failed):
+        # Los reintentos publican y hacen ack de ese tag: quedan en _settled y
+        # el ack múltiple posterior no lo nombra
+        for tag, error, transient in failed:
+            body, properties = self._messages[tag]
+            if self.channel.is_open:
+                retry_policy.reject(self.channel, tag, body, properties, error, transient)
+            self.stats["retried"] += 1
+
+    def _nack(self, tags):
+        for tag in tags:
+            if self.channel.is_open:
+                self.channel.basic_nack(delivery_tag=tag, requeue=True)
+            self.stats["nacked"] += 1
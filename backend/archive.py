@@ -0,0 +1,71 @@
+# backend/archive.py
+"""
+Particiones y archivo del historial de mensajes.
+
+    python archive.py partitions                 # crea las de los próximos meses
+    python archive.py run                        # archiva lo anterior a MESSAGE_RETENTION_MONTHS
+    python archive.py run --retention-months 6 --dir /var/lib/chat/archive
+    python archive.py list --room 12
+
+Pensado para correr una vez por día (cron). Los segmentos quedan en
+MESSAGE_ARCHIVE_DIR, que la API tiene que poder leer para servir el
+historial viejo.
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import MessageArchive
+from app.services.archive import archive_expired, ensure_partitions
+
+def partitions(db, args):
+    created = ensure_partitions(db, args.months_ahead)
+    print("\n".join(created) if created else "Nada que crear (o messages no está particionada)")
+
+def run(db, args):
+    if not args.dir:
+        print("Falta --dir o MESSAGE_ARCHIVE_DIR")
+        return
+    ensure_partitions(db)
+    archived = archive_expired(db, args.dir, args.retention_months)
+    for month, count in archived.items():
+        print(f"{month}: {count} mensajes archivados")
+    if not archived:
+        print("Nada para archivar")
+
+def list_archives(db, args):
+    query = select(MessageArchive).order_by(MessageArchive.room_id, MessageArchive.month)
+    if args.room is not None:
+        query = query.filter(MessageArchive.room_id == args.room)
+    for archive in db.execute(query).scalars():
+        print(f"room={archive.room_id} month={archive.month} messages={archive.message_count} path={archive.path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Particiones y archivo de mensajes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("partitions")
+    p.add_argument("--months-ahead", type=int, default=settings.MESSAGE_PARTITIONS_AHEAD)
+    p.set_defaults(func=partitions)
+    p = commands.add_parser("run")
+    p.add_argument("--retention-months", type=int, default=settings.MESSAGE_RETENTION_MONTHS)
+    p.add_argument("--dir", default=settings.MESSAGE_ARCHIVE_DIR)
+    p.set_defaults(func=run)
+    p = commands.add_parser("list")
+    p.add_argument("--room", type=int, default=None)
+    p.set_defaults(func=list_archives)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        args.func(db, args)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# backend/benchmarks/bench_broadcast.py
+"""
+Micro-benchmark del costo de CPU de un broadcast según el tamaño de la sala.
+
+Compara el camino anterior (send_json por destinatario: un json.dumps por
+socket) contra el actual (encode_frame una vez + send_text del mismo frame).
+No necesita red: los sockets son objetos en memoria que descartan lo enviado.
+
+    python benchmarks/bench_broadcast.py --sizes 10 100 1000 5000 --broadcasts 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routers.chat import ConnectionManager, orjson
+
+MESSAGE = {
+    "room_id": 1,
+    "user_id": 42,
+    "username": "benchmark_user",
+    "content": "Hola a todos, este es un mensaje de tamaño típico para la sala " * 2,
+    "created_at": "2025-01-01T18:00:00+00:00",
+}
+
+class NullSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        pass
+
+    async def send_json(self, message):
+        # Igual que Starlette: serializa en cada llamada
+        await self.send_text(json.dumps(message, separators=(",", ":")))
+
+async def bench_per_recipient(size: int, broadcasts: int) -> float:
+    sockets = [NullSocket() for _ in range(size)]
+    start = time.process_time()
+    for _ in range(broadcasts):
+        for ws in sockets:
+            await ws.send_json(MESSAGE)
+    return time.process_time() - start
+
+async def bench_encode_once(size: int, broadcasts: int) -> float:
+    manager = ConnectionManager(send_queue_size=broadcasts + 1)
+    sockets = [NullSocket() for _ in range(size)]
+    for ws in sockets:
+        await manager.connect(ws, 1)
+    start = time.process_time()
+    for _ in range(broadcasts):
+        await manager.broadcast(MESSAGE, 1)
+    # Incluye el trabajo de las tareas escritoras hasta vaciar las colas
+    while any(c.queue.qsize() for c in manager.active_connections[1].values()):
+        await asyncio.sleep(0)
+    elapsed = time.process_time() - start
+    for ws in sockets:
+        manager.disconnect(ws, 1)
+    return elapsed
+
+async def main(sizes, broadcasts):
+    encoder = "orjson" if orjson is not None else "json"
+    print(f"{broadcasts} broadcasts por sala, encoder={encoder}")
+    print(f"{'sala':>8} {'antes (ms)':>12} {'después (ms)':>14} {'µs/destinatario antes':>24} {'después':>10}")
+    for size in sizes:
+        before = await bench_per_recipient(size, broadcasts)
+        after = await bench_encode_once(size, broadcasts)
+        per_before = before / (size * broadcasts) * 1e6
+        per_after = after / (size * broadcasts) * 1e6
+        print(f"{size:>8} {before * 1000:>12.1f} {after * 1000:>14.1f} {per_before:>24.2f} {per_after:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--broadcasts", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.broadcasts))
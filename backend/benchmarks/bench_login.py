@@ -0,0 +1,62 @@
+# backend/benchmarks/bench_login.py
+"""
+Throughput de login (bcrypt verify) según costo de bcrypt y tamaño del pool.
+
+Cada login ejecuta un verify; se lanzan `--concurrency` logins en paralelo
+contra un PasswordHasher y se reportan logins/seg y rechazos 503.
+No necesita DB ni red.
+
+    python benchmarks/bench_login.py --rounds 8 10 12 --workers 0 1 2 4 --logins 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from app.services.hashing import PasswordHasher, _hash
+
+async def run(hasher: PasswordHasher, hashed: str, logins: int, concurrency: int):
+    rejected = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        nonlocal rejected
+        async with semaphore:
+            try:
+                await hasher.verify("password123", hashed)
+            except HTTPException:
+                rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return time.perf_counter() - start, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[8, 10, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4],
+                        help="0 = threadpool compartido (comportamiento anterior)")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="logins simultáneos (bots de simulate.py)")
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>6} {'workers':>8} {'logins/seg':>11} {'p. medio (ms)':>14} {'503':>5}")
+    for rounds in args.rounds:
+        hashed = _hash("password123", rounds)
+        for workers in args.workers:
+            hasher = PasswordHasher(workers, args.max_pending, rounds)
+            hasher.start()
+            # Calentar el pool para no medir el arranque de los procesos
+            asyncio.run(run(hasher, hashed, max(workers, 1), max(workers, 1)))
+            elapsed, rejected = asyncio.run(run(hasher, hashed, args.logins, args.concurrency))
+            hasher.stop()
+            ok = args.logins - rejected
+            print(f"{rounds:>6} {workers:>8} {ok / elapsed:>11.1f} {elapsed / args.logins * 1000:>14.2f} {rejected:>5}")
+
+if __name__ == "__main__":
+    main()
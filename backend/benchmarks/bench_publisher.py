@@ -0,0 +1,84 @@
+# backend/benchmarks/bench_publisher.py
+"""
+Compara msgs/seg del publicador persistente contra el camino anterior
+(una conexión AMQP por mensaje). Requiere RabbitMQ accesible en BROKER_URL.
+
+    python benchmarks/bench_publisher.py --messages 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pika
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.broker import BrokerPublisher
+
+BENCH_QUEUE = "bench_chat_messages"
+
+def publish_per_connection(message_data: dict):
+    """Camino anterior: handshake TCP+AMQP, declare, publish y close por mensaje."""
+    connection = pika.BlockingConnection(pika.URLParameters(settings.BROKER_URL))
+    channel = connection.channel()
+    channel.queue_declare(queue=BENCH_QUEUE, durable=True)
+    channel.basic_publish(
+        exchange='',
+        routing_key=BENCH_QUEUE,
+        body=json.dumps(message_data),
+        properties=pika.BasicProperties(delivery_mode=2))
+    connection.close()
+
+def payload(i: int) -> dict:
+    return {"room_id": 1, "user_id": 1, "username": "bench", "content": f"mensaje {i}", "created_at": str(time.time())}
+
+def bench_per_connection(n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        publish_per_connection(payload(i))
+    return n / (time.perf_counter() - start)
+
+def bench_persistent(n: int) -> float:
+    publisher = BrokerPublisher(settings.BROKER_URL, queue=BENCH_QUEUE, max_buffer=n + 1)
+    publisher.start()
+    # Esperar a que la conexión esté lista para no medir el handshake inicial
+    while not publisher.ready:
+        time.sleep(0.01)
+    start = time.perf_counter()
+    for i in range(n):
+        publisher.publish(payload(i))
+    publisher.flush(timeout=60)
+    elapsed = time.perf_counter() - start
+    confirmed = publisher.stats["confirmed"]
+    publisher.stop()
+    if confirmed < n:
+        print(f"  (solo {confirmed}/{n} confirmados)")
+    return confirmed / elapsed
+
+def purge():
+    connection = pika.BlockingConnection(pika.URLParameters(settings.BROKER_URL))
+    channel = connection.channel()
+    channel.queue_declare(queue=BENCH_QUEUE, durable=True)
+    channel.queue_purge(queue=BENCH_QUEUE)
+    connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--legacy-messages", type=int, default=None,
+                        help="mensajes para el camino por conexión (por defecto igual a --messages)")
+    args = parser.parse_args()
+
+    purge()
+    legacy = bench_per_connection(args.legacy_messages or args.messages)
+    persistent = bench_persistent(args.messages)
+    purge()
+
+    print(f"Conexión por mensaje : {legacy:10.1f} msgs/seg")
+    print(f"Publicador persistente: {persistent:10.1f} msgs/seg  (x{persistent / legacy:.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# backend/benchmarks/bench_worker_shards.py
+"""
+Throughput del worker particionado por sala según la cantidad de procesos.
+
+No necesita RabbitMQ: las entregas se inyectan directo en el ShardedDispatcher
+con un canal falso que registra los acks. Sí escribe en la DB de DATABASE_URL
+(usar PostgreSQL para medir paralelismo real: SQLite serializa las escrituras).
+Al final verifica que el orden dentro de cada sala se haya respetado.
+
+    python benchmarks/bench_worker_shards.py --processes 1 2 4 8 --messages 20000 --rooms 64
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import Base, SessionLocal, engine
+from app.models.models import Message, Room, User
+from app.services.worker_pool import ShardedDispatcher
+
+class CountingChannel:
+    is_open = True
+
+    def __init__(self):
+        self.acked_until = 0
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked_until = delivery_tag
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        raise RuntimeError(f"nack inesperado: {delivery_tag}")
+
+def prepare(rooms: int) -> tuple[int, list[int]]:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(username=f"bench_shards_{time.time_ns()}", password_hash="x")
+        db.add(user)
+        room_objs = [Room(name=f"bench_shards_{time.time_ns()}_{i}", is_private=False) for i in range(rooms)]
+        db.add_all(room_objs)
+        db.commit()
+        return user.id, [r.id for r in room_objs]
+    finally:
+        db.close()
+
+def check_order(room_ids: list[int], run: str):
+    db = SessionLocal()
+    try:
+        for room_id in room_ids:
+            seqs = [int(c.split(":")[2]) for (c,) in db.query(Message.content)
+                    .filter(Message.room_id == room_id, Message.content.like(f"{run}:%"))
+                    .order_by(Message.id)]
+            assert seqs == sorted(seqs), f"orden roto en sala {room_id}"
+    finally:
+        db.close()
+
+def run(processes: int, messages: int, user_id: int, room_ids: list[int], batch_size: int) -> float:
+    run_id = f"p{processes}-{time.time_ns()}"
+    bodies = [
+        json.dumps({"room_id": room_ids[i % len(room_ids)], "user_id": user_id, "content": f"{run_id}:{i % len(room_ids)}:{i}"}).encode()
+        for i in range(messages)
+    ]
+    channel = CountingChannel()
+    dispatcher = ShardedDispatcher(channel, processes, batch_size=batch_size, flush_interval=0.05)
+    dispatcher.start()
+    try:
+        # Calentamiento: un mensaje por hijo para no medir el arranque de los procesos
+        warmup_rooms = [next((r for r in room_ids if r % processes == shard), room_ids[0]) for shard in range(processes)]
+        warmup = [json.dumps({"room_id": r, "user_id": user_id, "content": "warmup"}).encode() for r in warmup_rooms]
+        for tag, body in enumerate(warmup, start=1):
+            dispatcher.dispatch(tag, body)
+        while channel.acked_until < len(warmup):
+            dispatcher.collect(timeout=0.05)
+
+        start = time.perf_counter()
+        for tag, body in enumerate(bodies, start=len(warmup) + 1):
+            dispatcher.dispatch(tag, body)
+            if tag % batch_size == 0:
+                dispatcher.collect()
+        while channel.acked_until < len(warmup) + messages:
+            dispatcher.collect(timeout=0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        dispatcher.close()
+    check_order(room_ids, run_id)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--rooms", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    user_id, room_ids = prepare(args.rooms)
+    print(f"{args.messages} mensajes en {args.rooms} salas, lotes de {args.batch_size}")
+    print(f"{'procesos':>9} {'segundos':>9} {'msgs/s':>10}")
+    for processes in args.processes:
+        elapsed = run(processes, args.messages, user_id, room_ids, args.batch_size)
+        print(f"{processes:>9} {elapsed:>9.2f} {args.messages / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
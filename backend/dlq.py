@@ -0,0 +1,98 @@
+# backend/dlq.py
+"""
+Inspección y reinyección de la cola de mensajes muertos (chat_messages.dlq).
+
+    python dlq.py stats
+    python dlq.py list --limit 20
+    python dlq.py replay --limit 100      # vuelven a chat_messages con el contador en 0
+    python dlq.py purge --yes
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pika
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services.broker import QUEUE_NAME
+from app.services.dead_letter import DEAD_LETTERED_AT_HEADER, DLQ_NAME, ERROR_HEADER, RETRY_HEADER
+
+def connect():
+    connection = pika.BlockingConnection(pika.URLParameters(settings.BROKER_URL))
+    channel = connection.channel()
+    channel.queue_declare(queue=DLQ_NAME, durable=True)
+    return connection, channel
+
+def stats(channel, args):
+    result = channel.queue_declare(queue=DLQ_NAME, durable=True, passive=True)
+    print(f"{DLQ_NAME}: {result.method.message_count} mensajes")
+
+def list_messages(channel, args):
+    # Sin ack: al cerrar la conexión los mensajes vuelven a la DLQ en su lugar
+    for i in range(args.limit):
+        method, properties, body = channel.basic_get(queue=DLQ_NAME, auto_ack=False)
+        if method is None:
+            break
+        headers = properties.headers or {}
+        print(f"#{i + 1} retries={headers.get(RETRY_HEADER, 0)} dead_lettered_at={headers.get(DEAD_LETTERED_AT_HEADER, '-')}")
+        print(f"    error: {headers.get(ERROR_HEADER, '-')}")
+        try:
+            print(f"    body:  {json.dumps(json.loads(body), ensure_ascii=False)[:args.width]}")
+        except ValueError:
+            print(f"    body:  {body[:args.width]!r}")
+
+def replay(channel, args):
+    channel.confirm_delivery()
+    replayed = 0
+    while args.limit is None or replayed < args.limit:
+        method, properties, body = channel.basic_get(queue=DLQ_NAME, auto_ack=False)
+        if method is None:
+            break
+        headers = {k: v for k, v in (properties.headers or {}).items() if k not in (RETRY_HEADER, ERROR_HEADER)}
+        headers["x-replayed-at"] = datetime.now(timezone.utc).isoformat()
+        # Se confirma el reenvío antes de sacarlo de la DLQ
+        channel.basic_publish(
+            exchange="",
+            routing_key=QUEUE_NAME,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers),
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        replayed += 1
+    print(f"{replayed} mensajes reinyectados en {QUEUE_NAME}")
+
+def purge(channel, args):
+    if not args.yes:
+        print("Usar --yes para confirmar el borrado de la DLQ")
+        return
+    result = channel.queue_purge(queue=DLQ_NAME)
+    print(f"{result.method.message_count} mensajes borrados")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Herramientas para la DLQ del worker")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats").set_defaults(func=stats)
+    p = commands.add_parser("list")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--width", type=int, default=200)
+    p.set_defaults(func=list_messages)
+    p = commands.add_parser("replay")
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=replay)
+    p = commands.add_parser("purge")
+    p.add_argument("--yes", action="store_true")
+    p.set_defaults(func=purge)
+    args = parser.parse_args(argv)
+
+    connection, channel = connect()
+    try:
+        args.func(channel, args)
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,64 @@
+import os
+import tempfile
+
+# bcrypt barato y en el threadpool: los tests no deben pagar el costo de
+# producción ni levantar procesos en cada lifespan (ver test_hashing.py)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("HASH_POOL_WORKERS", "0")
+# Presencia sin debounce: el evento llega justo después de conectar, como el
+# antiguo "joined" (el debounce se prueba aparte en test_presence.py)
+os.environ.setdefault("PRESENCE_DEBOUNCE_SECONDS", "0")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from app.main import app
-from app.core.database import Base, get_db
+from app.services import broker
+from app.services.embedded_queue import EmbeddedQueue
+from app.services.persistence import build_message_rows, insert_messages
+from app.core.database import Base, configure_sqlite, get_db, get_async_db, get_async_sessionmaker, get_read_db, get_read_sessionmaker
 
-# 1. Configurar SQLite en memoria para tests
-SQLALCHEMY_DATABASE_URL = "sqlite://"
+# 1. Configurar SQLite para tests. Es un archivo temporal (no ':memory:') para
+#    que el motor síncrono y el asíncrono vean la misma base de datos.
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
     connect_args={"check_same_thread": False}, 
-    poolclass=StaticPool
 )
+configure_sqlite(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: cada TestClient corre su propio event loop y las conexiones
+# de aiosqlite no deben compartirse entre loops
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+configure_sqlite(async_engine.sync_engine)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+def override_dependencies(target_app):
+    """Reemplaza las dependencias reales (Postgres) por las de Test (SQLite)"""
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    target_app.dependency_overrides[get_db] = override_get_db
+    target_app.dependency_overrides[get_async_db] = override_get_async_db
+    target_app.dependency_overrides[get_async_sessionmaker] = lambda: TestingAsyncSessionLocal
+    target_app.dependency_overrides[get_read_db] = override_get_async_db
+    target_app.dependency_overrides[get_read_sessionmaker] = lambda: TestingAsyncSessionLocal
+
 # 2. Fixture para la Base de Datos
 @pytest.fixture(scope="function")
 def db_session():
@@ -29,18 +71,24 @@ def db_session():
         db.close()
         Base.metadata.drop_all(bind=engine)
 
-# 3. Fixture para el Cliente (Sobreescribiendo la dependencia de DB)
+# 3. Fixture para el Cliente (Sobreescribiendo las dependencias de DB)
 @pytest.fixture(scope="function")
-def client(db_session):
-    """Cliente de pruebas que usa la DB temporal"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            db_session.close()
-    
-    # Reemplazamos la dependencia real (Postgres) por la de Test (SQLite)
-    app.dependency_overrides[get_db] = override_get_db
+def client(db_session, monkeypatch):
+    """Cliente de pruebas que usa la DB temporal. Los mensajes se persisten
+    con la cola embebida (sin RabbitMQ): envío -> DB -> historial de punta a punta."""
+    monkeypatch.setattr(broker, "publisher", EmbeddedQueue(TestingSessionLocal, flush_interval=0))
+    override_dependencies(app)
     with TestClient(app) as c:
         yield c
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+# 4. Helpers compartidos: sala creada por la API y mensajes guardados por el
+#    mismo camino que el worker (insert_messages), sin pasar por el socket
+def persist(db_session, room_id, user_id, contents):
+    payloads = [{"room_id": room_id, "user_id": user_id, "content": c, "message_id": f"{room_id}-{i}"}
+                for i, c in enumerate(contents)]
+    insert_messages(db_session, build_message_rows(payloads))
+    db_session.commit()
+
+def make_room(client, headers, name):
+    return client.post("/rooms/", json={"name": name}, headers=headers).json()["id"]
@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select, text
+
+from app.core.config import settings
+from app.models.models import Message, MessageArchive, User
+from app.services.archive import archive_expired, segment_path
+from app.services.persistence import insert_messages
+from tests.test_flow import get_auth_headers
+
+NOW = datetime(2025, 6, 15, tzinfo=timezone.utc)
+
+def seed(db_session, room_id, user_id, month, count, prefix):
+    insert_messages(db_session, [{
+        "room_id": room_id, "user_id": user_id, "content": f"{prefix} {i}",
+        "message_id": f"{prefix}-{i}", "created_at": datetime(2025, month, 1 + i, tzinfo=timezone.utc),
+    } for i in range(count)])
+    db_session.commit()
+
+def test_expired_months_move_to_segments_and_out_of_the_db(client, db_session, tmp_path):
+    headers, _ = get_auth_headers(client, "archivist")
+    room_id = client.post("/rooms/", json={"name": "Vieja"}, headers=headers).json()["id"]
+    user = db_session.query(User).filter_by(username="archivist").first()
+    seed(db_session, room_id, user.id, 1, 3, "enero")
+    seed(db_session, room_id, user.id, 2, 2, "febrero")
+    seed(db_session, room_id, user.id, 6, 2, "junio")
+
+    assert archive_expired(db_session, str(tmp_path), retention_months=3, now=NOW) == {"2025-01": 3, "2025-02": 2}
+    assert db_session.execute(select(func.count()).select_from(Message)).scalar() == 2
+    assert db_session.execute(text("SELECT count(*) FROM messages_fts")).scalar() == 2
+    catalog = db_session.execute(select(MessageArchive).order_by(MessageArchive.month)).scalars().all()
+    assert [(a.month, a.message_count) for a in catalog] == [("2025-01", 3), ("2025-02", 2)]
+    assert os.path.exists(tmp_path / segment_path(datetime(2025, 1, 1), room_id))
+
+    # Volver a correrlo no duplica ni pierde nada
+    assert archive_expired(db_session, str(tmp_path), retention_months=3, now=NOW) == {}
+    assert db_session.execute(select(func.count()).select_from(MessageArchive)).scalar() == 2
+
+def test_history_continues_into_the_archive(client, db_session, tmp_path, monkeypatch):
+    headers, _ = get_auth_headers(client, "reader")
+    room_id = client.post("/rooms/", json={"name": "Larga"}, headers=headers).json()["id"]
+    user = db_session.query(User).filter_by(username="reader").first()
+    seed(db_session, room_id, user.id, 1, 3, "enero")
+    seed(db_session, room_id, user.id, 6, 2, "junio")
+    archive_expired(db_session, str(tmp_path), retention_months=3, now=NOW)
+
+    # Sin directorio configurado, el historial termina en la DB
+    first = client.get(f"/rooms/{room_id}/messages?limit=2", headers=headers)
+    cursor = first.headers["X-Next-Cursor"]
+    assert client.get(f"/rooms/{room_id}/messages?limit=2&before={cursor}", headers=headers).json() == []
+
+    monkeypatch.setattr(settings, "MESSAGE_ARCHIVE_DIR", str(tmp_path))
+    contents = [m["content"] for m in first.json()]
+    while cursor:
+        page = client.get(f"/rooms/{room_id}/messages?limit=2&before={cursor}", headers=headers)
+        contents += [m["content"] for m in page.json()]
+        cursor = page.headers.get("X-Next-Cursor")
+    assert contents == ["junio 1", "junio 0", "enero 2", "enero 1", "enero 0"]
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.services import auth_cache
+from app.services.auth_cache import TTLCache
+from tests.test_flow import get_auth_headers
+
+def test_ttl_cache_expiry_and_size_bound():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, expires_at=time.time() - 1)  # ya vencido (p. ej. exp del token)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    cache.set("c", 3)
+    cache.set("d", 4)  # desaloja la entrada menos usada
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["hits"] == 1
+
+def test_reconnects_hit_the_cache(client):
+    headers, token = get_auth_headers(client, "reconnector")
+    room_id = client.post("/rooms/", json={"name": "Cached"}, headers=headers).json()["id"]
+
+    for _ in range(3):
+        with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+            websocket.receive_json()
+
+    stats = auth_cache.stats()
+    assert stats["tokens"]["hits"] >= 3
+    assert stats["users"]["hits"] >= 2
+    assert stats["memberships"]["hits"] >= 3  # create_room ya dejó la membresía en cache
+
+def test_join_invalidates_cached_non_membership(client):
+    headers_owner, _ = get_auth_headers(client, "owner")
+    room_id = client.post("/rooms/", json={"name": "Late Join"}, headers=headers_owner).json()["id"]
+    headers, token = get_auth_headers(client, "latecomer")
+
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+            websocket.receive_json()
+
+    client.post(f"/rooms/{room_id}/join", json={}, headers=headers)
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        assert [m["username"] for m in websocket.receive_json()["joined"]] == ["latecomer"]
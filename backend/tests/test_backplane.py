@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+from app.main import create_app
+from app.services.backplane import InMemoryBackplane, InMemoryHub
+from tests.conftest import override_dependencies
+from tests.test_flow import get_auth_headers
+
+def make_node(hub):
+    node = create_app(InMemoryBackplane(hub))
+    override_dependencies(node)
+    return node
+
+def receive_message(ws):
+    """Próximo mensaje de chat, salteando la presencia (puede llegar en más de un evento)."""
+    while True:
+        data = ws.receive_json()
+        if data.get("type") != "presence":
+            return data
+
+def test_messages_cross_between_app_instances(client):
+    headers_a, token_a = get_auth_headers(client, "alice")
+    headers_b, token_b = get_auth_headers(client, "bob")
+    room_id = client.post("/rooms/", json={"name": "Multi Nodo"}, headers=headers_a).json()["id"]
+    client.post(f"/rooms/{room_id}/join", json={}, headers=headers_b)
+
+    # Dos instancias de la app en el mismo proceso, unidas por el mismo hub
+    hub = InMemoryHub()
+    with TestClient(make_node(hub)) as node_a, TestClient(make_node(hub)) as node_b:
+        with node_b.websocket_connect(f"/ws/{room_id}?token={token_b}") as ws_b:
+            assert ws_b.receive_json()["joined"][0]["username"] == "bob"
+            with node_a.websocket_connect(f"/ws/{room_id}?token={token_a}") as ws_a:
+                assert ws_a.receive_json()["joined"][0]["username"] == "alice"
+                assert ws_b.receive_json()["joined"][0]["username"] == "alice"
+
+                ws_a.send_text("hola desde el nodo A")
+                assert receive_message(ws_a)["content"] == "hola desde el nodo A"
+                data = receive_message(ws_b)
+                assert data["content"] == "hola desde el nodo A"
+                assert data["username"] == "alice"
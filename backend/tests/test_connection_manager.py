@@ -0,0 +1,94 @@
+import asyncio
+import json
+import time
+
+from app.routers.chat import ConnectionManager
+
+class FakeSocket:
+    """Socket de prueba; `delay` simula un cliente lento (None = no lee nunca)."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.delay is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        self.received.append(json.loads(frame))
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+async def fan_out(manager, fast, slow, count):
+    for ws in fast + slow:
+        await manager.connect(ws, 1)
+    worst = 0.0
+    for i in range(count):
+        start = time.perf_counter()
+        await manager.broadcast({"content": i}, 1)
+        worst = max(worst, time.perf_counter() - start)
+        # Como en el endpoint real: entre mensajes entrantes el loop atiende a los escritores
+        await asyncio.sleep(0)
+    # Dejar que las tareas escritoras vacíen las colas de los clientes rápidos
+    for _ in range(50):
+        if all(len(ws.received) == count for ws in fast):
+            break
+        await asyncio.sleep(0.01)
+    return worst
+
+def test_slow_clients_do_not_delay_fast_ones():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=10, overflow_policy="drop_oldest")
+        fast = [FakeSocket() for _ in range(5)]
+        slow = [FakeSocket(delay=None) for _ in range(2)]
+        worst = await fan_out(manager, fast, slow, 100)
+
+        assert worst < 0.01
+        for ws in fast:
+            assert [m["content"] for m in ws.received] == list(range(100))
+        for ws in slow:
+            connection = manager.active_connections[1][ws]
+            assert connection.queue.qsize() <= 10
+            assert connection.dropped > 0
+
+    asyncio.run(scenario())
+
+def test_slow_clients_are_evicted_with_close_code():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=10, overflow_policy="disconnect", overflow_close_code=1013)
+        fast = [FakeSocket() for _ in range(3)]
+        slow = [FakeSocket(delay=None) for _ in range(2)]
+        await fan_out(manager, fast, slow, 50)
+
+        for ws in fast:
+            assert len(ws.received) == 50
+        for ws in slow:
+            assert ws.close_code == 1013
+            assert ws not in manager.active_connections[1]
+        assert manager.evicted == 2
+
+    asyncio.run(scenario())
+
+def test_broadcast_encodes_once_per_room(monkeypatch):
+    from app.routers import chat
+    calls = []
+    real_encode = chat.encode_frame
+    monkeypatch.setattr(chat, "encode_frame", lambda message: calls.append(message) or real_encode(message))
+
+    async def scenario():
+        manager = ConnectionManager()
+        sockets = [FakeSocket() for _ in range(20)]
+        for ws in sockets:
+            await manager.connect(ws, 1)
+        await manager.broadcast({"content": "hola"}, 1)
+        await asyncio.sleep(0.01)
+        assert all([m["content"] for m in ws.received] == ["hola"] for ws in sockets)
+        assert len({ws.received[0]["seq"] for ws in sockets}) == 1
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
@@ -0,0 +1,39 @@
+from app.main import app
+from app.models.models import Message
+from app.services import broker
+from app.services.embedded_queue import EmbeddedQueue
+from tests.conftest import TestingSessionLocal
+from tests.test_flow import get_auth_headers
+
+def test_send_persist_and_read_back_without_broker(client, db_session):
+    headers, token = get_auth_headers(client, "embedded")
+    room_id = client.post("/rooms/", json={"name": "Embebida"}, headers=headers).json()["id"]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()  # "embedded joined"
+        for i in range(3):
+            websocket.send_text(f"persistido {i}")
+            websocket.receive_json()
+
+    assert broker.publisher.flush(timeout=5)
+    assert [m.content for m in db_session.query(Message).order_by(Message.id)] == [f"persistido {i}" for i in range(3)]
+
+    # Sin el cache en memoria, el historial y la búsqueda salen de la DB
+    app.state.history_cache.clear()
+    history = client.get(f"/rooms/{room_id}/messages", headers=headers).json()
+    assert [m["content"] for m in history] == ["persistido 2", "persistido 1", "persistido 0"]
+    assert all(m["id"] and m["seq"] for m in history)
+    assert len(client.get("/search?q=persistido", headers=headers).json()) == 3
+
+def test_bad_payload_is_dropped_without_losing_its_batch(db_session):
+    queue = EmbeddedQueue(TestingSessionLocal, batch_size=10, flush_interval=0.05)
+    queue.publish({"room_id": 1, "user_id": 1, "content": "bueno 1", "message_id": "a"})
+    queue.publish({"room_id": 1, "user_id": 1})  # sin content
+    queue.publish({"room_id": 1, "user_id": 1, "content": "bueno 2", "message_id": "b"})
+    queue.publish({"room_id": 1, "user_id": 1, "content": "bueno 1", "message_id": "a"})  # duplicado
+    queue.start()
+    queue.stop()
+
+    assert [m.content for m in db_session.query(Message).order_by(Message.id)] == ["bueno 1", "bueno 2"]
+    assert queue.stats == {"published": 4, "confirmed": 3, "dropped": 0, "failed": 1}
+    assert queue.pending() == 0
@@ -1,4 +1,9 @@
 import pytest
+from datetime import datetime, timedelta
+
+from app.core.pagination import encode_cursor
+from app.models.models import Message, User
+from app.services.room_directory import room_directory
 
 def get_auth_headers(client, username="user_flow"):
     password = "123"
@@ -73,4 +78,117 @@ def test_websocket_chat_flow(client):
                 assert data["username"] == "chat_tester"
                 break
         
-        assert found is True, "El mensaje enviado no fue recibido de vuelta por el WS"
\ No newline at end of file
+        assert found is True, "El mensaje enviado no fue recibido de vuelta por el WS"
+
+def test_websocket_assigns_message_ids(client):
+    headers, token = get_auth_headers(client, "id_tester")
+    room_id = client.post("/rooms/", json={"name": "Ids"}, headers=headers).json()["id"]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}&frames=json") as websocket:
+        websocket.receive_json()  # joined
+        websocket.send_text('{"type": "message", "content": "sin id"}')
+        websocket.send_text('{"type": "message", "content": "con id", "message_id": "c-1"}')
+        websocket.send_text('{"type": "message", "content": "con id", "message_id": "c-1"}')
+        websocket.send_text("texto suelto")
+        plain, first, retry, invalid = (websocket.receive_json() for _ in range(4))
+
+    assert plain["content"] == "sin id" and plain["message_id"]
+    assert invalid == {"type": "error", "code": "invalid_frame"}
+    assert first["content"] == "con id" and first["client_message_id"] == "c-1"
+    # Mismo id del cliente -> mismo message_id: el reenvío se descarta al persistir
+    assert first["message_id"] == retry["message_id"] != plain["message_id"]
+
+def seed_messages(client, db_session, count, room_name="History Room"):
+    headers, _ = get_auth_headers(client, "historian")
+    room_id = client.post("/rooms/", json={"name": room_name}, headers=headers).json()["id"]
+    user = db_session.query(User).filter_by(username="historian").first()
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    # Dos mensajes por segundo para forzar empates en created_at
+    for i in range(count):
+        db_session.add(Message(room_id=room_id, user_id=user.id, content=f"m{i}", created_at=base + timedelta(seconds=i // 2)))
+    db_session.commit()
+    return room_id
+
+def test_history_keyset_pagination(client, db_session):
+    room_id = seed_messages(client, db_session, 7)
+
+    pages, cursor = [], None
+    while True:
+        url = f"/rooms/{room_id}/messages?limit=3" + (f"&before={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([m["content"] for m in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == [["m6", "m5", "m4"], ["m3", "m2", "m1"], ["m0"]]
+
+def test_history_after_cursor_returns_newer_messages(client, db_session):
+    room_id = seed_messages(client, db_session, 6)
+    first = client.get(f"/rooms/{room_id}/messages?limit=2&offset=4")
+    assert [m["content"] for m in first.json()] == ["m1", "m0"]
+
+    cursor = first.headers["X-Next-Cursor"]
+    older = client.get(f"/rooms/{room_id}/messages?limit=2&before={cursor}")
+    assert older.json() == []
+
+    # El cursor del más nuevo de la página sirve para pedir lo posterior
+    newest = first.json()[0]
+    after = encode_cursor(datetime.fromisoformat(newest["created_at"]), newest["id"])
+    newer = client.get(f"/rooms/{room_id}/messages?limit=10&after={after}")
+    assert [m["content"] for m in newer.json()] == ["m5", "m4", "m3", "m2"]
+
+def test_history_rejects_invalid_cursor(client):
+    assert client.get("/rooms/1/messages?before=not-a-cursor").status_code == 400
+
+def test_room_listing_is_paginated_and_filterable(client):
+    headers, _ = get_auth_headers(client, "lister")
+    for name in ["beta", "alpha 2", "alpha 1", "gamma", "alpha_3"]:
+        client.post("/rooms/", json={"name": name}, headers=headers)
+
+    names, cursor = [], None
+    while True:
+        response = client.get("/rooms/?limit=2" + (f"&after={cursor}" if cursor else ""))
+        names += [r["name"] for r in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert names == ["alpha 1", "alpha 2", "alpha_3", "beta", "gamma"]
+
+    # El '_' del prefijo es literal, no el comodín de LIKE
+    assert [r["name"] for r in client.get("/rooms/?prefix=alpha").json()] == ["alpha 1", "alpha 2", "alpha_3"]
+    assert [r["name"] for r in client.get("/rooms/?prefix=alpha_").json()] == ["alpha_3"]
+
+    assert client.get("/rooms/by-name/beta").json()["name"] == "beta"
+    assert client.get("/rooms/by-name/delta").status_code == 404
+
+def test_room_listing_first_page_is_cached_with_etag(client):
+    headers, _ = get_auth_headers(client, "poller")
+    client.post("/rooms/", json={"name": "Lobby"}, headers=headers)
+
+    first = client.get("/rooms/")
+    etag = first.headers["ETag"]
+    hits = room_directory.hits
+    again = client.get("/rooms/", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert room_directory.hits == hits + 1
+
+    # Crear una sala invalida la página: el ETag viejo ya no coincide
+    client.post("/rooms/", json={"name": "Nueva"}, headers=headers)
+    updated = client.get("/rooms/", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert [r["name"] for r in updated.json()] == ["Lobby", "Nueva"]
+    assert updated.headers["ETag"] != etag
+
+def test_room_listing_skips_pages_built_before_an_invalidation():
+    # Una consulta que empezó antes de crear la sala no deja su página en el cache
+    room_directory.invalidate()
+    generation = room_directory.generation
+    room_directory.invalidate()
+    page = room_directory.set(50, b"[]", None, generation)
+    assert page.body == b"[]" and room_directory.get(50) is None
+
+    room_directory.set(50, b"[]", None, room_directory.generation)
+    assert room_directory.get(50).body == b"[]"
+    room_directory.invalidate()
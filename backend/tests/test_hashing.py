@@ -0,0 +1,30 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from app.services.hashing import PasswordHasher
+
+def test_process_pool_hash_and_verify():
+    hasher = PasswordHasher(workers=1, max_pending=4, rounds=4)
+    hasher.start()
+    try:
+        async def scenario():
+            hashed = await hasher.hash("secreto")
+            assert hashed.startswith("$2b$04$")
+            assert await hasher.verify("secreto", hashed) is True
+            assert await hasher.verify("otro", hashed) is False
+        asyncio.run(scenario())
+    finally:
+        hasher.stop()
+
+def test_saturated_hasher_rejects_with_503():
+    hasher = PasswordHasher(workers=0, max_pending=2, rounds=4)
+
+    async def scenario():
+        return await asyncio.gather(*(hasher.hash(f"pw{i}") for i in range(5)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(rejected) == 3
+    assert all(r.status_code == 503 and r.headers["Retry-After"] == "1" for r in rejected)
+    assert hasher.rejected == 3
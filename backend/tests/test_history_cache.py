@@ -0,0 +1,63 @@
+from app.services.history_cache import HistoryCache
+from tests.test_flow import get_auth_headers
+
+def entry(i, room_user=1):
+    return {"id": None, "content": f"m{i}", "user_id": room_user, "username": "u", "created_at": f"2025-01-01T12:00:{i:02d}+00:00"}
+
+def test_cold_room_misses_until_seeded():
+    cache = HistoryCache(per_room=10)
+    assert cache.get(1, 5) is None
+    cache.begin_warm(1)
+    cache.seed(1, [entry(i) for i in reversed(range(3))], complete=True)
+
+    # La sala completa sirve cualquier limit aunque tenga menos mensajes
+    assert [e["content"] for e in cache.get(1, 50)] == ["m2", "m1", "m0"]
+    cache.append(1, entry(3))
+    assert [e["content"] for e in cache.get(1, 2)] == ["m3", "m2"]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+def test_broadcasts_during_warm_up_are_merged():
+    cache = HistoryCache(per_room=10)
+    cache.begin_warm(1)
+    # Llega un broadcast mientras la consulta a la DB está en curso
+    cache.append(1, entry(5))
+    cache.seed(1, [entry(4), entry(3)], complete=False)
+    assert [e["content"] for e in cache.get(1, 3)] == ["m5", "m4", "m3"]
+
+def test_incomplete_room_falls_through_for_deeper_pages():
+    cache = HistoryCache(per_room=3)
+    cache.begin_warm(1)
+    cache.seed(1, [entry(2), entry(1), entry(0)], complete=True)
+    cache.append(1, entry(3))  # desborda el ring buffer: ya no es completo
+    assert cache.get(1, 3) is not None
+    assert cache.get(1, 4) is None
+
+def test_whole_rooms_are_evicted_lru_under_budget():
+    cache = HistoryCache(per_room=100, max_bytes=3500)
+    for room_id in (1, 2, 3):
+        cache.begin_warm(room_id)
+        cache.seed(room_id, [entry(i) for i in range(3)], complete=True)
+    cache.get(1, 1)  # la sala 1 pasa a ser la más reciente
+    for i in range(3, 10):
+        cache.append(3, entry(i))
+
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None
+    assert cache.stats()["evictions"] >= 1
+    assert cache.stats()["bytes"] <= 3500
+
+def test_history_served_from_broadcast_buffer(client):
+    headers, token = get_auth_headers(client, "buffered")
+    room_id = client.post("/rooms/", json={"name": "Hot Room"}, headers=headers).json()["id"]
+    assert client.get(f"/rooms/{room_id}/messages?limit=50").json() == []
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_text("recién difundido")
+        websocket.receive_json()
+
+    # Sin worker el mensaje no está en la DB, pero la sala está caliente
+    history = client.get(f"/rooms/{room_id}/messages?limit=50").json()
+    assert [m["content"] for m in history] == ["recién difundido"]
+    assert client.app.state.history_cache.stats()["hits"] == 1
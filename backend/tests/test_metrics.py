@@ -0,0 +1,61 @@
+import urllib.request
+
+from app.services import metrics
+from app.services.metrics import Registry
+from tests.test_flow import get_auth_headers
+
+def sample(text, line_prefix):
+    """Valor de la primera línea de exposición que empieza con `line_prefix`."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("demo_seconds", "demo", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, ("read",))
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert sample(text, 'demo_seconds_bucket{op="read",le="0.1"}') == 1
+    assert sample(text, 'demo_seconds_bucket{op="read",le="1.0"}') == 3
+    assert sample(text, 'demo_seconds_bucket{op="read",le="+Inf"}') == 4
+    assert sample(text, 'demo_seconds_count{op="read"}') == 4
+    assert sample(text, 'demo_seconds_sum{op="read"}') == 4.05
+
+def test_metrics_endpoint_exposes_sockets_routes_and_db_timings(client):
+    headers, token = get_auth_headers(client, "metrics_user")
+    room_id = client.post("/rooms/", json={"name": "Metrics", "is_private": False}, headers=headers).json()["id"]
+    client.get(f"/rooms/{room_id}/messages", headers=headers)
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as ws:
+        ws.receive_json()
+        text = client.get("/metrics").text
+
+    assert sample(text, f'chat_ws_connections{{room_id="{room_id}"}}') == 1
+    # La ruta se etiqueta con la plantilla, no con el id concreto
+    assert sample(text, 'chat_http_request_duration_seconds_count{method="GET",route="/rooms/{room_id}/messages",status="200"}') >= 1
+    assert sample(text, 'chat_db_query_seconds_count{query="history"}') >= 1
+    assert sample(text, 'chat_broadcast_recipients_count') >= 1
+
+def test_publish_failures_are_counted(monkeypatch):
+    from app.services import broker
+
+    before = metrics.broker_publish_failures.value()
+    monkeypatch.setattr(broker.publisher, "publish", lambda message: False)
+    assert broker.publish_message({"content": "x"}) is False
+    assert metrics.broker_publish_failures.value() == before + 1
+
+def test_worker_metrics_http_server():
+    metrics.worker_consumed.inc(3)
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            text = response.read().decode()
+            assert response.headers["Content-Type"].startswith("text/plain")
+    finally:
+        server.shutdown()
+    assert sample(text, "chat_worker_messages_consumed_total") >= 3
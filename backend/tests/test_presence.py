@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from app.routers.chat import ConnectionManager
+from app.services.backplane import InMemoryBackplane, InMemoryHub
+from app.services.presence import PresenceIndex
+from tests.test_connection_manager import FakeSocket
+from tests.test_flow import get_auth_headers
+
+def test_tabs_are_counted_per_user():
+    presence = PresenceIndex()
+    presence.join(1, 7, "ana")
+    presence.join(1, 7, "ana")
+    assert presence.diff(1) == ([{"user_id": 7, "username": "ana"}], [])
+
+    # Cerrar una de las dos pestañas no la saca de la sala
+    presence.leave(1, 7)
+    assert presence.diff(1) == ([], [])
+    presence.leave(1, 7)
+    assert presence.diff(1) == ([], [{"user_id": 7, "username": "ana"}])
+    assert presence.online(1) == []
+
+def test_quick_reconnects_are_coalesced_into_one_event():
+    async def scenario():
+        manager = ConnectionManager(presence_debounce=0.05)
+        watcher = FakeSocket()
+        await manager.connect(watcher, 1, user_id=1, username="watcher")
+        await asyncio.sleep(0.1)
+        assert [m["type"] for m in watcher.received] == ["presence"]
+
+        # Diez usuarios que se caen y vuelven dentro de la ventana, más uno que entra
+        sockets = [FakeSocket() for _ in range(10)]
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, 1, user_id=100 + i, username=f"u{i}")
+        await asyncio.sleep(0.1)
+        watcher.received.clear()
+        for i, ws in enumerate(sockets):
+            manager.disconnect(ws, 1)
+            sockets[i] = FakeSocket()
+            await manager.connect(sockets[i], 1, user_id=100 + i, username=f"u{i}")
+        await manager.connect(FakeSocket(), 1, user_id=200, username="nuevo")
+        await asyncio.sleep(0.1)
+
+        assert len(watcher.received) == 1
+        event = watcher.received[0]
+        assert [m["username"] for m in event["joined"]] == ["nuevo"]
+        assert event["left"] == [] and event["online"] == 12
+        await manager.stop()
+
+    asyncio.run(scenario())
+
+def test_presence_is_merged_across_nodes():
+    async def scenario():
+        hub = InMemoryHub()
+        node_a = ConnectionManager(InMemoryBackplane(hub), presence_debounce=0.02)
+        node_b = ConnectionManager(InMemoryBackplane(hub), presence_debounce=0.02)
+        await node_a.start()
+        await node_b.start()
+        watcher, tab_a, tab_b = FakeSocket(), FakeSocket(), FakeSocket()
+        await node_b.connect(watcher, 1, user_id=1, username="watcher")
+        await node_a.connect(tab_a, 1, user_id=2, username="ana")
+        await node_b.connect(tab_b, 1, user_id=2, username="ana")
+        await asyncio.sleep(0.1)
+        assert node_a.presence.online(1) == node_b.presence.online(1)
+        assert len(node_a.presence.online(1)) == 2
+
+        # Ana cierra la pestaña del nodo A pero sigue en el B: nadie ve "left"
+        watcher.received.clear()
+        node_a.disconnect(tab_a, 1)
+        await asyncio.sleep(0.1)
+        assert watcher.received == []
+        assert [m["username"] for m in node_a.presence.online(1)] == ["ana", "watcher"]
+
+        node_b.disconnect(tab_b, 1)
+        await asyncio.sleep(0.1)
+        assert [[m["username"] for m in e["left"]] for e in watcher.received] == [["ana"]]
+        assert [m["username"] for m in node_a.presence.online(1)] == ["watcher"]
+
+        # Un nodo que se apaga deja de contar en los demás
+        await node_b.stop()
+        await asyncio.sleep(0.05)
+        assert node_a.presence.online(1) == []
+        await node_a.stop()
+
+    asyncio.run(scenario())
+
+def test_online_endpoint_lists_connected_members(client):
+    headers, token = get_auth_headers(client, "present")
+    room_id = client.post("/rooms/", json={"name": "Presencia"}, headers=headers).json()["id"]
+    assert client.get(f"/rooms/{room_id}/online", headers=headers).json()["count"] == 0
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        event = websocket.receive_json()
+        online = client.get(f"/rooms/{room_id}/online", headers=headers).json()
+
+    assert event["type"] == "presence" and event["online"] == 1
+    assert online == {"room_id": room_id, "count": 1, "members": event["joined"]}
+
+    outsider, _ = get_auth_headers(client, "outsider")
+    assert client.get(f"/rooms/{room_id}/online", headers=outsider).status_code == 403
+
+def test_non_text_frame_closes_socket_and_clears_presence(client):
+    headers, token = get_auth_headers(client, "binary")
+    room_id = client.post("/rooms/", json={"name": "Binario"}, headers=headers).json()["id"]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()  # presencia
+        websocket.send_bytes(b"\x00\x01")
+        message = websocket.receive()
+    assert message["type"] == "websocket.close" and message["code"] == 1003
+
+    # El socket salió del manager: nadie queda "en línea" de fantasma
+    for _ in range(50):
+        if client.get(f"/rooms/{room_id}/online", headers=headers).json()["count"] == 0:
+            break
+        time.sleep(0.01)
+    assert client.get(f"/rooms/{room_id}/online", headers=headers).json()["count"] == 0
+    assert room_id not in client.app.state.manager.active_connections
@@ -0,0 +1,61 @@
+import pytest
+
+from app.services.rate_limit import InboundLimiter, TokenBuckets
+from tests.test_flow import get_auth_headers
+
+def test_token_bucket_refills_and_forgets_idle_keys():
+    buckets = TokenBuckets(rate=2.0, burst=2, max_keys=2)
+    for _ in range(2):
+        assert buckets.wait_time(1, 0.0) == 0
+        buckets.take(1, 0.0)
+    assert buckets.wait_time(1, 0.0) == pytest.approx(0.5)
+    assert buckets.wait_time(1, 0.5) == 0
+
+    # Al pasar de max_keys se descartan primero los buckets que ya se llenaron
+    buckets.take(2, 0.0)
+    buckets.take(3, 10.0)
+    assert len(buckets) == 1 and buckets.wait_time(3, 10.0) == 0
+
+def test_room_limit_does_not_consume_user_tokens():
+    limiter = InboundLimiter(100, user_rate=1, user_burst=5, room_rate=1, room_burst=1)
+    assert limiter.check(1, 10, now=0.0) == (0.0, "")
+    wait, scope = limiter.check(1, 10, now=0.0)
+    assert scope == "room" and wait == pytest.approx(1.0)
+    # El usuario todavía tiene sus tokens para otra sala
+    assert limiter.check(1, 11, now=0.0) == (0.0, "")
+
+def test_too_large_counts_utf8_bytes():
+    limiter = InboundLimiter(16, user_rate=1, user_burst=1, room_rate=1, room_burst=1)
+    assert not limiter.too_large("ñ" * 4)  # 8 bytes: ni se codifica
+    assert not limiter.too_large("ñ" * 8)  # 16 bytes justos
+    assert limiter.too_large("ñ" * 9)      # 9 caracteres pero 18 bytes
+    assert limiter.too_large("x" * 17)
+
+def test_oversized_and_excess_messages_get_error_frames(client, monkeypatch):
+    limiter = InboundLimiter(16, user_rate=0.001, user_burst=2, room_rate=100, room_burst=100)
+    monkeypatch.setattr(client.app.state, "inbound_limiter", limiter)
+    headers, token = get_auth_headers(client, "flooder")
+    room_id = client.post("/rooms/", json={"name": "Flood"}, headers=headers).json()["id"]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()  # joined
+        websocket.send_text("x" * 17)
+        assert websocket.receive_json() == {"type": "error", "code": "message_too_large", "max_bytes": 16}
+        for i in range(3):
+            websocket.send_text(f"m{i}")
+        frames = [websocket.receive_json() for _ in range(3)]
+
+    assert [f.get("content") for f in frames[:2]] == ["m0", "m1"]
+    assert frames[2]["code"] == "rate_limited" and frames[2]["retry_after"] > 0
+
+def test_disconnect_policy_closes_the_socket(client, monkeypatch):
+    limiter = InboundLimiter(16, 100, 100, 100, 100, policy="disconnect")
+    monkeypatch.setattr(client.app.state, "inbound_limiter", limiter)
+    headers, token = get_auth_headers(client, "bigsender")
+    room_id = client.post("/rooms/", json={"name": "Strict"}, headers=headers).json()["id"]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_text("x" * 100)
+        message = websocket.receive()
+    assert message["type"] == "websocket.close" and message["code"] == 1009
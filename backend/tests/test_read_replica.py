@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.core.database import Base, get_read_db, get_read_sessionmaker, read_router
+from app.models.models import Room
+from tests.conftest import TestingAsyncSessionLocal
+from tests.test_flow import get_auth_headers
+
+@pytest.fixture
+def replica(client, monkeypatch):
+    """Segunda base SQLite como réplica: solo tiene lo que el test le carga."""
+    path = os.path.join(tempfile.mkdtemp(), "replica.db")
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    monkeypatch.setattr(read_router, "primary", TestingAsyncSessionLocal)
+    monkeypatch.setattr(read_router, "replica", async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(read_router, "window", 60.0)
+    client.app.dependency_overrides.pop(get_read_db)
+    client.app.dependency_overrides.pop(get_read_sessionmaker)
+    session = sessionmaker(bind=sync_engine)()
+    yield session
+    session.close()
+    read_router.clear()
+    sync_engine.dispose()
+
+def names(response):
+    return [r["name"] for r in response.json()]
+
+def test_reads_go_to_replica_except_right_after_own_write(client, replica):
+    replica.add(Room(name="Sala réplica", is_private=False, created_by=1))
+    replica.commit()
+    reader, _ = get_auth_headers(client, "reader")
+    writer, _ = get_auth_headers(client, "writer")
+    read_router.clear()  # los registros también cuentan como escrituras
+    client.post("/rooms/", json={"name": "Sala nueva"}, headers=writer)
+
+    # Anónimos y quienes no escribieron: réplica, todavía sin la sala nueva
+    assert names(client.get("/rooms/?prefix=Sala")) == ["Sala réplica"]
+    assert client.get("/rooms/by-name/Sala nueva", headers=reader).status_code == 404
+    # Quien acaba de escribir lee de la primaria
+    assert names(client.get("/rooms/?prefix=Sala", headers=writer)) == ["Sala nueva"]
+
+    # Pasada la ventana vuelve a la réplica
+    read_router.clear()
+    assert names(client.get("/rooms/?prefix=Sala", headers=writer)) == ["Sala réplica"]
+
+def test_without_replica_everything_reads_from_primary(client, monkeypatch):
+    monkeypatch.setattr(read_router, "replica", None)
+    assert read_router.sessionmaker_for("anyone") is read_router.primary
+    read_router.mark_write("anyone")
+    assert read_router._recent == {}
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.models.models import Message, User
+from app.routers.chat import ConnectionManager
+from tests.test_flow import get_auth_headers
+
+def test_sequence_is_monotonic_per_room_and_follows_remote_nodes():
+    manager = ConnectionManager()
+    first, second = manager.next_seq(1), manager.next_seq(1)
+    assert second > first
+
+    # Un nodo con el reloj adelantado: lo que sigue tiene que quedar después
+    ahead = second + 10**9
+    asyncio.run(manager.deliver(1, {"content": "remoto", "user_id": 1, "username": "x", "created_at": "", "seq": ahead}))
+    assert manager.next_seq(1) == ahead + 1
+    assert manager.next_seq(2) < ahead
+
+def test_since_replays_missed_messages_from_db(client, db_session):
+    headers, token = get_auth_headers(client, "replayer")
+    room_id = client.post("/rooms/", json={"name": "Replay DB"}, headers=headers).json()["id"]
+    user = db_session.query(User).filter_by(username="replayer").first()
+    for seq in range(1, 6):
+        db_session.add(Message(room_id=room_id, user_id=user.id, content=f"m{seq}", message_id=f"id-{seq}", seq=seq))
+    db_session.commit()
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}&since=3") as websocket:
+        replayed = [websocket.receive_json() for _ in range(2)]
+        sync = websocket.receive_json()
+        joined = websocket.receive_json()
+
+    assert [(m["content"], m["seq"]) for m in replayed] == [("m4", 4), ("m5", 5)]
+    assert sync == {"type": "sync", "since": 3, "replayed": 2, "truncated": False}
+    assert joined["type"] == "presence" and "seq" not in joined
+
+def test_since_replays_unpersisted_messages_from_memory(client):
+    headers, token = get_auth_headers(client, "reconnecter")
+    room_id = client.post("/rooms/", json={"name": "Replay Cache"}, headers=headers).json()["id"]
+    client.get(f"/rooms/{room_id}/messages")  # calienta el cache de la sala
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()  # joined
+        websocket.send_text("visto")
+        last_seen = websocket.receive_json()["seq"]
+    # Sin worker: estos dos nunca llegan a la DB, solo están en memoria
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_text("perdido 1")
+        websocket.send_text("perdido 2")
+        websocket.receive_json()
+        websocket.receive_json()
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}&since={last_seen}") as websocket:
+        replayed = [websocket.receive_json() for _ in range(2)]
+        sync = websocket.receive_json()
+
+    assert [m["content"] for m in replayed] == ["perdido 1", "perdido 2"]
+    assert replayed[0]["seq"] > last_seen and replayed[0]["room_id"] == room_id
+    assert sync["replayed"] == 2
@@ -0,0 +1,53 @@
+from sqlalchemy import text
+
+from app.models.models import User
+from tests.conftest import make_room, persist
+from tests.test_flow import get_auth_headers
+
+def test_worker_path_indexes_only_new_rows(client, db_session):
+    headers, _ = get_auth_headers(client, "indexer")
+    room_id = make_room(client, headers, "Index")
+    user = db_session.query(User).filter_by(username="indexer").first()
+    persist(db_session, room_id, user.id, ["uno", "dos"])
+    persist(db_session, room_id, user.id, ["uno", "dos"])  # reentrega: se ignora
+
+    assert db_session.execute(text("SELECT count(*) FROM messages_fts")).scalar() == 2
+
+def test_search_is_ranked_highlighted_and_paginated(client, db_session):
+    headers, _ = get_auth_headers(client, "searcher")
+    room_id = make_room(client, headers, "Search")
+    user = db_session.query(User).filter_by(username="searcher").first()
+    persist(db_session, room_id, user.id, [
+        "deploy hoy", "el deploy del deploy", "nada que ver", "otro deploy", "deploy final",
+    ])
+
+    response = client.get("/search?q=deploy&limit=2", headers=headers)
+    assert response.status_code == 200
+    first = response.json()
+    assert first[0]["content"] == "el deploy del deploy"
+    assert first[0]["highlight"] == "el <mark>deploy</mark> del <mark>deploy</mark>"
+    assert first[0]["username"] == "searcher" and first[0]["room_id"] == room_id
+
+    seen, cursor = [m["id"] for m in first], response.headers["X-Next-Cursor"]
+    while cursor:
+        response = client.get(f"/search?q=deploy&limit=2&cursor={cursor}", headers=headers)
+        seen += [m["id"] for m in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+    assert len(seen) == len(set(seen)) == 4
+
+def test_search_only_covers_rooms_of_the_caller(client, db_session):
+    owner_headers, _ = get_auth_headers(client, "owner")
+    private_room = make_room(client, owner_headers, "Ajena")
+    owner = db_session.query(User).filter_by(username="owner").first()
+    persist(db_session, private_room, owner.id, ["secreto compartido"])
+
+    headers, _ = get_auth_headers(client, "outsider")
+    own_room = make_room(client, headers, "Propia")
+    outsider = db_session.query(User).filter_by(username="outsider").first()
+    persist(db_session, own_room, outsider.id, ["nada secreto"])
+
+    assert [m["content"] for m in client.get("/search?q=secreto", headers=headers).json()] == ["nada secreto"]
+    assert client.get(f"/search?q=secreto&room_id={private_room}", headers=headers).json() == []
+    # La sintaxis de FTS5 del usuario no llega al parser
+    assert client.get('/search?q="secreto OR*', headers=headers).status_code == 200
+    assert client.get("/search?q=secreto").status_code == 401
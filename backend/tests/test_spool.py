@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services.spool import Spool, SpoolFull
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def crash_after_writing(directory, count, torn_tail=b""):
+    """Escribe `count` registros en otro proceso y lo mata sin cerrar el spool."""
+    script = (
+        "import os, sys, glob\n"
+        "from app.services.spool import Spool\n"
+        f"spool = Spool({directory!r}, segment_bytes=256, fsync='always')\n"
+        f"for i in range({count}): spool.append(b'msg %d' % i)\n"
+        f"if {torn_tail!r}:\n"
+        f"    with open(sorted(glob.glob(os.path.join({directory!r}, '*.seg')))[-1], 'ab') as f: f.write({torn_tail!r})\n"
+        "os._exit(0)\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, check=True)
+
+def read_all(spool):
+    return [body for _, body in spool.read(10_000)]
+
+def test_read_commit_and_reopen_resume_after_checkpoint(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    for i in range(10):
+        spool.append(b"m%d" % i)
+    records = spool.read(4)
+    assert [b for _, b in records] == [b"m0", b"m1", b"m2", b"m3"]
+    spool.commit(records[2][0])
+    spool.close()
+
+    reopened = Spool(str(tmp_path), segment_bytes=64)
+    assert read_all(reopened) == [b"m%d" % i for i in range(3, 10)]
+    reopened.close()
+
+def test_commit_deletes_consumed_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    for i in range(20):
+        spool.append(b"x" * 20)
+    before = len([n for n in os.listdir(tmp_path) if n.endswith(".seg")])
+    records = spool.read(100)
+    spool.commit(records[-1][0])
+    after = len([n for n in os.listdir(tmp_path) if n.endswith(".seg")])
+    assert before > 1 and after == 1
+    assert not spool.unread()
+    spool.close()
+
+def test_size_limit_rejects_new_records(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=100)
+    spool.append(b"a" * 40)
+    spool.append(b"b" * 40)
+    with pytest.raises(SpoolFull):
+        spool.append(b"c" * 40)
+    assert spool.stats["rejected"] == 1
+    spool.close()
+
+def test_single_process_per_directory(tmp_path):
+    spool = Spool(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        Spool(str(tmp_path))
+    spool.close()
+
+def test_crash_recovery_keeps_every_written_record(tmp_path):
+    crash_after_writing(str(tmp_path), 50)
+
+    spool = Spool(str(tmp_path), segment_bytes=256)
+    assert read_all(spool) == [b"msg %d" % i for i in range(50)]
+    spool.close()
+
+def test_crash_recovery_truncates_torn_tail(tmp_path):
+    # Encabezado que promete 100 bytes pero el proceso murió a mitad del cuerpo
+    crash_after_writing(str(tmp_path), 5, torn_tail=b"\x00\x00\x00\x64\x00\x00\x00\x00part")
+
+    spool = Spool(str(tmp_path), segment_bytes=256)
+    assert spool.stats["truncated_bytes"] == 12
+    spool.append(b"after restart")
+    assert read_all(spool) == [b"msg %d" % i for i in range(5)] + [b"after restart"]
+    spool.close()
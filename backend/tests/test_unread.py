@@ -0,0 +1,48 @@
+from app.models.models import RoomCounter, User
+from app.routers.chat import parse_client_frame
+from tests.conftest import make_room, persist
+from tests.test_flow import get_auth_headers
+
+def unread_by_room(client, headers):
+    return {r["room_id"]: r["unread"] for r in client.get("/rooms/unread", headers=headers).json()}
+
+def test_counters_only_count_new_rows(client, db_session):
+    headers, _ = get_auth_headers(client, "counter")
+    room_a, room_b = make_room(client, headers, "Cuenta A"), make_room(client, headers, "Cuenta B")
+    user = db_session.query(User).filter_by(username="counter").first()
+    persist(db_session, room_a, user.id, ["uno", "dos", "tres"])
+    persist(db_session, room_a, user.id, ["uno", "dos", "tres"])  # reentrega: no suma
+    persist(db_session, room_b, user.id, ["uno"])
+
+    counts = {c.room_id: c.message_count for c in db_session.query(RoomCounter)}
+    assert counts == {room_a: 3, room_b: 1}
+
+def test_read_frame_advances_the_marker(client, db_session):
+    headers, token = get_auth_headers(client, "reader")
+    room_id = make_room(client, headers, "No leidos")
+    user = db_session.query(User).filter_by(username="reader").first()
+    persist(db_session, room_id, user.id, ["a", "b"])
+    assert unread_by_room(client, headers) == {room_id: 2}
+
+    # Quien se une después no hereda lo anterior como no leído
+    late_headers, _ = get_auth_headers(client, "late_reader")
+    client.post(f"/rooms/{room_id}/join", json={}, headers=late_headers)
+    assert unread_by_room(client, late_headers) == {room_id: 0}
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}&frames=json") as websocket:
+        websocket.receive_json()  # presencia
+        websocket.send_text('{"type": "read"}')
+        assert websocket.receive_json() == {"type": "read", "room_id": room_id, "last_read": 2}
+
+    assert unread_by_room(client, headers) == {room_id: 0}
+    assert parse_client_frame('{"type": "read"}', json_frames=True) == ("read", None, None)
+
+def test_plain_text_is_never_a_frame(client):
+    # Sin ?frames=json lo que escribe el usuario es contenido, aunque parezca un frame
+    assert parse_client_frame('{"type": "read"}', json_frames=False) == ("message", '{"type": "read"}', None)
+    headers, token = get_auth_headers(client, "literal")
+    room_id = make_room(client, headers, "Literal")
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()  # presencia
+        websocket.send_text('{"type": "read"}')
+        assert websocket.receive_json()["content"] == '{"type": "read"}'
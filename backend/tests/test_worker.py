@@ -0,0 +1,107 @@
+import json
+
+import pika
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models.models import Message
+from app.services.dead_letter import DLQ_NAME, RETRY_HEADER, RetryPolicy, describe_error
+from tests.conftest import TestingSessionLocal
+import worker
+
+class FakeChannel:
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+        self.published = []  # (routing_key, headers)
+        self.declared = {}
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, properties.headers))
+
+    def queue_declare(self, queue, durable=False, arguments=None):
+        self.declared[queue] = arguments
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+def make_batch(payloads):
+    return [(tag, json.dumps(p).encode(), None) for tag, p in enumerate(payloads, start=1)]
+
+def test_flush_batch_single_transaction_and_multiple_ack(db_session):
+    ch = FakeChannel()
+    batch = make_batch([
+        {"room_id": 1, "user_id": 1, "content": "uno"},
+        {"type": "system", "content": "alguien entró"},
+        {"room_id": 1, "user_id": 2, "content": "dos"},
+    ])
+    worker.flush_batch(ch, batch, session_factory=TestingSessionLocal)
+
+    assert ch.acks == [(3, True)]
+    assert [m.content for m in db_session.query(Message).order_by(Message.id)] == ["uno", "dos"]
+
+def test_redelivered_messages_are_not_duplicated(db_session):
+    payloads = [
+        {"room_id": 1, "user_id": 1, "content": "uno", "message_id": "11111111-1111-4111-8111-111111111111"},
+        {"room_id": 1, "user_id": 1, "content": "dos", "message_id": "22222222-2222-4222-8222-222222222222"},
+    ]
+    worker.flush_batch(FakeChannel(), make_batch(payloads), session_factory=TestingSessionLocal)
+    # Reentrega (p. ej. crash entre commit y ack) junto con un mensaje nuevo
+    ch = FakeChannel()
+    payloads.append({"room_id": 1, "user_id": 1, "content": "tres", "message_id": "33333333-3333-4333-8333-333333333333"})
+    worker.flush_batch(ch, make_batch(payloads), session_factory=TestingSessionLocal)
+
+    assert ch.acks == [(3, True)]
+    assert [m.content for m in db_session.query(Message).order_by(Message.id)] == ["uno", "dos", "tres"]
+
+def test_flush_batch_falls_back_to_per_message(db_session):
+    ch = FakeChannel()
+    batch = make_batch([
+        {"room_id": 1, "user_id": 1, "content": "ok 1"},
+        {"room_id": 1, "content": "sin user_id"},
+        {"room_id": 1, "user_id": 1, "content": "ok 2"},
+    ])
+    worker.flush_batch(ch, batch, session_factory=TestingSessionLocal)
+
+    # El mensaje malo sale a la cola de espera y no frena a los demás
+    assert ch.acks == [(1, False), (2, False), (3, False)]
+    assert ch.nacks == []
+    assert [(key, headers[RETRY_HEADER]) for key, headers in ch.published] == [("chat_messages.retry.1000", 1)]
+    assert db_session.query(Message).count() == 2
+
+def test_retry_backoff_then_dead_letter():
+    policy = RetryPolicy(max_retries=3, base_delay_ms=100, max_delay_ms=250)
+    ch = FakeChannel()
+    error, transient = describe_error(IntegrityError("INSERT", {}, Exception("fk violation")))
+    properties = None
+    for tag in range(1, 5):
+        policy.reject(ch, tag, b"{}", properties, error, transient)
+        properties = pika.BasicProperties(headers=ch.published[-1][1])
+
+    assert [key for key, _ in ch.published] == [
+        "chat_messages.retry.100", "chat_messages.retry.200", "chat_messages.retry.250", DLQ_NAME,
+    ]
+    assert "fk violation" in ch.published[-1][1]["x-last-error"]
+    assert [tag for tag, _ in ch.acks] == [1, 2, 3, 4]
+
+def test_transient_errors_do_not_consume_attempts():
+    policy = RetryPolicy(max_retries=1)
+    ch = FakeChannel()
+    error, transient = describe_error(OperationalError("SELECT 1", {}, Exception("connection refused")))
+    assert transient
+    for tag in range(1, 4):
+        policy.reject(ch, tag, b"{}", pika.BasicProperties(headers={RETRY_HEADER: 1}), error, transient)
+    assert all(key != DLQ_NAME for key, _ in ch.published)
+
+def test_declare_retry_queues_dead_letter_back_to_main_queue():
+    ch = FakeChannel()
+    RetryPolicy(max_retries=4, base_delay_ms=1000, max_delay_ms=4000).declare(ch)
+    assert set(ch.declared) == {DLQ_NAME, "chat_messages.retry.1000", "chat_messages.retry.2000", "chat_messages.retry.4000"}
+    assert ch.declared["chat_messages.retry.2000"] == {
+        "x-message-ttl": 2000, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": "chat_messages",
+    }
@@ -0,0 +1,101 @@
+import json
+import os
+import signal
+import time
+
+from app.models.models import Message
+from app.services.worker_pool import ShardedDispatcher, shard_for
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+class FakeChannel:
+    """Como el broker, falla si un tag se asienta dos veces (ack o nack de uno
+    ya asentado, o ack múltiple que lo cubrió)."""
+    is_open = True
+
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+        self.published = []
+        self._settled = set()
+        self._acked_upto = 0
+
+    def _settle(self, delivery_tag):
+        assert delivery_tag > self._acked_upto and delivery_tag not in self._settled, f"unknown delivery tag {delivery_tag}"
+        self._settled.add(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self._settle(delivery_tag)
+        if multiple:
+            self._acked_upto = delivery_tag
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self._settle(delivery_tag)
+        self.nacks.append(delivery_tag)
+
+def wait_until(condition, dispatcher, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        dispatcher.collect(timeout=0.05)
+        dispatcher.check_children()
+    assert condition()
+
+def make_dispatcher(ch, shards=3):
+    dispatcher = ShardedDispatcher(ch, shards, batch_size=5, flush_interval=0.05, database_url=SQLALCHEMY_DATABASE_URL)
+    dispatcher.start()
+    return dispatcher
+
+def test_shard_for_is_stable_per_room():
+    assert shard_for(7, 3) == shard_for(7, 3) == 1
+    assert shard_for(None, 3) == 0
+
+def test_rooms_in_parallel_keep_per_room_order(db_session):
+    ch = FakeChannel()
+    dispatcher = make_dispatcher(ch)
+    try:
+        tag = 0
+        for seq in range(15):
+            for room_id in (1, 2, 3, 4):
+                tag += 1
+                body = json.dumps({"room_id": room_id, "user_id": 1, "content": f"{room_id}:{seq}"}).encode()
+                dispatcher.dispatch(tag, body)
+        dispatcher.dispatch(tag + 1, b'{"room_id": 1, "content": "sin user_id"}')
+
+        wait_until(lambda: dispatcher.stats["acked"] == tag and dispatcher.stats["retried"] == 1, dispatcher)
+    finally:
+        dispatcher.close()
+
+    # El payload malo va a reintento con su propio ack; el resto son acks
+    # múltiples que nunca lo apuntan (FakeChannel falla si un tag se repite)
+    assert (tag + 1, False) in ch.acks
+    assert (tag + 1, True) not in ch.acks
+    assert [key for key, _ in ch.published] == ["chat_messages.retry.1000"]
+    assert ch.nacks == []
+    for room_id in (1, 2, 3, 4):
+        contents = [m.content for m in db_session.query(Message).filter_by(room_id=room_id).order_by(Message.id)]
+        assert contents == [f"{room_id}:{seq}" for seq in range(15)]
+
+def test_dead_child_is_replaced_and_its_messages_requeued(db_session):
+    ch = FakeChannel()
+    dispatcher = make_dispatcher(ch, shards=2)
+    try:
+        wait_until(lambda: all(p.pid for p in dispatcher._processes), dispatcher)
+        victim = dispatcher._processes[0]
+        os.kill(victim.pid, signal.SIGKILL)
+        victim.join(5)
+        # Asignado al hijo muerto antes de que el padre lo note
+        dispatcher.dispatch(1, json.dumps({"room_id": 2, "user_id": 1, "content": "perdido"}).encode())
+        dispatcher.check_children()
+        assert dispatcher.stats["restarts"] == 1
+        assert ch.nacks == [1]
+
+        dispatcher.dispatch(2, json.dumps({"room_id": 2, "user_id": 1, "content": "ok"}).encode())
+        wait_until(lambda: dispatcher.stats["acked"] == 1, dispatcher)
+    finally:
+        dispatcher.close()
+    # El tag devuelto no vuelve a nombrarse en un ack
+    assert ch.acks == [(2, True)]
+    assert [m.content for m in db_session.query(Message)] == ["ok"]
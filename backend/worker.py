@@ -2,65 +2,194 @@
 import pika
 import json
 import os
+import signal
 import sys
+import threading
+import time
 
 # Ajuste de path para que encuentre el paquete 'app'
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.database import SessionLocal
-from app.models.models import Message
 from app.core.config import settings
+from app.services.archive import ensure_partitions
+from app.services.broker import QUEUE_NAME
+from app.services.persistence import build_message_rows, insert_messages
+from app.services import metrics
+from app.services.dead_letter import describe_error, retry_policy
+from app.services.worker_pool import ShardedDispatcher
 
 def save_to_db(ch, method, properties, body):
-    data = json.loads(body)
+    metrics.worker_consumed.inc()
     db = SessionLocal()
     try:
-        # Aquí ignoramos 'username' porque la DB solo necesita user_id
-        # Ignoramos 'type': 'system' si decidimos no guardar notificaciones de sistema
-        if data.get('type') == 'system':
-             ch.basic_ack(delivery_tag=method.delivery_tag)
-             return
-
-        new_msg = Message(
-            room_id=data['room_id'],
-            user_id=data['user_id'],
-            content=data['content']
-        )
-        db.add(new_msg)
-        db.commit()
+        data = json.loads(body)
+        # Las notificaciones 'system' no se guardan: build_message_rows las filtra
+        rows = build_message_rows([data])
+        if not rows:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        with metrics.worker_commit_seconds.time():
+            insert_messages(db, rows)
+            db.commit()
+        metrics.worker_persisted.inc(len(rows))
         print(f" [x] Persisted message from User {data['user_id']} in Room {data['room_id']}")
-        
+
         # Confirmar procesamiento a RabbitMQ
         ch.basic_ack(delivery_tag=method.delivery_tag)
-        
+
     except Exception as e:
         print(f" [!] Error saving to DB: {e}")
+        metrics.worker_failures.inc(labels=("message",))
         db.rollback()
-        # No hacemos ack para que RabbitMQ lo reintente o lo mande a Dead Letter Queue
+        # A la cola de espera (o a la DLQ si agotó los intentos): la cola principal sigue
+        retry_policy.reject(ch, method.delivery_tag, body, properties, *describe_error(e))
     finally:
         db.close()
 
+# --- Modo por lotes ---
+
+def flush_batch(ch, batch, session_factory=SessionLocal):
+    """Persiste un lote [(delivery_tag, body, properties), ...] en una sola transacción.
+
+    Si todo sale bien se confirma con un único ack (multiple=True) sobre el
+    último delivery_tag. Si el lote falla, se reintenta mensaje a mensaje para
+    que un payload malo no tumbe a los demás.
+    """
+    if not batch:
+        return
+    metrics.worker_batch_size.observe(len(batch))
+    db = session_factory()
+    try:
+        rows = build_message_rows([json.loads(body) for _, body, _ in batch])
+        with metrics.worker_commit_seconds.time():
+            insert_messages(db, rows)
+            db.commit()
+        ch.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+        metrics.worker_persisted.inc(len(rows))
+        print(f" [x] Persisted batch of {len(rows)} messages ({len(batch)} deliveries)")
+    except Exception as e:
+        print(f" [!] Error saving batch to DB, falling back to per-message inserts: {e}")
+        metrics.worker_failures.inc(labels=("batch",))
+        db.rollback()
+        _flush_one_by_one(ch, batch, db)
+    finally:
+        db.close()
+
+def _flush_one_by_one(ch, batch, db):
+    # Ack individual: un ack con multiple=True confirmaría también los fallidos
+    for delivery_tag, body, properties in batch:
+        try:
+            rows = build_message_rows([json.loads(body)])
+            insert_messages(db, rows)
+            db.commit()
+            ch.basic_ack(delivery_tag=delivery_tag)
+            metrics.worker_persisted.inc(len(rows))
+        except Exception as e:
+            print(f" [!] Error saving to DB: {e}")
+            metrics.worker_failures.inc(labels=("message",))
+            db.rollback()
+            retry_policy.reject(ch, delivery_tag, body, properties, *describe_error(e))
+
+def consume_batches(channel, batch_size: int, flush_interval: float):
+    """Junta hasta `batch_size` mensajes o `flush_interval` segundos y los persiste juntos."""
+    batch = []
+    deadline = None
+    for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=flush_interval):
+        if method is not None:
+            metrics.worker_consumed.inc()
+            batch.append((method.delivery_tag, body, properties))
+            metrics.worker_unacked.set(len(batch))
+            if deadline is None:
+                deadline = time.monotonic() + flush_interval
+        if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+            flush_batch(channel, batch)
+            batch = []
+            deadline = None
+            metrics.worker_unacked.set(0)
+
+# --- Modo multiproceso (particionado por sala) ---
+
+def consume_sharded(channel, processes: int, batch_size: int, flush_interval: float, stopping: threading.Event):
+    """Reparte entre `processes` hijos por room_id: orden por sala, salas en paralelo."""
+    dispatcher = ShardedDispatcher(channel, processes, batch_size, flush_interval)
+    dispatcher.start()
+    try:
+        for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=0.05):
+            if method is not None:
+                dispatcher.dispatch(method.delivery_tag, body, properties)
+            dispatcher.collect()
+            dispatcher.check_children()
+            if stopping.is_set():
+                break
+    finally:
+        # Lo prefetcheado y no despachado vuelve a la cola; los hijos terminan
+        # su lote y lo que quede sin persistir se devuelve con nack
+        if channel.is_open:
+            channel.cancel()
+        dispatcher.close()
+        print(f" [*] Sharded worker stopped: {dispatcher.stats}")
+
+def maintain_partitions(stopping: threading.Event, interval: float = 3600.0):
+    """Crea por adelantado las particiones mensuales de messages; cada hora
+    alcanza para no llegar nunca a escribir en la partición DEFAULT."""
+    while True:
+        db = SessionLocal()
+        try:
+            for name in ensure_partitions(db):
+                print(f" [*] Created partition {name}")
+        except Exception as e:
+            print(f" [!] Error creating partitions: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        if stopping.wait(interval):
+            return
+
 def main():
     print(" [*] Starting Worker...")
-    while True:
+    batch_size = settings.WORKER_BATCH_SIZE
+    processes = settings.WORKER_PROCESSES
+    stopping = threading.Event()
+    if processes > 1:
+        # SIGTERM (docker stop) y Ctrl+C cortan el consumo y disparan el apagado ordenado
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+    if settings.WORKER_METRICS_PORT:
+        metrics.start_http_server(settings.WORKER_METRICS_PORT)
+        print(f" [*] Metrics on :{settings.WORKER_METRICS_PORT}/metrics")
+    threading.Thread(target=maintain_partitions, args=(stopping,), name="partitions", daemon=True).start()
+    while not stopping.is_set():
         try:
             params = pika.URLParameters(settings.BROKER_URL)
             connection = pika.BlockingConnection(params)
             channel = connection.channel()
-            channel.queue_declare(queue='chat_messages', durable=True)
-            
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(queue='chat_messages', on_message_callback=save_to_db)
-            
-            print(' [*] Worker waiting for messages. To exit press CTRL+C')
-            channel.start_consuming()
+            channel.queue_declare(queue=QUEUE_NAME, durable=True)
+            retry_policy.declare(channel)
+
+            if processes > 1:
+                channel.basic_qos(prefetch_count=settings.WORKER_PREFETCH or 2 * batch_size * processes)
+                print(f' [*] Worker waiting for messages ({processes} processes, batches of {batch_size}). To exit press CTRL+C')
+                consume_sharded(channel, processes, batch_size, settings.WORKER_FLUSH_INTERVAL_MS / 1000, stopping)
+                connection.close()
+                break
+            elif batch_size > 1:
+                channel.basic_qos(prefetch_count=settings.WORKER_PREFETCH or 2 * batch_size)
+                print(f' [*] Worker waiting for messages (batches of {batch_size}). To exit press CTRL+C')
+                consume_batches(channel, batch_size, settings.WORKER_FLUSH_INTERVAL_MS / 1000)
+            else:
+                channel.basic_qos(prefetch_count=1)
+                channel.basic_consume(queue=QUEUE_NAME, on_message_callback=save_to_db)
+                print(' [*] Worker waiting for messages. To exit press CTRL+C')
+                channel.start_consuming()
         except pika.exceptions.AMQPConnectionError:
             print(" [!] Connection failed, retrying in 5s...")
-            import time
-            time.sleep(5)
+            stopping.wait(5)
         except Exception as e:
-            print(f" [!] Critical error: {e}")
-            break
+            # Un error inesperado no apaga el worker: se reconecta y sigue
+            print(f" [!] Critical error: {e}, restarting consumer in 5s...")
+            stopping.wait(5)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -22,17 +22,77 @@ CREATE TABLE room_members (
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     role VARCHAR(20) DEFAULT 'member', -- 'admin' o 'member'
     joined_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- room_counters.message_count al último "read": no leídos = contador - last_read
+    last_read BIGINT NOT NULL DEFAULT 0,
     PRIMARY KEY (room_id, user_id)
 );
 
--- Tabla de Mensajes
+-- Mensajes persistidos por sala; el worker lo incrementa al insertar.
+-- En una base existente:
+--   ALTER TABLE room_members ADD COLUMN last_read BIGINT NOT NULL DEFAULT 0;
+--   INSERT INTO room_counters SELECT room_id, count(*) FROM messages GROUP BY room_id;
+CREATE TABLE room_counters (
+    room_id INTEGER PRIMARY KEY REFERENCES rooms(id) ON DELETE CASCADE,
+    message_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- Tabla de Mensajes, particionada por mes según created_at. Las particiones
+-- las crea por adelantado el worker (app/services/archive.py) y archive.py
+-- pasa a NDJSON-gzip las que superan MESSAGE_RETENTION_MONTHS.
+-- Una tabla existente no se puede convertir: crear esta como messages_new,
+-- INSERT ... SELECT, y renombrar.
 CREATE TABLE messages (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     room_id INTEGER REFERENCES rooms(id) ON DELETE CASCADE,
     user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
     content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Id asignado al recibir el mensaje: hace idempotente la persistencia.
+    -- El UNIQUE incluye created_at (obligatorio en tablas particionadas); los
+    -- reenvíos traen el mismo created_at en el payload, así que igual chocan
+    message_id VARCHAR(36),
+    -- Secuencia por sala asignada al difundir; /ws?since=<seq> repone lo perdido
+    seq BIGINT,
+    -- Índice de búsqueda: lo calcula el worker al insertar (SEARCH_TS_CONFIG)
+    search_vector TSVECTOR,
+    PRIMARY KEY (id, created_at),
+    UNIQUE (message_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Red de seguridad si el worker no llegó a crear la partición del mes
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+DO $$
+DECLARE
+    month DATE := date_trunc('month', now());
+BEGIN
+    FOR i IN 0..2 LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_' || to_char(month, 'YYYY_MM'), month, month + interval '1 month'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+
+-- Índices (se propagan a cada partición)
+CREATE INDEX idx_messages_room_created ON messages(room_id, created_at DESC, id DESC);
+CREATE INDEX idx_messages_room_seq ON messages(room_id, seq);
+CREATE INDEX idx_messages_search ON messages USING GIN (search_vector);
+
+-- Segmentos de historial archivado (uno por sala y mes)
+CREATE TABLE message_archives (
+    id SERIAL PRIMARY KEY,
+    room_id INTEGER NOT NULL,
+    month VARCHAR(7) NOT NULL,
+    path VARCHAR NOT NULL,
+    message_count INTEGER NOT NULL,
+    oldest_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    newest_at TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
+CREATE UNIQUE INDEX uq_message_archives_room_month ON message_archives(room_id, month);
+CREATE INDEX idx_message_archives_room_newest ON message_archives(room_id, newest_at DESC);
 
--- Índices para optimizar el historial paginable
-CREATE INDEX idx_messages_room_created ON messages(room_id, created_at DESC);
\ No newline at end of file
+-- Filtro por prefijo de GET /rooms/?prefix= (LIKE 'x%' no usa el UNIQUE si la collation no es C)
+CREATE INDEX idx_rooms_name_pattern ON rooms(name text_pattern_ops);
\ No newline at end of file
@@ -1,62 +1,147 @@
-import { useEffect, useState, useRef } from 'react';
+import { useEffect, useState, useRef, useCallback } from 'react';
 import apiClient from '../api/client';
 
 const PROTOCOL = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
 const WS_BASE = `${PROTOCOL}//${window.location.hostname}:8000`;
+const MAX_RECONNECT_DELAY = 10000;
+// Espera tras el último mensaje antes de marcar la sala como leída (un frame por ráfaga)
+const READ_DELAY = 2000;
+
 export const useChat = (roomId) => {
   const [messages, setMessages] = useState([]);
   const [isConnected, setIsConnected] = useState(false);
   const socketRef = useRef(null);
+  // Último seq visto y ids ya mostrados: al reconectar se piden solo los perdidos
+  const lastSeqRef = useRef(null);
+  const seenIdsRef = useRef(new Set());
+  // Frames propios sin eco todavía, por id del cliente: se reenvían tal cual al
+  // reconectar y el servidor descarta el duplicado por message_id
+  const outboxRef = useRef(new Map());
+
+  const remember = (data) => {
+    if (data.message_id) seenIdsRef.current.add(data.message_id);
+    if (data.seq && (lastSeqRef.current === null || data.seq > lastSeqRef.current)) {
+      lastSeqRef.current = data.seq;
+    }
+  };
+
+  const fetchHistory = useCallback(async () => {
+    try {
+      const res = await apiClient.get(`/rooms/${roomId}/messages?limit=50`);
+      const history = res.data.reverse();
+      seenIdsRef.current = new Set();
+      history.forEach(remember);
+      setMessages(history);
+    } catch (error) {
+      console.error("Error cargando historial", error);
+    }
+  }, [roomId]);
 
   useEffect(() => {
-    const fetchHistory = async () => {
-      try {
-        const res = await apiClient.get(`/rooms/${roomId}/messages?limit=50`);
-        setMessages(res.data.reverse()); 
-      } catch (error) {
-        console.error("Error cargando historial", error);
-      }
-    };
+    lastSeqRef.current = null;
+    seenIdsRef.current = new Set();
+    outboxRef.current = new Map();
     if (roomId) fetchHistory();
-  }, [roomId]);
+  }, [roomId, fetchHistory]);
 
-  // Conexión WebSocket
+  // Conexión WebSocket con reconexión
   useEffect(() => {
     const token = localStorage.getItem('token');
     if (!token || !roomId) return;
 
-    const wsUrl = `${WS_BASE}/ws/${roomId}?token=${token}`;
-    socketRef.current = new WebSocket(wsUrl);
+    let stopped = false;
+    let retryTimer = null;
+    let attempts = 0;
+    let readTimer = null;
 
-    socketRef.current.onopen = () => {
-      console.log('WS Connected');
-      setIsConnected(true);
+    const scheduleRead = () => {
+      clearTimeout(readTimer);
+      readTimer = setTimeout(() => {
+        const socket = socketRef.current;
+        if (socket && socket.readyState === WebSocket.OPEN && document.visibilityState === 'visible') {
+          socket.send(JSON.stringify({ type: 'read' }));
+        }
+      }, READ_DELAY);
     };
 
-    socketRef.current.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      setMessages((prev) => [...prev, data]);
-    };
+    const connect = () => {
+      const since = lastSeqRef.current !== null ? `&since=${lastSeqRef.current}` : '';
+      // frames=json: todo lo que se manda es un frame; el texto del usuario viaja en 'content'
+      const socket = new WebSocket(`${WS_BASE}/ws/${roomId}?token=${token}&frames=json${since}`);
+      socketRef.current = socket;
+
+      socket.onopen = () => {
+        console.log('WS Connected');
+        attempts = 0;
+        setIsConnected(true);
+        outboxRef.current.forEach((frame) => socket.send(frame));
+        scheduleRead();
+      };
 
-    socketRef.current.onclose = (e) => {
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'sync') {
+          // Faltaban demasiados para reponerlos por el socket
+          if (data.truncated) fetchHistory();
+          return;
+        }
+        if (data.type === 'read') return;  // confirmación de la marca de leído
+        if (data.type === 'error') {
+          // Mensaje propio rechazado por tamaño o tasa: no es parte de la conversación
+          console.warn("Mensaje rechazado", data.code, data);
+          return;
+        }
+        if (data.type === 'presence') {
+          // Cambios agrupados de la sala: se muestran como avisos de sistema
+          const notices = [
+            ...data.joined.map((m) => `${m.username} joined`),
+            ...data.left.map((m) => `${m.username} left`),
+          ].map((content) => ({ type: 'system', content, created_at: data.created_at }));
+          setMessages((prev) => [...prev, ...notices]);
+          return;
+        }
+        if (data.client_message_id) outboxRef.current.delete(data.client_message_id);
+        if (data.message_id && seenIdsRef.current.has(data.message_id)) return;
+        remember(data);
+        setMessages((prev) => [...prev, data]);
+        scheduleRead();
+      };
+
+      socket.onclose = (e) => {
         console.log("WS Disconnected", e.code, e.reason);
         setIsConnected(false);
-        if(e.code === 4003) {
-            alert("Error de permisos: " + e.reason);
-            window.location.href = "/";
+        if (e.code === 4003) {
+          alert("Error de permisos: " + e.reason);
+          window.location.href = "/";
+          return;
         }
+        // 1008: token inválido o no es miembro, reintentar no sirve
+        if (stopped || e.code === 1008) return;
+        const delay = Math.min(1000 * 2 ** attempts, MAX_RECONNECT_DELAY);
+        attempts += 1;
+        retryTimer = setTimeout(connect, delay);
+      };
     };
 
+    connect();
+
     return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      clearTimeout(readTimer);
       if (socketRef.current) socketRef.current.close();
     };
-  }, [roomId]);
+  }, [roomId, fetchHistory]);
 
   const sendMessage = (content) => {
+    // El id se genera una vez por mensaje: el reenvío tras reconectar usa el mismo
+    const id = crypto.randomUUID();
+    const frame = JSON.stringify({ type: 'message', content, message_id: id });
+    outboxRef.current.set(id, frame);
     if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
-      socketRef.current.send(content);
+      socketRef.current.send(frame);
     }
   };
 
   return { messages, sendMessage, isConnected };
-};
\ No newline at end of file
+};
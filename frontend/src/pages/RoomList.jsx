@@ -5,6 +5,9 @@ import { useAuth } from '../context/AuthContext';
 
 export default function RoomList() {
   const [rooms, setRooms] = useState([]);
+  const [unread, setUnread] = useState({});
+  const [nextCursor, setNextCursor] = useState(null);
+  const [search, setSearch] = useState('');
   const [showCreate, setShowCreate] = useState(false);
   const { logout, user } = useAuth();
   const navigate = useNavigate();
@@ -15,12 +18,24 @@ export default function RoomList() {
 
   useEffect(() => {
     fetchRooms();
+  }, [search]);
+
+  // No leídos de todas mis salas en una sola llamada
+  useEffect(() => {
+    apiClient.get('/rooms/unread')
+      .then((res) => setUnread(Object.fromEntries(res.data.map((r) => [r.room_id, r.unread]))))
+      .catch((error) => console.error("Error cargando no leídos", error));
   }, []);
 
-  const fetchRooms = async () => {
+  // Listado paginado: el navegador revalida con ETag y recibe 304 si no cambió
+  const fetchRooms = async (cursor = null) => {
     try {
-      const res = await apiClient.get('/rooms/');
-      setRooms(res.data);
+      const params = {};
+      if (search) params.prefix = search;
+      if (cursor) params.after = cursor;
+      const res = await apiClient.get('/rooms/', { params });
+      setRooms((prev) => (cursor ? [...prev, ...res.data] : res.data));
+      setNextCursor(res.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error("Error fetching rooms", error);
     }
@@ -114,12 +129,20 @@ export default function RoomList() {
 
       {/* Lista de Salas */}
       <h3>Salas Disponibles</h3>
+      <input
+        type="text"
+        placeholder="Buscar por nombre"
+        value={search}
+        onChange={e => setSearch(e.target.value)}
+        style={{ padding: '5px', marginBottom: '10px', width: '100%' }}
+      />
       <ul style={{ listStyle: 'none', padding: 0 }}>
         {rooms.map((room) => (
           <li key={room.id} style={{ display: 'flex', justifyContent: 'space-between', padding: '10px', borderBottom: '1px solid #eee', alignItems: 'center' }}>
             <div>
               <strong>{room.name}</strong>
               {room.is_private && <span style={{ marginLeft: '10px', fontSize: '0.8em' }}>🔒 Privada</span>}
+              {unread[room.id] > 0 && <span style={{ marginLeft: '10px', fontSize: '0.8em', color: '#007bff' }}>{unread[room.id]} sin leer</span>}
             </div>
             <button onClick={() => handleJoinRoom(room)} style={{ padding: '5px 10px', cursor: 'pointer' }}>
               Entrar
@@ -127,6 +150,9 @@ export default function RoomList() {
           </li>
         ))}
       </ul>
+      {nextCursor && (
+        <button onClick={() => fetchRooms(nextCursor)} style={{ padding: '5px 10px' }}>Cargar más</button>
+      )}
     </div>
   );
 }
\ No newline at end of file